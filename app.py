@@ -2,7 +2,7 @@ import tkinter as tk
 from tkinter import ttk, messagebox, font as tkfont
 import pandas as pd
 import numpy as np
-import MetaTrader5 as mt5
+from mt5_offline import MT5_LOCK, load_backend as load_mt5_backend
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 import matplotlib.ticker as mtick
@@ -10,12 +10,24 @@ from datetime import datetime
 import time
 import json
 import os
-import subprocess 
 import threading  
+import queue
 import sys        
-import zipfile
 import ctypes
 from ctypes import wintypes
+from collections import namedtuple
+from types import MappingProxyType
+
+import base_changes
+import pipeline
+import rollover
+import ticks
+import watcher
+
+# Estado de execução (backend MT5 e singletons de mercado) é criado em init_runtime(), chamado no
+# __main__: no Windows cada processo do pool de PDFs do notas.py (spawn) reimporta este arquivo
+# como __mp_main__, e ele não deve carregar o MetaTrader5 nem montar threads e caches ali.
+mt5 = None
 
 CSV_FILE_PATH = 'base.csv'
 APP_TITLE = "Vector Profit Strategy"
@@ -27,6 +39,15 @@ FISCAL_R_FILE = 'fiscal_r.json'
 TARGET_FONT = ('MS Reference Sans Serif', 8)
 TARGET_FONT_BOLD = ('MS Reference Sans Serif', 8,'bold')
 EVENT_DEBOUNCE_MS = 300
+PRICE_CACHE_TTL_S = 1.0
+MARKET_WATCH_FIRST_TICK_TIMEOUT_S = 1.0
+MARKET_WATCH_POLL_INTERVAL_S = 0.02
+MARKET_WATCH_IDLE_TIMEOUT_S = 600
+MARKET_DATA_POLL_S = 0.5
+MARKET_DATA_DRAIN_MS = 100
+MARKET_DATA_QUEUE_SIZE = 8
+MARKET_DATA_RECONNECT_S = 5.0
+NOTES_WATCH_RETRY_MS = 1000
 
 def setup_taskbar_icon():
     """Configura o ícone para aparecer corretamente na barra de tarefas do Windows"""
@@ -63,22 +84,299 @@ def mt5_connect():
     return True
 
 def mt5_disconnect():
-    mt5.shutdown()
+    with MT5_LOCK:
+        MARKET_WATCH.release_all()
+        mt5.shutdown()
     print("Desconectado do MT5.")
 
+class PriceSnapshotCache:
+    """Cache de preços por símbolo, compartilhado pelo processo, com validade (TTL) configurável.
+
+    Cada entrada guarda o instante da leitura e os preços de ask/bid do símbolo. Dentro do TTL,
+    uma mesma passada de recálculo da interface reaproveita o preço já lido em vez de ir ao MT5.
+    """
+    def __init__(self, ttl_seconds=PRICE_CACHE_TTL_S):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}  # symbol -> (timestamp, ask, bid)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_prices(self, symbols, fetcher):
+        """Retorna {symbol_ask, symbol_bid} para os símbolos; só os ausentes ou vencidos vão ao `fetcher`."""
+        unique_symbols = list(filter(None, set(symbols)))
+        now = time.monotonic()
+        prices, missing = {}, []
+        with self._lock:
+            for symbol in unique_symbols:
+                entry = self._entries.get(symbol)
+                if entry is not None and now - entry[0] <= self.ttl_seconds:
+                    prices[f"{symbol}_ask"], prices[f"{symbol}_bid"] = entry[1], entry[2]
+                    self.hits += 1
+                else:
+                    missing.append(symbol)
+                    self.misses += 1
+        if missing:
+            fetched = fetcher(missing)
+            self.store(fetched, symbols=missing)
+            prices.update(fetched)
+        return prices
+
+    def peek(self, symbols):
+        """Como get_prices, mas sem ir ao MT5 e sem olhar o TTL: devolve o último valor conhecido (ou None)."""
+        prices = {}
+        with self._lock:
+            for symbol in filter(None, set(symbols)):
+                entry = self._entries.get(symbol)
+                if entry is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                prices[f"{symbol}_ask"], prices[f"{symbol}_bid"] = (entry[1], entry[2]) if entry is not None else (None, None)
+        return prices
+
+    def store(self, prices, symbols=None, timestamp=None):
+        """Grava no cache um dicionário no formato {symbol_ask, symbol_bid}."""
+        if symbols is None:
+            symbols = {key.rsplit('_', 1)[0] for key in prices}
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            for symbol in symbols:
+                self._entries[symbol] = (timestamp, prices.get(f"{symbol}_ask"), prices.get(f"{symbol}_bid"))
+
+    def invalidate(self, symbols=None):
+        """Descarta as entradas dos símbolos informados (ou todo o cache, se nenhum for informado)."""
+        with self._lock:
+            if symbols is None:
+                self._entries.clear()
+            else:
+                for symbol in symbols:
+                    self._entries.pop(symbol, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': (self.hits / total) if total else 0.0, 'symbols': len(self._entries)}
+
+PRICE_CACHE = None
+
+def _tick_has_price(tick):
+    return bool(tick) and (tick.bid > 0 or tick.ask > 0 or tick.last > 0)
+
+class MarketWatchRegistry:
+    """Registro persistente das assinaturas do Market Watch.
+
+    Cada símbolo é selecionado uma única vez. Só os símbolos recém-selecionados aguardam, e apenas
+    até o primeiro tick válido (com limite de tempo). Símbolos que o próprio registro selecionou e que
+    ficaram sem uso além de `idle_timeout_s` são retirados do Market Watch.
+
+    "Uso" é a demanda da interface (`touch`, ou `ensure` com touch=True); as leituras periódicas da
+    thread de mercado chamam `ensure(touch=False)` e não mantêm um símbolo vivo sozinhas.
+
+    `ensure` roda sob MT5_LOCK e só seleciona; a espera pelos primeiros ticks (`wait_first_ticks`)
+    fica fora do lock e o pega só em cada consulta, para não travar os outros usuários do MT5.
+    """
+    def __init__(self, first_tick_timeout_s=MARKET_WATCH_FIRST_TICK_TIMEOUT_S, poll_interval_s=MARKET_WATCH_POLL_INTERVAL_S, idle_timeout_s=MARKET_WATCH_IDLE_TIMEOUT_S):
+        self.first_tick_timeout_s = first_tick_timeout_s
+        self.poll_interval_s = poll_interval_s
+        self.idle_timeout_s = idle_timeout_s
+        self._last_used = {}  # symbol -> último uso (time.monotonic)
+        self._owned = set()   # símbolos selecionados por este registro (os únicos que ele desmarca)
+        self._lock = threading.Lock()
+
+    def touch(self, symbols):
+        """Registra que a interface pediu `symbols` agora (só os já assinados; os novos entram no próximo ensure)."""
+        now = time.monotonic()
+        with self._lock:
+            for symbol in symbols:
+                if symbol in self._last_used:
+                    self._last_used[symbol] = now
+
+    def ensure(self, symbols, touch=True):
+        """Seleciona os símbolos ainda não assinados e devolve os recém-selecionados (chamar sob MT5_LOCK)."""
+        now = time.monotonic()
+        newly_selected = []
+        with self._lock:
+            for symbol in symbols:
+                if symbol in self._last_used:
+                    if touch:
+                        self._last_used[symbol] = now
+                    continue
+                info = mt5.symbol_info(symbol)
+                if info is None or not info.select:
+                    if not mt5.symbol_select(symbol, True):
+                        print(f"Aviso: Não foi possível selecionar {symbol} no Market Watch via API.")
+                        continue
+                    self._owned.add(symbol)
+                    newly_selected.append(symbol)
+                self._last_used[symbol] = now
+        self.prune_idle()
+        return newly_selected
+
+    def wait_first_ticks(self, symbols):
+        """Aguarda o primeiro tick válido dos `symbols`; chamar sem MT5_LOCK (o lock é pego a cada consulta)."""
+        pending = set(symbols)
+        deadline = time.monotonic() + self.first_tick_timeout_s
+        while True:
+            with MT5_LOCK:
+                pending = {symbol for symbol in pending if not _tick_has_price(mt5.symbol_info_tick(symbol))}
+            if not pending or time.monotonic() >= deadline:
+                break
+            time.sleep(self.poll_interval_s)
+        if pending:
+            print(f"Aviso: Sem tick válido após {self.first_tick_timeout_s:.1f}s para: {', '.join(sorted(pending))}")
+
+    def prune_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout_s
+        with self._lock:
+            idle = [symbol for symbol, last_used in self._last_used.items() if last_used < cutoff]
+            for symbol in idle:
+                del self._last_used[symbol]
+                if symbol in self._owned:
+                    self._owned.discard(symbol)
+                    mt5.symbol_select(symbol, False)
+
+    def release_all(self):
+        with self._lock:
+            for symbol in self._owned:
+                mt5.symbol_select(symbol, False)
+            self._owned.clear()
+            self._last_used.clear()
+
+MARKET_WATCH = None
+TICK_RECORDER = None
+
+PriceSnapshot = namedtuple('PriceSnapshot', ['timestamp', 'prices'])
+
+class MarketDataWorker(threading.Thread):
+    """Thread dedicada aos dados de mercado.
+
+    Dona da conexão MT5 enquanto o app roda: lê os símbolos assinados a cada `poll_interval_s`,
+    reconecta se o terminal cair e publica retratos imutáveis (PriceSnapshot) em `snapshots`,
+    uma fila que a interface esvazia via root.after. A thread de Tk nunca espera por I/O do MT5.
+
+    Um símbolo deixa de ser lido quando a interface não o pede (subscribe) há mais de
+    MARKET_WATCH.idle_timeout_s; o registro do Market Watch o desmarca pelo mesmo critério.
+    """
+    def __init__(self, poll_interval_s=MARKET_DATA_POLL_S):
+        super().__init__(name="MarketDataWorker", daemon=True)
+        self.poll_interval_s = poll_interval_s
+        self.snapshots = queue.Queue(maxsize=MARKET_DATA_QUEUE_SIZE)
+        self.connected = True  # a conexão inicial é aberta por mt5_connect() antes do start()
+        self._symbols = {}  # símbolo -> último pedido da interface (time.monotonic)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+
+    def subscribe(self, symbols):
+        symbols = list(filter(None, symbols))
+        now = time.monotonic()
+        with self._lock:
+            new_symbols = [symbol for symbol in symbols if symbol not in self._symbols]
+            self._symbols.update(dict.fromkeys(symbols, now))
+        MARKET_WATCH.touch(symbols)
+        if new_symbols:
+            self._wakeup.set()
+
+    def request_refresh(self, symbols):
+        self.subscribe(symbols)
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def _active_symbols(self):
+        """Símbolos pedidos pela interface nos últimos MARKET_WATCH.idle_timeout_s; os demais saem da assinatura."""
+        cutoff = time.monotonic() - MARKET_WATCH.idle_timeout_s
+        with self._lock:
+            for symbol in [s for s, last_requested in self._symbols.items() if last_requested < cutoff]:
+                del self._symbols[symbol]
+            return sorted(self._symbols)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            # Limpa antes de ler os símbolos: um subscribe/request_refresh feito durante a leitura
+            # deixa o evento ligado e a próxima espera retorna na hora.
+            self._wakeup.clear()
+            with MT5_LOCK:
+                if not self.connected or mt5.terminal_info() is None:
+                    self.connected = self._reconnect()
+            symbols = self._active_symbols()
+            if self.connected and symbols:
+                try:
+                    prices = _mt5_fetch_prices(symbols, touch=False)
+                except Exception as e:
+                    print(f"Erro ao ler preços no MT5: {e}")
+                else:
+                    self._publish(PriceSnapshot(time.monotonic(), MappingProxyType(prices)))
+            # Mercado parado ou sem símbolos: os ticks já no buffer vão para o disco no prazo mesmo assim.
+            TICK_RECORDER.flush_if_due()
+            self._wakeup.wait(self.poll_interval_s if self.connected else MARKET_DATA_RECONNECT_S)
+
+    def _reconnect(self):
+        print("Conexão com o MT5 perdida. Tentando reconectar...")
+        mt5.shutdown()
+        if mt5.initialize():
+            print("Reconectado ao MT5.")
+            return True
+        print(f"Falha ao reconectar ao MT5: {mt5.last_error()}")
+        return False
+
+    def _publish(self, snapshot):
+        # Fila limitada: se a interface estiver atrasada, o retrato mais antigo é descartado.
+        while True:
+            try:
+                self.snapshots.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try: self.snapshots.get_nowait()
+                except queue.Empty: pass
+
+MARKET_DATA_WORKER = None
+
+def init_runtime():
+    """Carrega o backend MT5 e cria os singletons de mercado (uma vez, no processo do app)."""
+    global mt5, PRICE_CACHE, MARKET_WATCH, TICK_RECORDER, MARKET_DATA_WORKER
+    mt5 = load_mt5_backend()
+    PRICE_CACHE = PriceSnapshotCache()
+    MARKET_WATCH = MarketWatchRegistry()
+    TICK_RECORDER = ticks.TickRecorder()
+    MARKET_DATA_WORKER = MarketDataWorker()
+
 def mt5_get_all_prices_optimized(symbols_to_fetch):
+    if not symbols_to_fetch: return {}
+    if MARKET_DATA_WORKER.is_alive():
+        # Com a thread de mercado ativa, a interface só lê o último retrato; símbolos novos são
+        # assinados e chegam no próximo PriceSnapshot.
+        MARKET_DATA_WORKER.subscribe(symbols_to_fetch)
+        return PRICE_CACHE.peek(symbols_to_fetch)
+    return PRICE_CACHE.get_prices(symbols_to_fetch, _mt5_fetch_prices)
+
+def mt5_request_fresh_prices(symbols):
+    """Pede preços novos para os símbolos: acorda a thread de mercado ou invalida o cache."""
+    if MARKET_DATA_WORKER.is_alive():
+        MARKET_DATA_WORKER.request_refresh(symbols)
+    else:
+        PRICE_CACHE.invalidate(symbols)
+
+def _mt5_fetch_prices(symbols_to_fetch, touch=True):
+    """Lê os ticks no MT5. `touch=False` (leitura periódica da thread de mercado) não conta como uso no Market Watch."""
     prices = {}
     if not symbols_to_fetch: return prices
-    
+
     unique_symbols = list(filter(None, set(symbols_to_fetch)))
     if not unique_symbols: return prices
 
-    for symbol in unique_symbols:
-        if not mt5.symbol_select(symbol, True):
-            print(f"Aviso: Não foi possível selecionar {symbol} no Market Watch via API.")
-    time.sleep(0.2)
-    
-    symbol_ticks = {symbol: mt5.symbol_info_tick(symbol) for symbol in unique_symbols}
+    # O sync do pipeline pode estar usando o MT5 em outra thread (sync.sincronizar_via_mt5).
+    with MT5_LOCK:
+        newly_selected = MARKET_WATCH.ensure(unique_symbols, touch=touch)
+    if newly_selected:
+        MARKET_WATCH.wait_first_ticks(newly_selected)
+    with MT5_LOCK:
+        symbol_ticks = {symbol: mt5.symbol_info_tick(symbol) for symbol in unique_symbols}
+    for symbol, tick in symbol_ticks.items():
+        TICK_RECORDER.record(symbol, tick)
     
     def get_price(tick, price_type='ask'):
         if not tick: return None
@@ -93,10 +391,10 @@ def mt5_get_all_prices_optimized(symbols_to_fetch):
         
     return prices
 
-def mt5_get_symbol_price(symbol_name):
+def mt5_get_symbol_price(symbol_name, warn=True):
     prices = mt5_get_all_prices_optimized([symbol_name])
     price = prices.get(f'{symbol_name}_ask')
-    if price is None: messagebox.showwarning("Erro MT5", f"Não foi possível obter preço de COMPRA (ASK) para {symbol_name}.")
+    if price is None and warn: messagebox.showwarning("Erro MT5", f"Não foi possível obter preço de COMPRA (ASK) para {symbol_name}.")
     return price
 
 class OptionStrategyApp:
@@ -121,6 +419,7 @@ class OptionStrategyApp:
         self.root.focus_force()
 
         self.df_options, self.current_asset_price, self.selected_option_pair = None, None, None
+        self._base_version = None
         self.mt5_prices, self.current_position, self.tree_item_map = {}, {}, {}
         self.ax_left, self.ax_right = None, None
         self.current_position_key = 'T'
@@ -130,6 +429,12 @@ class OptionStrategyApp:
         self._goal_seek_debounce_job = None
         self.last_graph_pnl_pct_sim = 0.0
         self.last_graph_pnl_pct_pos = 0.0
+        self._latest_snapshot = None
+        self._pending_asset_selection = None
+        self._pending_price_refresh = False
+        self._force_next_pipeline = False
+        self.notes_watcher = None
+        self._pending_note_dirs = set()
 
         self.qty_spinboxes = {}
         self.price_entries = {}
@@ -150,6 +455,8 @@ class OptionStrategyApp:
         self.load_data()
         self.create_widgets()
         self.load_settings()
+        MARKET_DATA_WORKER.start()
+        self.root.after(MARKET_DATA_DRAIN_MS, self._drain_market_data)
         self.load_position_view(self.current_position_key)
         self.auto_load_initial_asset()
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -236,6 +543,7 @@ class OptionStrategyApp:
 
     def load_data(self):
         try:
+            self._base_version = base_changes.file_version(CSV_FILE_PATH)
             self.df_options = pd.read_csv(CSV_FILE_PATH, sep=';')
             self.df_options['strike'] = pd.to_numeric(self.df_options['strike'].str.replace(',', '.'), errors='coerce')
             self.df_options.dropna(subset=['strike'], inplace=True)
@@ -243,8 +551,29 @@ class OptionStrategyApp:
             messagebox.showerror("Erro de Arquivo", f"Arquivo {CSV_FILE_PATH} não encontrado ou inválido: {e}")
             self.df_options = pd.DataFrame(); self.root.destroy(); return
 
+    def apply_base_changes(self):
+        """Atualiza a cadeia em memória após um sync: aplica o changelog se ele parte da versão carregada, senão recarrega o base.csv."""
+        changes = base_changes.read_changes(CSV_FILE_PATH)
+        if changes is not None and changes.get('versao') == self._base_version:
+            return
+        if changes is not None and self._base_version is not None and changes.get('versao_anterior') == self._base_version:
+            self.df_options = base_changes.apply_changes(self.df_options, changes)
+            self._base_version = changes['versao']
+            print(f"base.csv atualizado em memória: {len(changes['adicionados'])} adicionados, {len(changes['removidos'])} removidos, "
+                  f"{len(changes['strikes_ajustados'])} strikes ajustados.")
+        else:
+            self.load_data()
+        if hasattr(self, 'asset_combo'):
+            self.asset_combo['values'] = sorted(self.df_options['ativo_principal'].astype(str).unique())
+
     def on_closing(self):
         self.save_settings()
+        MARKET_DATA_WORKER.stop()
+        MARKET_DATA_WORKER.join(timeout=2)
+        if self.notes_watcher is not None: self.notes_watcher.stop()
+        TICK_RECORDER.close()
+        cache_stats = PRICE_CACHE.stats()
+        print(f"Cache de preços: {cache_stats['hits']} acertos, {cache_stats['misses']} faltas ({cache_stats['hit_rate']:.0%}).")
         mt5_disconnect()
         self.root.quit()
         self.root.destroy()
@@ -258,7 +587,15 @@ class OptionStrategyApp:
         try:
             with open(filename, "r") as f:
                 pos_data = json.load(f)
-            return pos_data if isinstance(pos_data, dict) and pos_data else {}
+            if not isinstance(pos_data, dict) or not pos_data:
+                return {}
+            # Migração única de posições salvas com o base.csv antigo (código do ISIN, expiração do MT5).
+            pos_data, changes = base_changes.normalize_position(pos_data, self.df_options)
+            if changes:
+                print(f"Posição '{filename}' ajustada ao base.csv atual: {'; '.join(changes)}.")
+                with open(filename, "w") as f:
+                    json.dump(pos_data, f, indent=4)
+            return pos_data
         except (json.JSONDecodeError, IOError):
             return {}
             
@@ -391,7 +728,11 @@ class OptionStrategyApp:
     def save_settings(self):
         settings = {
             "selected_asset": self.asset_combo.get() if hasattr(self, 'asset_combo') else "",
-            "active_position_key": self.current_position_key
+            "active_position_key": self.current_position_key,
+            "price_cache_ttl_s": PRICE_CACHE.ttl_seconds,
+            "market_data_poll_s": MARKET_DATA_WORKER.poll_interval_s,
+            "record_ticks": TICK_RECORDER.enabled,
+            "watch_notes": self.notes_watcher is not None
         }
         try:
             if self.root.state() != 'zoomed': settings["window_geometry"] = self.root.winfo_geometry()
@@ -411,6 +752,10 @@ class OptionStrategyApp:
         except (FileNotFoundError, json.JSONDecodeError): settings = {}
         
         self.current_position_key = settings.get("active_position_key", "T")
+        PRICE_CACHE.ttl_seconds = settings.get("price_cache_ttl_s", PRICE_CACHE_TTL_S)
+        MARKET_DATA_WORKER.poll_interval_s = settings.get("market_data_poll_s", MARKET_DATA_POLL_S)
+        TICK_RECORDER.enabled = bool(settings.get("record_ticks", False))
+        if settings.get("watch_notes", False): self.start_notes_watcher()
 
         if settings.get("window_state") == 'zoomed':
             try: self.root.state('zoomed')
@@ -712,6 +1057,8 @@ class OptionStrategyApp:
 
         self.si_btn = ttk.Button(centered_frame, text="SI", width=5, command=self.run_si_extraction)
         self.si_btn.pack(side=tk.LEFT, padx=(2,0))
+        for pipeline_btn in (self.sync_btn, self.si_btn):
+            pipeline_btn.bind("<Button-1>", self._remember_force_click, add="+")
         
         advanced_goal_seek_frame = ttk.Frame(position_action_frame) # Child of position_action_frame
         advanced_goal_seek_frame.pack(fill=tk.X, expand=True, padx=5) # pack into position_action_frame
@@ -812,8 +1159,12 @@ class OptionStrategyApp:
     def on_asset_selected(self, event=None):
         selected_asset = self.asset_combo.get()
         if not selected_asset: return
-        self.current_asset_price = mt5_get_symbol_price(selected_asset)
-        if self.current_asset_price is None: self.clear_all_displays(); return
+        mt5_request_fresh_prices([selected_asset])
+        self._pending_asset_selection = None
+        self.current_asset_price = mt5_get_symbol_price(selected_asset, warn=not MARKET_DATA_WORKER.is_alive())
+        if self.current_asset_price is None:
+            if MARKET_DATA_WORKER.is_alive(): self._pending_asset_selection = selected_asset
+            self.clear_all_displays(); return
         bounds = self.current_asset_price * np.array([0.85, 1.15])
         filtered_df = self.df_options[(self.df_options['ativo_principal'] == selected_asset) & (self.df_options['strike'].between(bounds[0], bounds[1]))].copy()
         self.last_filtered_df_for_treeview = filtered_df
@@ -920,13 +1271,18 @@ class OptionStrategyApp:
         if params:
             self._update_summary_widgets(params)
     
-    def _calculate_rollover_d2_flow(self, assembly_params, unwind_quantities):
+    def _get_rollover_prices_snapshot(self):
+        """Lê, de uma só vez, os preços de todas as pernas da rolagem (posição atual + novo par)."""
         if not self.current_position or not self.selected_option_pair: return None
         pos, new_pair = self.current_position, self.selected_option_pair
         if pos.get('tickers', {}).get('asset') != new_pair['ativo_principal']: return None
         all_symbols = list(filter(None, set([pos['tickers']['asset'], pos['tickers']['call'], pos['tickers']['put'], new_pair['ticker_call'], new_pair['ticker_put']])))
-        prices = mt5_get_all_prices_optimized(all_symbols)
-        return self._calculate_rollover_d2_flow_with_prices(assembly_params, unwind_quantities, prices, pos)
+        return dict(mt5_get_all_prices_optimized(all_symbols))
+
+    def _calculate_rollover_d2_flow(self, assembly_params, unwind_quantities):
+        prices = self._get_rollover_prices_snapshot()
+        if prices is None: return None
+        return self._calculate_rollover_d2_flow_with_prices(assembly_params, unwind_quantities, prices, self.current_position)
 
     def perform_d2_goal_seek(self):
         try:
@@ -938,35 +1294,22 @@ class OptionStrategyApp:
         
         if not all([unwind_quantities, base_assembly_params, self.current_position, self.selected_option_pair]): return
 
-        q_asset_base = base_assembly_params['asset_q']
-        q_call_base = base_assembly_params['call_q']
-        q_put_base = base_assembly_params['put_q']
-        total_q_base = q_asset_base + q_call_base + q_put_base
-        if total_q_base == 0: return
-            
-        ratio_asset = q_asset_base / total_q_base
-        ratio_call = q_call_base / total_q_base
-        ratio_put = q_put_base / total_q_base
-        multiplier = float(total_q_base) 
-        
-        for i in range(20): 
-            current_params = {'asset_q': multiplier * ratio_asset, 'call_q': multiplier * ratio_call, 'put_q': multiplier * ratio_put}
-            current_d2 = self._calculate_rollover_d2_flow(current_params, unwind_quantities)
-            if current_d2 is None: return
-            error = TARGET_D2_VALUE - current_d2
-            if abs(error) < 50: break
-            next_params = {'asset_q': (multiplier + 1) * ratio_asset, 'call_q': (multiplier + 1) * ratio_call, 'put_q': (multiplier + 1) * ratio_put}
-            next_d2 = self._calculate_rollover_d2_flow(next_params, unwind_quantities)
-            if next_d2 is None: return 
-            gradient = next_d2 - current_d2
-            if abs(gradient) < 1e-9: return
-            adjustment = error / gradient
-            multiplier += adjustment * 0.8 
-            if multiplier < 0: multiplier = 0
-
-        self.qty_spinboxes["Ações"]["var"].set(int(round(multiplier * ratio_asset / 100) * 100))
-        self.qty_spinboxes["Calls"]["var"].set(int(round(multiplier * ratio_call / 100) * 100))
-        self.qty_spinboxes["Puts"]["var"].set(int(round(multiplier * ratio_put / 100) * 100))
+        # Um único retrato de preços para todo o goal seek: o solver roda em memória e o resultado
+        # não varia se o mercado se mexer no meio das iterações.
+        prices_snapshot = self._get_rollover_prices_snapshot()
+        if prices_snapshot is None: return
+        pos = self.current_position
+
+        legs = rollover.rollover_leg_prices(prices_snapshot, pos['tickers'], self.selected_option_pair['ticker_call'], self.selected_option_pair['ticker_put'])
+        if legs is None: return
+        base_q = {leg: base_assembly_params[leg] for leg in ('asset_q', 'call_q', 'put_q')}
+        solutions = rollover.solve_d2_lots(TARGET_D2_VALUE, base_q, unwind_quantities, legs)
+        if not solutions: return
+
+        best = solutions[0]
+        self.qty_spinboxes["Ações"]["var"].set(best.asset_q)
+        self.qty_spinboxes["Calls"]["var"].set(best.call_q)
+        self.qty_spinboxes["Puts"]["var"].set(best.put_q)
         self.on_input_change()
 
     def calculate_rollover_for_target_profit(self):
@@ -1050,71 +1393,30 @@ class OptionStrategyApp:
         base_assembly_params = self._get_strategy_parameters()
         if not base_assembly_params: return
 
-        q_asset_base, q_call_base, q_put_base = base_assembly_params['asset_q'], base_assembly_params['call_q'], base_assembly_params['put_q']
-        total_q_base = q_asset_base + q_call_base + q_put_base
-        if total_q_base == 0:
+        base_q = {leg: base_assembly_params[leg] for leg in ('asset_q', 'call_q', 'put_q')}
+        if sum(base_q.values()) == 0:
             messagebox.showwarning("Aviso", "As quantidades de montagem base não podem ser zero.")
             return
-            
-        ratio_asset, ratio_call, ratio_put = q_asset_base / total_q_base, q_call_base / total_q_base, q_put_base / total_q_base
-        multiplier = float(total_q_base)
-        
-        for i in range(20):
-            current_params = {'asset_q': multiplier * ratio_asset, 'call_q': multiplier * ratio_call, 'put_q': multiplier * ratio_put}
-            current_d2 = self._calculate_rollover_d2_flow_with_prices(current_params, unwind_quantities, future_prices, pos)
-            
-            if current_d2 is None: messagebox.showerror("Erro", "Falha ao calcular D+2 na simulação."); return
-            error = target_d2_flow - current_d2
-            if abs(error) < 50: break
-
-            next_params = {'asset_q': (multiplier + 100) * ratio_asset, 'call_q': (multiplier + 100) * ratio_call, 'put_q': (multiplier + 100) * ratio_put}
-            next_d2 = self._calculate_rollover_d2_flow_with_prices(next_params, unwind_quantities, future_prices, pos)
-
-            if next_d2 is None: return
-            gradient = next_d2 - current_d2
-            if abs(gradient) < 1e-9: break
-            adjustment = error / gradient
-            multiplier += adjustment * 100 * 0.8
-            if multiplier < 0: multiplier = 0
-            
-        final_q_asset = int(round(multiplier * ratio_asset / 100) * 100)
-        final_q_call = int(round(multiplier * ratio_call / 100) * 100)
-        final_q_put = int(round(multiplier * ratio_put / 100) * 100)
 
-        self.qty_spinboxes["Ações"]["var"].set(final_q_asset)
-        self.qty_spinboxes["Calls"]["var"].set(final_q_call)
-        self.qty_spinboxes["Puts"]["var"].set(final_q_put)
+        legs = rollover.rollover_leg_prices(future_prices, pos['tickers'], new_pair['ticker_call'], new_pair['ticker_put'])
+        if legs is None: messagebox.showerror("Erro", "Falha ao calcular D+2 na simulação."); return
+        solutions = rollover.solve_d2_lots(target_d2_flow, base_q, unwind_quantities, legs)
+        if not solutions: return
+
+        best = solutions[0]
+        self.qty_spinboxes["Ações"]["var"].set(best.asset_q)
+        self.qty_spinboxes["Calls"]["var"].set(best.call_q)
+        self.qty_spinboxes["Puts"]["var"].set(best.put_q)
         
         simulated_assembly_params = self._get_strategy_parameters()
         self._display_rollover_data(new_pair, pos, unwind_quantities, simulated_assembly_params, future_prices)
         self.update_position_display() # Ensure Alvo+Custo is updated
         
     def _calculate_rollover_d2_flow_with_prices(self, assembly_params, unwind_quantities, prices, current_pos):
-        pos_call_ask = prices.get(f"{current_pos['tickers']['call']}_ask")
-        new_call_bid = prices.get(f"{self.selected_option_pair['ticker_call']}_bid")
-        pos_put_bid = prices.get(f"{current_pos['tickers']['put']}_bid")
-        new_put_ask = prices.get(f"{self.selected_option_pair['ticker_put']}_ask")
-        asset_ask = prices.get(f"{current_pos['tickers']['asset']}_ask")
-        asset_bid = prices.get(f"{current_pos['tickers']['asset']}_bid")
-
-        if any(p is None for p in [pos_call_ask, new_call_bid, pos_put_bid, new_put_ask, asset_ask, asset_bid]):
+        legs = rollover.rollover_leg_prices(prices, current_pos['tickers'], self.selected_option_pair['ticker_call'], self.selected_option_pair['ticker_put'])
+        if legs is None:
             return None
-
-        fin_recompra_call = -(unwind_quantities['call_q'] * pos_call_ask)
-        fin_venda_call = assembly_params['call_q'] * new_call_bid
-        fin_venda_put = unwind_quantities['put_q'] * pos_put_bid
-        fin_compra_put = -(assembly_params['put_q'] * new_put_ask)
-        liquido_opcoes = fin_recompra_call + fin_venda_call + fin_venda_put + fin_compra_put
-        
-        net_asset_q_change = assembly_params['asset_q'] - unwind_quantities['asset_q']
-
-        fin_asset = 0
-        if net_asset_q_change > 0:
-            fin_asset = -net_asset_q_change * asset_ask
-        elif net_asset_q_change < 0:
-            fin_asset = abs(net_asset_q_change) * asset_bid
-
-        return liquido_opcoes + fin_asset
+        return rollover.d2_flow(assembly_params, unwind_quantities, legs)
 
     def calculate_and_display_rollover(self):
         if not self.current_position or not self.selected_option_pair:
@@ -1523,13 +1825,50 @@ class OptionStrategyApp:
         d2_color = "blue" if cumulative_d2_flow >= 0 else "red"
         self.montagem_d2_value_label.config(text=f"R$ {cumulative_d2_flow:,.2f}", foreground=d2_color)
 
+    def _drain_market_data(self):
+        """Esvazia a fila da thread de mercado (no loop do Tk) e redesenha a partir do retrato mais recente."""
+        snapshot = None
+        while True:
+            try: snapshot = MARKET_DATA_WORKER.snapshots.get_nowait()
+            except queue.Empty: break
+        if snapshot is not None:
+            previous = self._latest_snapshot
+            self._latest_snapshot = snapshot
+            PRICE_CACHE.store(snapshot.prices, timestamp=snapshot.timestamp)
+            if previous is None or previous.prices != snapshot.prices:
+                self._on_market_snapshot(snapshot)
+        if self.root.winfo_exists():
+            self.root.after(MARKET_DATA_DRAIN_MS, self._drain_market_data)
+
+    def _on_market_snapshot(self, snapshot):
+        pending_asset = self._pending_asset_selection
+        if pending_asset:
+            if pending_asset != self.asset_combo.get():
+                self._pending_asset_selection = None
+            elif f"{pending_asset}_ask" in snapshot.prices:
+                # Ativo escolhido antes do primeiro preço chegar: refaz a seleção (e avisa, se não houver preço).
+                self._pending_asset_selection = None
+                self.current_asset_price = snapshot.prices.get(f"{pending_asset}_ask")
+                if self.current_asset_price is None:
+                    messagebox.showwarning("Erro MT5", f"Não foi possível obter preço de COMPRA (ASK) para {pending_asset}.")
+                else:
+                    self.on_asset_selected()
+            return
+        if self._pending_price_refresh and self.selected_option_pair:
+            self.refresh_all_prices()
+        if self.selected_option_pair or self.current_position:
+            self.trigger_recalculation()
+
     def auto_load_initial_asset(self):
         if self.asset_combo.get(): self.on_asset_selected()
 
     def refresh_all_prices(self):
         if not self.selected_option_pair: return
         symbols_to_fetch = [self.selected_option_pair['ativo_principal'], self.selected_option_pair['ticker_call'], self.selected_option_pair['ticker_put']]
+        mt5_request_fresh_prices(symbols_to_fetch)
         prices_raw = mt5_get_all_prices_optimized(symbols_to_fetch)
+        # Par ainda não lido pela thread de mercado: os campos são preenchidos quando o retrato chegar.
+        self._pending_price_refresh = MARKET_DATA_WORKER.is_alive() and (self._latest_snapshot is None or any(f"{s}_ask" not in self._latest_snapshot.prices for s in symbols_to_fetch))
         self.mt5_prices = { 'asset_ask': prices_raw.get(f"{self.selected_option_pair['ativo_principal']}_ask"), 'asset_bid': prices_raw.get(f"{self.selected_option_pair['ativo_principal']}_bid"),
             'call_ask': prices_raw.get(f"{self.selected_option_pair['ticker_call']}_ask"), 'call_bid': prices_raw.get(f"{self.selected_option_pair['ticker_call']}_bid"),
             'put_ask': prices_raw.get(f"{self.selected_option_pair['ticker_put']}_ask"), 'put_bid': prices_raw.get(f"{self.selected_option_pair['ticker_put']}_bid"), }
@@ -1665,168 +2004,113 @@ class OptionStrategyApp:
         except tk.TclError:
             messagebox.showerror("Erro", "Não foi possível acessar a área de transferência.")
 
-    def run_sync_scripts_threaded(self, progress_popup_instance):
-        if hasattr(self, 'sync_btn'):
-            self.root.after_idle(lambda: self.sync_btn.config(state=tk.DISABLED, text="Sincronizando..."))
+    def _remember_force_click(self, event):
+        # Shift+clique nos botões Sy/SI refaz todas as etapas, ignorando o cache do pipeline.
+        self._force_next_pipeline = bool(event.state & 0x0001)
 
-        try:
-            self.root.after_idle(progress_popup_instance.update_progress, "notas", "Executando...")
-            
-            child_env = os.environ.copy()
-            child_env["PYTHONIOENCODING"] = "utf-8"
-            
-            process_notas = subprocess.run([sys.executable, 'notas.py'], capture_output=True, text=True, check=False, encoding='utf-8', errors='replace', env=child_env)
+    def _run_pipeline(self, stages, popup, button, busy_text, idle_text, on_success=None):
+        """Roda as etapas em processo numa thread de trabalho, refletindo os eventos no popup de progresso."""
+        force, self._force_next_pipeline = self._force_next_pipeline, False
+        if button is not None:
+            button.config(state=tk.DISABLED, text=busy_text)
 
-            if process_notas.returncode == 0:
-                self.root.after_idle(progress_popup_instance.update_progress, "notas", "Concluído!", 100)
-                self.root.after_idle(progress_popup_instance.update_progress, "relat", "Executando...")
-                
-                process_relat = subprocess.run([sys.executable, 'relat.py'], capture_output=True, text=True, check=False, encoding='utf-8', errors='replace', env=child_env)
+        def on_event(event):
+            self.root.after_idle(self._on_pipeline_event, popup, event)
 
-                if process_relat.returncode == 0:
-                    self.root.after_idle(progress_popup_instance.update_progress, "relat", "Concluído!", 100)
-                    self.root.after_idle(progress_popup_instance.show_close_button)
-                else:
-                    self.root.after_idle(progress_popup_instance.update_progress, "relat", "Erro!", 0)
-                    error_message = f"Erro ao executar relat.py:\nReturn Code: {process_relat.returncode}\nOutput:\n{process_relat.stdout}\nError:\n{process_relat.stderr}"
-                    print(error_message)
-                    parent_window = progress_popup_instance.popup if progress_popup_instance and hasattr(progress_popup_instance, 'popup') and progress_popup_instance.popup.winfo_exists() else self.root
-                    self.root.after_idle(messagebox.showerror, "Erro em relat.py", error_message, parent=parent_window)
-                    self.root.after_idle(progress_popup_instance.show_close_button)
-            else:
-                self.root.after_idle(progress_popup_instance.update_progress, "notas", "Erro!", 0)
-                self.root.after_idle(progress_popup_instance.update_progress, "relat", "Não executado", 0)
-                error_message = f"Erro ao executar notas.py:\nReturn Code: {process_notas.returncode}\nOutput:\n{process_notas.stdout}\nError:\n{process_notas.stderr}"
-                print(error_message)
-                parent_window = progress_popup_instance.popup if progress_popup_instance and hasattr(progress_popup_instance, 'popup') and progress_popup_instance.popup.winfo_exists() else self.root
-                self.root.after_idle(messagebox.showerror, "Erro em notas.py", error_message, parent=parent_window)
-                self.root.after_idle(progress_popup_instance.show_close_button)
-
-        except FileNotFoundError as e:
-            self.root.after_idle(progress_popup_instance.update_progress, "notas", "Erro de Arquivo!", 0)
-            self.root.after_idle(progress_popup_instance.update_progress, "relat", "Erro de Arquivo!", 0)
-            error_msg_fnf = f"Script não encontrado: {e}. Certifique-se que notas.py e relat.py estão no diretório raiz."
-            print(error_msg_fnf)
-            parent_window = progress_popup_instance.popup if progress_popup_instance and hasattr(progress_popup_instance, 'popup') and progress_popup_instance.popup.winfo_exists() else self.root
-            self.root.after_idle(messagebox.showerror, "Erro de Arquivo", error_msg_fnf, parent=parent_window)
-            self.root.after_idle(progress_popup_instance.show_close_button)
-        except Exception as e:
-            self.root.after_idle(progress_popup_instance.update_progress, "notas", "Erro Inesperado!", 0)
-            self.root.after_idle(progress_popup_instance.update_progress, "relat", "Erro Inesperado!", 0)
-            error_msg_exc = f"Ocorreu um erro inesperado: {e}"
-            print(error_msg_exc)
-            parent_window = progress_popup_instance.popup if progress_popup_instance and hasattr(progress_popup_instance, 'popup') and progress_popup_instance.popup.winfo_exists() else self.root
-            self.root.after_idle(messagebox.showerror, "Erro Inesperado", error_msg_exc, parent=parent_window)
-            self.root.after_idle(progress_popup_instance.show_close_button)
-        finally:
-            if hasattr(self, 'sync_btn') and self.sync_btn.winfo_exists():
-                 self.root.after_idle(lambda: self.sync_btn.config(state=tk.NORMAL, text="Sy"))
+        def on_finish(ok, context):
+            self.root.after_idle(self._on_pipeline_finished, popup, button, idle_text, on_success if ok else None)
 
-    def run_sync_scripts(self):
-        self.progress_popup = SyncProgressPopup(self.root) 
-        thread = threading.Thread(target=self.run_sync_scripts_threaded, args=(self.progress_popup,))
-        thread.daemon = True
-        thread.start()
+        runner = pipeline.PipelineRunner(stages, on_event, on_finish, force=force)
+        popup.set_cancel_command(runner.cancel)
+        runner.start()
 
-    def run_si_extraction(self):
-        self.si_progress_popup = SIProgressPopup(self.root)
-        thread = threading.Thread(target=self.run_si_extraction_threaded, args=(self.si_progress_popup,))
-        thread.daemon = True
-        thread.start()
+    def _on_pipeline_event(self, popup, event):
+        if not popup.popup.winfo_exists():
+            return
+        if event.status == 'running':
+            popup.update_progress(event.stage, event.message)
+        elif event.status == 'progress':
+            popup.update_progress(event.stage, event.message or "Executando...", event.progress)
+        elif event.status in ('done', 'skipped'):
+            popup.update_progress(event.stage, event.message, 100)
+        elif event.status == 'error':
+            popup.update_progress(event.stage, "Erro!", 0)
+            print(f"Erro na etapa '{event.stage}': {event.message}")
+            messagebox.showerror(f"Erro em {event.stage}", event.message, parent=popup.popup)
+        elif event.status == 'cancelled':
+            popup.update_progress(event.stage, event.message, 0)
+            print(f"Etapa '{event.stage}' cancelada.")
+        elif event.status == 'not_run':
+            popup.update_progress(event.stage, event.message, 0)
+
+    def _on_pipeline_finished(self, popup, button, idle_text, on_success):
+        if on_success is not None:
+            on_success()
+        if popup.popup.winfo_exists():
+            popup.show_close_button()
+        if button is not None and button.winfo_exists():
+            button.config(state=tk.NORMAL, text=idle_text)
 
-    def run_si_extraction_threaded(self, progress_popup_instance):
-        if hasattr(self, 'si_btn'):
-            self.root.after_idle(lambda: self.si_btn.config(state=tk.DISABLED, text="SI..."))
+    def run_sync_scripts(self):
+        self.progress_popup = SyncProgressPopup(self.root)
+        self._run_pipeline(pipeline.notas_stages(), self.progress_popup, getattr(self, 'sync_btn', None), "Sincronizando...", "Sy")
 
-        zip_filename = "SI_D_SEDE.zip"
-        extract_folder = "SI_D_SEDE"
-        file_to_extract = "SI_D_SEDE.txt"
-        full_file_path = os.path.join(extract_folder, file_to_extract)
-        
-        parent_window = progress_popup_instance.popup if progress_popup_instance and hasattr(progress_popup_instance, 'popup') and progress_popup_instance.popup.winfo_exists() else self.root
-        
-        child_env = os.environ.copy()
-        child_env["PYTHONIOENCODING"] = "utf-8"
+    def start_notes_watcher(self):
+        """Liga o vigia das pastas de notas ("watch_notes" no app_settings.json): PDFs novos ou alterados disparam notas -> relat só para a pessoa afetada."""
+        if self.notes_watcher is not None:
+            return
+        self.notes_watcher = watcher.PdfFolderWatcher(pipeline.notes_directories(),
+                                                      lambda changes: self.root.after_idle(self._on_notes_changed, changes))
+        self.notes_watcher.start()
+
+    def _on_notes_changed(self, changes):
+        for directory, paths in changes.items():
+            print(f"Vigia de notas: {len(paths)} PDF(s) novo(s) ou alterado(s) em '{directory}'.")
+        self._pending_note_dirs.update(changes)
+        self._run_pending_notes_update()
+
+    def _run_pending_notes_update(self):
+        if not self._pending_note_dirs or not self.sync_btn.winfo_exists():
+            return
+        if str(self.sync_btn.cget('state')) == tk.DISABLED:
+            # Um Sy (manual ou do vigia) está rodando; tenta de novo quando ele terminar.
+            self.root.after(NOTES_WATCH_RETRY_MS, self._run_pending_notes_update)
+            return
+        configs = pipeline.configs_for_directories(self._pending_note_dirs)
+        self._pending_note_dirs.clear()
+        if not configs:
+            return
+        started = time.perf_counter()
+        self.sync_btn.config(state=tk.DISABLED, text="Sy...")
 
-        try:
-            self.root.after_idle(progress_popup_instance.update_progress, "download", "Executando...")
-            process_down = subprocess.run([sys.executable, 'down.py'], capture_output=True, text=True, check=False, encoding='utf-8', errors='replace', env=child_env)
+        def on_event(event):
+            if event.status == 'error':
+                self.root.after_idle(self._on_notes_update_error, event)
 
-            if process_down.returncode == 0:
-                self.root.after_idle(progress_popup_instance.update_progress, "download", "Concluído!", 100)
-            else:
-                self.root.after_idle(progress_popup_instance.update_progress, "download", "Erro!", 0)
-                self.root.after_idle(progress_popup_instance.update_progress, "si", "Não executado", 0)
-                self.root.after_idle(progress_popup_instance.update_progress, "sync", "Não executado", 0)
-                error_message = f"Erro ao executar down.py:\nReturn Code: {process_down.returncode}\nOutput:\n{process_down.stdout}\nError:\n{process_down.stderr}"
-                self.root.after_idle(lambda: messagebox.showerror("Erro em down.py", error_message, parent=parent_window))
-                self.root.after_idle(progress_popup_instance.show_close_button)
-                return
+        def on_finish(ok, context):
+            self.root.after_idle(self._on_notes_update_finished, ok, configs, started)
 
-            self.root.after_idle(progress_popup_instance.update_progress, "si", "Iniciando...", 0)
-            if not os.path.exists(extract_folder):
-                os.makedirs(extract_folder)
-                self.root.after_idle(progress_popup_instance.update_progress, "si", f"Pasta {extract_folder} criada.", 20)
-            else:
-                self.root.after_idle(progress_popup_instance.update_progress, "si", f"Pasta {extract_folder} existente.", 20)
+        pipeline.PipelineRunner(pipeline.notes_update_stages(configs), on_event, on_finish).start()
 
-            if not os.path.exists(zip_filename):
-                error_message = f"Arquivo {zip_filename} não encontrado. O download pode ter falhado."
-                self.root.after_idle(progress_popup_instance.update_progress, "si", "Erro de Arquivo!", 0)
-                self.root.after_idle(messagebox.showerror, "Erro de Arquivo", error_message, parent=parent_window)
-                self.root.after_idle(progress_popup_instance.show_close_button)
-                return
+    def _on_notes_update_error(self, event):
+        print(f"Vigia de notas: erro na etapa '{event.stage}': {event.message}")
+        messagebox.showerror(f"Erro em {event.stage}", event.message, parent=self.root)
 
-            self.root.after_idle(progress_popup_instance.update_progress, "si", f"Descompactando {file_to_extract}...", 40)
-            
-            with zipfile.ZipFile(zip_filename, 'r') as zip_ref:
-                if os.path.exists(full_file_path):
-                    os.remove(full_file_path)
-                if file_to_extract not in zip_ref.namelist():
-                    error_message = f"Arquivo {file_to_extract} não encontrado dentro de {zip_filename}."
-                    self.root.after_idle(progress_popup_instance.update_progress, "si", "Erro no ZIP!", 0)
-                    self.root.after_idle(messagebox.showerror, "Erro no ZIP", error_message, parent=parent_window)
-                    self.root.after_idle(progress_popup_instance.show_close_button)
-                    return
-                zip_ref.extract(file_to_extract, extract_folder)
-            
-            self.root.after_idle(progress_popup_instance.update_progress, "si", "Concluído!", 100)
-            
-            self.root.after_idle(progress_popup_instance.update_progress, "sync", "Executando...")
-            process_sync = subprocess.run([sys.executable, 'sync.py'], capture_output=True, text=True, check=False, encoding='utf-8', errors='replace', env=child_env)
-            if process_sync.returncode == 0:
-                self.root.after_idle(progress_popup_instance.update_progress, "sync", "Concluído!", 100)
-                self.root.after_idle(self.load_data)
-                self.root.after_idle(self.on_asset_selected)
-            else:
-                self.root.after_idle(progress_popup_instance.update_progress, "sync", "Erro!", 0)
-                error_message_sync = f"Erro ao executar sync.py:\nReturn Code: {process_sync.returncode}\nOutput:\n{process_sync.stdout}\nError:\n{process_sync.stderr}"
-                self.root.after_idle(lambda: messagebox.showerror("Erro em sync.py", error_message_sync, parent=parent_window))
-            
-            self.root.after_idle(progress_popup_instance.show_close_button)
-
-        except FileNotFoundError as e:
-            script_name = e.filename
-            self.root.after_idle(progress_popup_instance.update_progress, "download" if script_name == "down.py" else "sync", "Erro de Arquivo!", 0)
-            error_message = f"Script não encontrado: {script_name}. Certifique-se que o arquivo está no diretório raiz."
-            self.root.after_idle(messagebox.showerror, "Erro de Arquivo", error_message, parent=parent_window)
-            self.root.after_idle(progress_popup_instance.show_close_button)
-        except zipfile.BadZipFile:
-            self.root.after_idle(progress_popup_instance.update_progress, "si", "Erro de ZIP!", 0)
-            self.root.after_idle(progress_popup_instance.update_progress, "sync", "Não executado", 0)
-            error_message = f"Arquivo '{zip_filename}' não é um arquivo ZIP válido ou está corrompido."
-            self.root.after_idle(messagebox.showerror, "Erro de ZIP", error_message, parent=parent_window)
-            self.root.after_idle(progress_popup_instance.show_close_button)
-        except Exception as e:
-            self.root.after_idle(progress_popup_instance.update_progress, "download", "Erro Inesperado!", 0)
-            self.root.after_idle(progress_popup_instance.update_progress, "si", "Não executado", 0)
-            self.root.after_idle(progress_popup_instance.update_progress, "sync", "Não executado", 0)
-            error_msg_exc = f"Ocorreu um erro inesperado no processo SI: {e}"
-            self.root.after_idle(lambda: messagebox.showerror("Erro Inesperado", error_msg_exc, parent=parent_window))
-            self.root.after_idle(progress_popup_instance.show_close_button)
-        finally:
-            if hasattr(self, 'si_btn') and self.si_btn.winfo_exists():
-                self.root.after_idle(lambda: self.si_btn.config(state=tk.NORMAL, text="SI"))
+    def _on_notes_update_finished(self, ok, configs, started):
+        if self.sync_btn.winfo_exists():
+            self.sync_btn.config(state=tk.NORMAL, text="Sy")
+        if ok:
+            people = ", ".join(config['person_type'] for config in configs)
+            print(f"Vigia de notas: notas e relatório fiscal de {people} atualizados em {time.perf_counter() - started:.1f}s.")
+            self.root.title(f"{APP_TITLE} - notas de {people} atualizadas às {datetime.now():%H:%M:%S}")
+        self._run_pending_notes_update()
+
+    def run_si_extraction(self):
+        self.si_progress_popup = SIProgressPopup(self.root)
+        def on_success():
+            self.apply_base_changes()
+            self.on_asset_selected()
+        self._run_pipeline(pipeline.si_stages(), self.si_progress_popup, getattr(self, 'si_btn', None), "SI...", "SI", on_success)
 
     def show_fiscal_report_popup(self, file_path, title):
         """Abre um popup para exibir dados fiscais de um arquivo JSON."""
@@ -1983,10 +2267,19 @@ class SyncProgressPopup:
             if progress_value == 100:
                  progress_bar['value'] = 100
 
+    def set_cancel_command(self, command):
+        def cancel():
+            self.cancel_button.config(state=tk.DISABLED, text="Cancelando...")
+            command()
+        self.popup.protocol("WM_DELETE_WINDOW", cancel)
+        self.cancel_button = ttk.Button(self.popup, text="Cancelar", command=cancel)
+        self.cancel_button.grid(row=2, column=0, columnspan=3, pady=10)
 
     def show_close_button(self):
         self.popup.protocol("WM_DELETE_WINDOW", self.close)
-        
+        if hasattr(self, 'cancel_button'):
+            self.cancel_button.destroy()
+
         self.close_button = ttk.Button(self.popup, text="Fechar", command=self.close)
         self.close_button.grid(row=2, column=0, columnspan=3, pady=10)
 
@@ -2012,7 +2305,7 @@ class SIProgressPopup:
         self.download_status_label = ttk.Label(self.popup, text="Aguardando...")
         self.download_status_label.grid(row=0, column=2, sticky=tk.W, **pad_options)
 
-        ttk.Label(self.popup, text="Extração ZIP:").grid(row=1, column=0, sticky=tk.W, **pad_options)
+        ttk.Label(self.popup, text="Validação ZIP:").grid(row=1, column=0, sticky=tk.W, **pad_options)
         self.si_progress = ttk.Progressbar(self.popup, orient=tk.HORIZONTAL, length=150, mode='indeterminate')
         self.si_progress.grid(row=1, column=1, **pad_options)
         self.si_status_label = ttk.Label(self.popup, text="Aguardando...")
@@ -2062,12 +2355,22 @@ class SIProgressPopup:
                 elif progress_value == 0 and status.startswith("Erro"): 
                     progress_bar['value'] = 0
 
+    def set_cancel_command(self, command):
+        def cancel():
+            self.cancel_button.config(state=tk.DISABLED, text="Cancelando...")
+            command()
+        self.popup.protocol("WM_DELETE_WINDOW", cancel)
+        self.cancel_button = ttk.Button(self.popup, text="Cancelar", command=cancel)
+        self.cancel_button.grid(row=3, column=0, columnspan=3, pady=10)
+
     def show_close_button(self):
         self._create_close_button()
 
     def _create_close_button(self):
         if self.popup.winfo_exists():
             self.popup.protocol("WM_DELETE_WINDOW", self.close)
+            if hasattr(self, 'cancel_button') and self.cancel_button.winfo_exists():
+                self.cancel_button.destroy()
             if not hasattr(self, 'close_button') or not self.close_button.winfo_exists():
                 self.close_button = ttk.Button(self.popup, text="Fechar", command=self.close)
                 self.close_button.grid(row=3, column=0, columnspan=3, pady=10) # Row ajustada
@@ -2078,6 +2381,7 @@ class SIProgressPopup:
             self.popup.destroy()
 
 if __name__ == "__main__":
+    init_runtime()
     root = tk.Tk()
     app = OptionStrategyApp(root)
     if app.df_options is not None and not app.df_options.empty:
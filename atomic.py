@@ -0,0 +1,38 @@
+# atomic.py
+"""
+Gravação atômica de arquivos: escreve num temporário no mesmo diretório do destino e troca com
+os.replace, para que quem lê (o app, outra etapa do pipeline, outra execução) nunca veja um
+arquivo pela metade. Usado pelos caches, pelo base.csv e seu changelog, pelo manifesto do
+pipeline e pelo download do SI.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def temporary_sibling(path, suffix='.tmp'):
+    """Caminho de um temporário vazio ao lado de `path`; apagado na saída se ainda existir."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path), suffix=suffix)
+    os.close(fd)
+    try:
+        yield tmp_path
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def atomic_write(path, mode='wb', encoding=None):
+    """Arquivo aberto num temporário; ao sair sem erro ele substitui `path`, com erro é descartado."""
+    with temporary_sibling(path) as tmp_path:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+
+
+def replace_file(path, data):
+    """Grava os bytes `data` em `path` de forma atômica."""
+    with atomic_write(path) as f:
+        f.write(data)
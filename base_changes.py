@@ -0,0 +1,173 @@
+# base_changes.py
+"""
+Diferenças entre duas versões do base.csv (tabela de pares call/put).
+
+O sync.py compara a tabela nova com a do arquivo atual, só regrava o base.csv quando algo
+mudou e deixa um changelog pequeno (BASE_CHANGES_FILE, no mesmo diretório do base.csv) com os
+pares adicionados, removidos e com strike ajustado. O app aplica esse changelog ao DataFrame em
+memória quando a versão que ele carregou é a `versao_anterior` do changelog; caso contrário
+recarrega o arquivo inteiro.
+
+Versão = SHA-256 do conteúdo do base.csv.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from atomic import replace_file
+
+BASE_CHANGES_FILE = 'base_changes.json'
+BASE_COLUMNS = ['ativo_principal', 'ticker_call', 'ticker_put', 'strike', 'expiracao']
+# Um par é identificado por tudo menos o strike; mudança só de strike é um ajuste (ex.: proventos).
+PAIR_KEY = ['ativo_principal', 'ticker_call', 'ticker_put', 'expiracao']
+
+
+def content_version(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_version(path):
+    try:
+        with open(path, 'rb') as f:
+            return content_version(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def strike_to_float(strike):
+    return float(str(strike).replace(',', '.'))
+
+
+def read_base(path):
+    """Lê o base.csv como texto (strike no formato do arquivo); None se não existir ou for inválido."""
+    try:
+        df = pd.read_csv(path, sep=';', dtype=str, encoding='utf-8-sig', keep_default_na=False)
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        return None
+    if list(df.columns) != BASE_COLUMNS:
+        return None
+    return df
+
+
+def diff_bases(old_df, new_df):
+    """Compara duas tabelas texto do base.csv e retorna (adicionados, removidos, strikes_ajustados) como listas de dicts."""
+    merged = old_df.merge(new_df, on=PAIR_KEY, how='outer', suffixes=('_anterior', ''), indicator=True)
+    added = merged[merged['_merge'] == 'right_only']
+    removed = merged[merged['_merge'] == 'left_only']
+    both = merged[merged['_merge'] == 'both']
+    adjusted = both[both['strike_anterior'] != both['strike']]
+    return (
+        added[BASE_COLUMNS].to_dict('records'),
+        removed[PAIR_KEY + ['strike_anterior']].rename(columns={'strike_anterior': 'strike'})[BASE_COLUMNS].to_dict('records'),
+        adjusted[BASE_COLUMNS + ['strike_anterior']].to_dict('records'),
+    )
+
+
+def changes_path_for(path):
+    """Caminho do changelog do base.csv em `path`: BASE_CHANGES_FILE no mesmo diretório."""
+    return os.path.join(os.path.dirname(os.path.abspath(path)), BASE_CHANGES_FILE)
+
+
+def write_base_if_changed(new_df, path, changes_path=None):
+    """
+    Grava `new_df` (colunas BASE_COLUMNS, strike já formatado) em `path` só se o conteúdo mudou,
+    com troca atômica, e escreve o changelog em `changes_path` (padrão: ao lado de `path`).
+
+    Retorna o changelog (dict) ou None se nada mudou.
+    """
+    data = new_df[BASE_COLUMNS].to_csv(sep=';', index=False).encode('utf-8-sig')
+    new_version = content_version(data)
+    old_version = file_version(path)
+    if new_version == old_version:
+        return None
+
+    old_df = read_base(path) if old_version else None
+    if old_df is not None:
+        added, removed, adjusted = diff_bases(old_df, new_df[BASE_COLUMNS].astype(str))
+    else:
+        # Sem versão anterior legível não há diff a aplicar: quem estiver com o arquivo aberto recarrega.
+        old_version, added, removed, adjusted = None, [], [], []
+    changes = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'versao_anterior': old_version,
+        'versao': new_version,
+        'adicionados': added,
+        'removidos': removed,
+        'strikes_ajustados': adjusted,
+    }
+    replace_file(path, data)
+    replace_file(changes_path or changes_path_for(path), json.dumps(changes, ensure_ascii=False, indent=1).encode('utf-8'))
+    return changes
+
+
+def read_changes(path, changes_path=None):
+    """Changelog do base.csv em `path` (ou o de `changes_path`); None se não existir ou for inválido."""
+    try:
+        with open(changes_path or changes_path_for(path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def normalize_position(position, df_options):
+    """
+    Atualiza o ativo-objeto e a expiração de uma posição salva (position_*.json) para os do par
+    com os mesmos ticker_call/ticker_put no base.csv carregado (strike numérico, como no app).
+
+    Posições gravadas quando o base.csv vinha do MT5 guardam o código derivado do ISIN (BOVA9 em
+    vez de BOVA11, BDRs com 9 em vez de 34) e a expiração do MT5, um dia antes da data da B3.
+    Ações ON/PN (PETR3, PETR4...) não mudam. Só conta como o mesmo par quando ele é único, tem a
+    mesma raiz de 4 letras e vence no máximo um dia depois do salvo (tickers de opção se repetem
+    em outros anos); fora isso a posição volta como está.
+
+    Retorna (posição, lista de mudanças em texto); a posição original não é alterada.
+    """
+    tickers = position.get('tickers') or {}
+    call, put, asset = tickers.get('call'), tickers.get('put'), tickers.get('asset') or ''
+    if not call or not put or df_options is None or df_options.empty:
+        return position, []
+    rows = df_options[(df_options['ticker_call'] == call) & (df_options['ticker_put'] == put)]
+    if len(rows) != 1:
+        return position, []
+    new_asset, new_expiry = rows.iloc[0]['ativo_principal'], rows.iloc[0]['expiracao']
+    try:
+        days = (datetime.strptime(new_expiry, '%d/%m/%Y') - datetime.strptime(position.get('expiracao', ''), '%d/%m/%Y')).days
+    except (TypeError, ValueError):
+        return position, []
+    if new_asset[:4] != asset[:4] or days not in (0, 1):
+        return position, []
+    changes = []
+    if new_asset != asset:
+        changes.append(f"ativo {asset} -> {new_asset}")
+    if days:
+        changes.append(f"expiração {position['expiracao']} -> {new_expiry}")
+    if not changes:
+        return position, []
+    return dict(position, tickers=dict(tickers, asset=new_asset), expiracao=new_expiry), changes
+
+
+def apply_changes(df_options, changes):
+    """
+    Aplica um changelog ao DataFrame do app (strike numérico) e retorna o novo DataFrame.
+    A ordem das linhas não é preservada para os pares adicionados (vão ao fim).
+    """
+    key_index = pd.MultiIndex.from_frame(df_options[PAIR_KEY].astype(str))
+    if changes['removidos']:
+        removed = pd.MultiIndex.from_frame(pd.DataFrame(changes['removidos'])[PAIR_KEY])
+        df_options = df_options[~key_index.isin(removed)]
+        key_index = pd.MultiIndex.from_frame(df_options[PAIR_KEY].astype(str))
+    if changes['strikes_ajustados']:
+        adjusted = pd.DataFrame(changes['strikes_ajustados'])
+        new_strikes = pd.Series(adjusted['strike'].map(strike_to_float).values,
+                                index=pd.MultiIndex.from_frame(adjusted[PAIR_KEY]))
+        mapped = new_strikes.reindex(key_index).values
+        df_options = df_options.copy()
+        df_options['strike'] = df_options['strike'].where(pd.isna(mapped), mapped)
+    if changes['adicionados']:
+        added = pd.DataFrame(changes['adicionados'])[BASE_COLUMNS]
+        added['strike'] = added['strike'].map(strike_to_float)
+        df_options = pd.concat([df_options, added], ignore_index=True)
+    return df_options.reset_index(drop=True)
@@ -0,0 +1,165 @@
+# bench_notas.py
+"""
+Benchmark da análise do texto das notas de corretagem (notas.analisar_nota + parse_linhas_negocios)
+contra a implementação anterior, que fazia uma busca por campo de taxa e vários splits no texto
+inteiro de cada nota.
+
+Gera um corpus sintético no formato do texto extraído das notas (com notas de várias páginas,
+blocos sem "Resumo dos Negócios" e valores de taxa na linha seguinte), confere que as duas
+implementações dão o mesmo resultado em todas as notas e mede a vazão de cada uma.
+
+    python bench_notas.py [NOTAS] [--semente SEMENTE]
+"""
+import argparse
+import random
+import re
+import sys
+import time
+
+import notas
+
+NOTAS_PADRAO = 10000
+
+CABECALHO = """NOTA DE CORRETAGEM
+Nr.Nota Folha Data pregão
+{nota} {folha} {data}
+GENIAL CCTVM S/A
+Av Brigadeiro Faria Lima, 3400 - 10 ANDARITAIM BIBI 04538-132 SÃO PAULO - SP
+Cliente C.P.F./C.N.P.J./C.V.M./C.O.B.
+Banco Agência Conta corrente Acionista Administrador Complemento nome P. Vinc
+033 00900 10012582 N"""
+
+RESUMO = """Resumo dos Negócios Resumo Financeiro D/C
+Vendas à vista 0,00 Clearing
+Compras à vista 0,00 Valor líquido das operações {liquido} D
+Opções - Compras {compras} Taxa de liquidação {liquidacao} D
+Opções - Vendas {vendas} Taxa de Registro {registro} D
+Ajuste de Day-Trade 0,00 Emolumentos {emolumentos} D
+Valor das operações {total} Total Bovespa / Soma {emolumentos} D
+Especificações diversas Corretagem / Despesas
+Execução 0,00 D
+ISS/PIS/COFINS 0,85 D
+Total corretagem / Despesas{quebra}{corretagem}
+(*) - Observações: A - Posição Futuro T - Liquidação pelo Bruto Líquido para 09/06/2025 1.097,59 D"""
+
+RAIZES = ['PETR', 'VALE', 'BBAS', 'ITUB', 'BOVA', 'ABEV']
+
+
+def _valor(rng, maximo=5000):
+    return f"{rng.uniform(0.01, maximo):_.2f}".replace('.', ',').replace('_', '.')
+
+
+def _quantidade(rng):
+    return f"{rng.randrange(100, 20000, 100):_}".replace('_', '.')
+
+
+def _linha_negocio(rng):
+    if rng.random() < 0.2:
+        return (f"B3 RV LISTADO{rng.choice('CV')} VISTA {rng.choice(RAIZES)} PN N2 {_quantidade(rng)} "
+                f"{_valor(rng, 60)} {_valor(rng)} {rng.choice('CD')}")
+    direito = rng.choice(['OPCAO DE COMPRA', 'OPCAO DE VENDA'])
+    ticker = f"{rng.choice(RAIZES)}{rng.choice('ABCDEFGHIJKLMNOPQRSTUVWX')}{rng.randrange(100, 999)}"
+    observacao = rng.choice(['', '# ', 'D '])
+    return (f"B3 RV LISTADO{rng.choice('CV')} {direito} {rng.randrange(1, 13):02d}/25 {ticker} PN 29,73 PETRE /EDJ "
+            f"{observacao}{_quantidade(rng)} {_valor(rng, 10)} {_valor(rng)} {rng.choice('CD')}")
+
+
+def gerar_nota(rng, numero):
+    """Texto consolidado de uma nota (uma ou mais páginas, como em notas.extrair_notas)."""
+    data = f"{rng.randrange(1, 29):02d}/{rng.randrange(1, 13):02d}/2025"
+    paginas = rng.choice([1, 1, 1, 2, 3])
+    texto = ''
+    for folha in range(1, paginas + 1):
+        linhas = [CABECALHO.format(nota=numero, folha=folha, data=data), "Negócios realizados",
+                  "Q Negociação C/VTipo mercado Prazo Especificação do título Obs. (*) Quantidade Preço / Ajuste Valor Operação / Ajuste D/C"]
+        linhas += [_linha_negocio(rng) for _ in range(rng.randrange(1, 25))]
+        # Páginas intermediárias de notas longas não têm o resumo (o bloco delas é descartado).
+        if folha == paginas or rng.random() < 0.5:
+            linhas.append(RESUMO.format(liquido=_valor(rng), compras=_valor(rng), vendas=_valor(rng), total=_valor(rng),
+                                        liquidacao=_valor(rng, 20), registro=_valor(rng, 20), emolumentos=_valor(rng, 20),
+                                        quebra=rng.choice([' ', ' ', '\n', ' \n\n ']), corretagem=_valor(rng, 20)))
+        texto += "\n".join(linhas) + "\n"
+    return texto
+
+
+def gerar_corpus(quantidade, semente=0):
+    rng = random.Random(semente)
+    return [gerar_nota(rng, 8000 + i) for i in range(quantidade)]
+
+
+def analisar_nota_referencia(texto_consolidado):
+    """A análise anterior: uma busca por campo de taxa e splits no texto inteiro da nota."""
+    try:
+        cabecalho = texto_consolidado.split('\n')[2].split()
+    except IndexError:
+        cabecalho = None
+    taxas = {}
+    for campo in notas.CAMPOS_TAXAS:
+        match = re.search(re.escape(campo) + r'\s+(\S+)', texto_consolidado)
+        taxas[campo] = match.group(1) if match else "0,00"
+    todos_blocos_de_negocios = ""
+    partes = texto_consolidado.split("Negócios realizados")
+    for i, parte in enumerate(partes):
+        if i > 0 and "Resumo dos Negócios" in parte:
+            todos_blocos_de_negocios += parte.split("Resumo dos Negócios")[0] + "\n"
+    padroes = [
+        re.compile(r"VISTA\s+(.+?)\s+([\d\.]+)\s+([\d,]+)\s+([\d\.,]+)\s+([CD])$"),
+        re.compile(r"\d{2}\/\d{2}\s+(\S+).+?([\d\.]+)\s+([\d,]+)\s+([\d\.,]+)\s+([CD])$")
+    ]
+    transacoes = []
+    for linha in todos_blocos_de_negocios.split('\n'):
+        linha_strip = linha.strip()
+        if not linha_strip or linha_strip.startswith("Q Negociação"): continue
+        for padrao in padroes:
+            match = padrao.search(linha_strip)
+            if match:
+                transacoes.append({
+                    'tipo': match.group(5),
+                    'ativo': match.group(1).strip().replace("  ", " "),
+                    'quantidade_str': match.group(2),
+                    'preco_str': match.group(3),
+                    'valor_op_str': match.group(4),
+                    'valor_op_num': notas.limpar_numero(match.group(4))
+                })
+                break
+    return cabecalho, taxas, transacoes
+
+
+def analisar_nota_atual(texto_consolidado):
+    cabecalho, taxas, linhas_negocios = notas.analisar_nota(texto_consolidado)
+    return cabecalho, taxas, notas.parse_linhas_negocios(linhas_negocios)
+
+
+def medir(funcao, corpus):
+    inicio = time.perf_counter()
+    resultados = [funcao(texto) for texto in corpus]
+    return time.perf_counter() - inicio, resultados
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compara a análise atual do texto das notas com a anterior num corpus sintético.")
+    parser.add_argument('quantidade', nargs='?', type=int, default=NOTAS_PADRAO, help=f"notas no corpus (padrão: {NOTAS_PADRAO})")
+    parser.add_argument('--semente', type=int, default=0, help="semente do gerador do corpus (padrão: 0)")
+    args = parser.parse_args(argv)
+    quantidade, semente = args.quantidade, args.semente
+    if quantidade <= 0:
+        parser.error("a quantidade de notas deve ser positiva")
+    corpus = gerar_corpus(quantidade, semente)
+    megabytes = sum(len(texto.encode('utf-8')) for texto in corpus) / 1e6
+    print(f"Corpus sintético: {quantidade} notas, {megabytes:.1f} MB de texto.")
+
+    tempo_referencia, esperado = medir(analisar_nota_referencia, corpus)
+    tempo_atual, obtido = medir(analisar_nota_atual, corpus)
+    divergentes = [i for i, (a, b) in enumerate(zip(esperado, obtido)) if a != b]
+    if divergentes:
+        print(f"ERRO: {len(divergentes)} notas com resultado diferente da análise anterior (primeira: #{divergentes[0]}).")
+        return 1
+    transacoes = sum(len(r[2]) for r in obtido)
+    print(f"Resultados idênticos nas {quantidade} notas ({transacoes} transações).")
+    print(f"Anterior: {tempo_referencia:.3f}s ({quantidade / tempo_referencia:,.0f} notas/s)")
+    print(f"Atual:    {tempo_atual:.3f}s ({quantidade / tempo_atual:,.0f} notas/s)  -> {tempo_referencia / tempo_atual:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,67 +1,236 @@
 # down.py
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 from datetime import datetime
+import hashlib
+import http.client
+import json
 import os
 import sys
 import time
+import urllib.error
+import urllib.request
+import zipfile
+from urllib.parse import urlsplit
 
-def download_series_autorizadas():
-    """
-    Realiza o download do arquivo "Séries Autorizadas" do site da B3 usando Playwright.
+from atomic import temporary_sibling
 
-    Esta abordagem controla um navegador real para contornar proteções complexas
-    (como Cloudflare) que podem bloquear requisições diretas.
+FILENAME = "SI_D_SEDE.zip"
+SI_MEMBER = "SI_D_SEDE.txt"
+STATE_FILE = "SI_D_SEDE.download.json"
+SESSION_FILE = "b3_session.json"
+URL_PAGE = os.environ.get(
+    "VECTOR_B3_SERIES_URL",
+    "https://www.b3.com.br/pt_br/market-data-e-indices/servicos-de-dados/market-data/consultas/mercado-a-vista/opcoes/series-autorizadas/",
+)
+LINK_TEXT = "Lista Completa de Séries Autorizadas"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36"
+PAGE_TIMEOUT_MS = 90000
+LINK_TIMEOUT_MS = 60000
+DOWNLOAD_TIMEOUT_MS = 120000
+DIRECT_TIMEOUT_S = 60
 
-    O processo é:
-    1. Navegar até a página de Séries Autorizadas.
-    2. Encontrar o link de texto "Lista Completa de Séries Autorizadas".
-    3. Clicar no link e capturar o download resultante.
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
 
-    Retorna:
-        bool: True se o download for bem-sucedido, False caso contrário.
-    """
-    print("--- Iniciando download do arquivo de Séries Autorizadas da B3 (usando Playwright) ---")
+def validate_series_zip(path):
+    """Confere se `path` é um ZIP íntegro que contém o SI_D_SEDE.txt. Retorna (ok, motivo)."""
+    if not zipfile.is_zipfile(path):
+        return False, "não é um arquivo ZIP"
+    try:
+        with zipfile.ZipFile(path) as zf:
+            if SI_MEMBER not in zf.namelist():
+                return False, f"{SI_MEMBER} não encontrado dentro do ZIP"
+            bad_member = zf.testzip()
+            if bad_member is not None:
+                return False, f"CRC inválido em {bad_member}"
+    except zipfile.BadZipFile as e:
+        return False, str(e)
+    return True, ""
+
+def read_download_state(state_file=STATE_FILE):
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def write_download_state(path, state_file=STATE_FILE):
+    state = {
+        'downloaded_at': datetime.now().isoformat(timespec='seconds'),
+        'sha256': file_sha256(path),
+        'size': os.path.getsize(path),
+    }
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=4)
+    return state
+
+def is_fresh(path=FILENAME, state_file=STATE_FILE):
+    """O arquivo local foi baixado hoje, não mudou desde então e é um ZIP de séries válido."""
+    state = read_download_state(state_file)
+    if not state or not os.path.exists(path):
+        return False
+    if state.get('downloaded_at', '')[:10] != datetime.now().strftime('%Y-%m-%d'):
+        return False
+    if state.get('size') != os.path.getsize(path) or state.get('sha256') != file_sha256(path):
+        return False
+    return validate_series_zip(path)[0]
+
+def read_session(session_file=SESSION_FILE):
+    """Sessão salva da última ida ao navegador: {'storage_state', 'download_url', 'saved_at'}."""
+    try:
+        with open(session_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
 
-    FILENAME = "SI_D_SEDE.zip"
-    URL_PAGE = "https://www.b3.com.br/pt_br/market-data-e-indices/servicos-de-dados/market-data/consultas/mercado-a-vista/opcoes/series-autorizadas/"
+def write_session(storage_state, download_url, session_file=SESSION_FILE):
+    session = {
+        'saved_at': datetime.now().isoformat(timespec='seconds'),
+        'download_url': download_url,
+        'storage_state': storage_state,
+    }
+    with open(session_file, 'w', encoding='utf-8') as f:
+        json.dump(session, f, indent=4)
 
+def _cookie_header(storage_state, url):
+    """Monta o cabeçalho Cookie com os cookies da sessão válidos para o host e caminho de `url`."""
+    parts = urlsplit(url)
+    host, path, now = parts.hostname or '', parts.path or '/', time.time()
+    cookies = []
+    for cookie in (storage_state or {}).get('cookies', []):
+        domain = cookie.get('domain', '').lstrip('.')
+        if not domain or not (host == domain or host.endswith('.' + domain)):
+            continue
+        if not path.startswith(cookie.get('path', '/')):
+            continue
+        if cookie.get('secure') and parts.scheme != 'https':
+            continue
+        expires = cookie.get('expires', -1)
+        if expires is not None and 0 < expires < now:
+            continue
+        cookies.append(f"{cookie['name']}={cookie['value']}")
+    return '; '.join(cookies)
+
+def _no_progress(percent, message):
+    pass
+
+def _fetch_direct(target_path, session, progress=_no_progress):
+    """
+    Caminho rápido: GET simples da URL do arquivo resolvida na última sessão, com os cookies dela.
+    Retorna True se algo foi baixado para `target_path` (a validação do ZIP fica com quem chama).
+    O andamento é informado pelo Content-Length, quando o servidor o envia.
+    """
+    download_url = session.get('download_url')
+    if not download_url:
+        return False
+    headers = {'User-Agent': USER_AGENT, 'Referer': URL_PAGE}
+    cookie_header = _cookie_header(session.get('storage_state'), download_url)
+    if cookie_header:
+        headers['Cookie'] = cookie_header
+    print(f"1. Tentando download direto: {download_url}")
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36"
-            )
+        request = urllib.request.Request(download_url, headers=headers)
+        with urllib.request.urlopen(request, timeout=DIRECT_TIMEOUT_S) as response, open(target_path, 'wb') as f:
+            total = int(response.headers.get('Content-Length') or 0)
+            received = 0
+            for block in iter(lambda: response.read(1 << 16), b''):
+                f.write(block)
+                received += len(block)
+                progress(100.0 * received / total if total else None, f"{received / 1e6:.1f} MB recebidos")
+    except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError) as e:
+        print(f"   Download direto falhou ({e}).")
+        return False
+    return True
+
+def _fetch_with_browser(target_path, session, progress=_no_progress):
+    """
+    Baixa o arquivo pela página da B3 num Chromium headless e o salva em `target_path`.
+    Reaproveita os cookies da sessão salva e devolve (storage_state, URL resolvida do arquivo).
+    """
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        try:
+            context = browser.new_context(user_agent=USER_AGENT, storage_state=session.get('storage_state') or None)
             page = context.new_page()
 
             print(f"1. Navegando para a página: {URL_PAGE}")
-            page.goto(URL_PAGE, timeout=9000000)
+            progress(10, "Abrindo a página da B3...")
+            page.goto(URL_PAGE, timeout=PAGE_TIMEOUT_MS)
+
+            # Procuramos pelo texto exato do link: é a forma mais confiável de encontrar o elemento.
+            download_link_selector = page.get_by_text(LINK_TEXT, exact=True)
 
-            # --- MUDANÇA PRINCIPAL AQUI ---
-            # Em vez de procurar por um seletor de href, procuramos pelo texto exato do link.
-            # Esta é a forma mais confiável de encontrar o elemento.
-            download_link_selector = page.get_by_text("Lista Completa de Séries Autorizadas", exact=True)
-            
             print("2. Aguardando o link de download ficar disponível...")
-            download_link_selector.wait_for(state="visible", timeout=6000000)
-            
+            progress(40, "Aguardando o link de download...")
+            download_link_selector.wait_for(state="visible", timeout=LINK_TIMEOUT_MS)
+
             print("3. Iniciando a captura do download e clicando no link...")
-            
-            with page.expect_download(timeout=6000000) as download_info:
+            progress(60, "Baixando pelo navegador...")
+            with page.expect_download(timeout=DOWNLOAD_TIMEOUT_MS) as download_info:
                 download_link_selector.click()
-            
             download = download_info.value
-            
-            if os.path.exists(FILENAME):
-                os.remove(FILENAME)
-                print(f"   Arquivo antigo '{FILENAME}' removido.")
-
-            download.save_as(FILENAME)
-            
-            print(f"\n[SUCESSO] Download concluído! Arquivo salvo como '{FILENAME}'")
-            
+            download.save_as(target_path)
+            return context.storage_state(), download.url
+        finally:
             browser.close()
-            return True
 
+def download_series_autorizadas(force=False, progress=None):
+    """
+    Realiza o download do arquivo "Séries Autorizadas" do site da B3.
+
+    O navegador real (Playwright) contorna proteções complexas (como Cloudflare) que podem
+    bloquear requisições diretas; por isso a sessão dele (cookies) e a URL resolvida do arquivo
+    ficam salvas em SESSION_FILE e são tentadas primeiro com um GET simples.
+
+    O processo é:
+    1. Se o arquivo de hoje já existe e é válido (STATE_FILE), nada é feito (a menos que `force`).
+    2. Tentar o GET direto da URL salva com os cookies salvos.
+    3. Se falhar, navegar até a página de Séries Autorizadas e clicar em "Lista Completa de Séries Autorizadas".
+    4. Salvar o download num arquivo temporário, validar o ZIP e só então substituir o antigo.
+
+    `progress(percent, message)` recebe o andamento (percent None quando o tamanho é desconhecido).
+
+    Retorna:
+        bool: True se o arquivo local estiver atualizado ao final, False caso contrário.
+    """
+    progress = progress or _no_progress
+    print("--- Iniciando download do arquivo de Séries Autorizadas da B3 ---")
+
+    if not force and is_fresh():
+        print(f"[OK] '{FILENAME}' de hoje já está presente e válido. Download dispensado.")
+        return True
+
+    with temporary_sibling(FILENAME, suffix='.part') as tmp_path:
+        started = time.perf_counter()
+        session = read_session()
+        if _fetch_direct(tmp_path, session, progress):
+            ok, reason = validate_series_zip(tmp_path)
+            if ok:
+                return _install_download(tmp_path, started, "direto")
+            print(f"   Resposta do download direto inválida ({reason}). Usando o navegador.")
+        return _download_with_browser(tmp_path, session, started, progress)
+
+def _install_download(tmp_path, started, via):
+    os.replace(tmp_path, FILENAME)
+    write_download_state(FILENAME)
+    print(f"\n[SUCESSO] Download ({via}) concluído em {time.perf_counter() - started:.1f}s! Arquivo salvo como '{FILENAME}'")
+    return True
+
+def _download_with_browser(tmp_path, session, started, progress):
+    try:
+        from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+    except ImportError:
+        print("\n[ERRO] Playwright não está instalado; não há como baixar pelo navegador.")
+        print("   Instale com 'pip install playwright' e 'playwright install chromium'.")
+        return False
+
+    try:
+        storage_state, download_url = _fetch_with_browser(tmp_path, session, progress)
     except PlaywrightTimeoutError:
         print("\n[ERRO] Timeout: A página ou o link de download demorou demais para carregar.")
         print("   Isso pode ser devido a uma conexão lenta ou a uma mudança no site da B3.")
@@ -70,10 +239,22 @@ def download_series_autorizadas():
         print(f"\n[ERRO] Ocorreu um erro inesperado com o Playwright: {e}")
         return False
 
+    ok, reason = validate_series_zip(tmp_path)
+    if not ok:
+        print(f"\n[ERRO] Arquivo baixado inválido ({reason}). O arquivo anterior foi mantido.")
+        return False
+    write_session(storage_state, download_url)
+    return _install_download(tmp_path, started, "navegador")
+
 if __name__ == "__main__":
     print("Executando o script de download de forma autônoma para teste...")
-    success = download_series_autorizadas()
+    progress = None
+    if '--progress-json' in sys.argv[1:]:
+        from pipeline import json_progress
+        progress = json_progress('download')
+    success = download_series_autorizadas(force='--force' in sys.argv[1:], progress=progress)
     if success:
         print("\nTeste finalizado com sucesso.")
     else:
-        print("\nTeste finalizado com erros.")
\ No newline at end of file
+        print("\nTeste finalizado com erros.")
+    sys.exit(0 if success else 1)
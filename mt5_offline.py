@@ -0,0 +1,309 @@
+# mt5_offline.py
+"""
+Substituto offline do pacote MetaTrader5, para rodar e medir app.py / sync.py sem o terminal.
+
+Implementa o subconjunto da API usado pelo projeto (initialize, shutdown, last_error, version,
+account_info, terminal_info, symbols_get, symbol_info, symbol_info_tick, symbol_select) servindo:
+  - metadados de símbolos a partir de um retrato local (OFFLINE_SYMBOLS_FILE), no formato dos
+    registros do MT5 ou no formato de saída de sync.processar_simbolos;
+  - cotações reproduzidas a partir dos arquivos diários gravados por ticks.TickRecorder,
+    com controle de velocidade (1.0 = tempo real, 0 = congelado no último tick do dia).
+
+A API do MT5 não é segura entre threads: quem chama o backend de mais de uma thread do mesmo
+processo (a thread de mercado do app e o sync rodando no pipeline) serializa as chamadas com MT5_LOCK.
+
+Seleção do backend (load_backend): variável de ambiente VECTOR_MT5=offline ou "mt5_backend": "offline"
+no app_settings.json. Dia e velocidade do replay: VECTOR_MT5_REPLAY_DAY / VECTOR_MT5_REPLAY_SPEED ou
+"mt5_replay_day" / "mt5_replay_speed" no app_settings.json.
+
+Captura durante uma sessão real (Windows, com o terminal aberto):
+    python mt5_offline.py capture SEGUNDOS [SÍMBOLO ...]
+"""
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+import ticks
+
+SETTINGS_FILE = "app_settings.json"
+OFFLINE_SYMBOLS_FILE = os.path.join('offline_data', 'symbols.json')
+CAPTURE_POLL_S = 0.25
+# Reentrante: uma leitura de preços pode chamar o registro do Market Watch com o lock já tomado.
+MT5_LOCK = threading.RLock()
+
+# Campos gravados no retrato de símbolos (os que o app e o sync consultam).
+SNAPSHOT_FIELDS = ['name', 'description', 'isin', 'path', 'option_strike', 'expiration_time', 'option_right',
+                   'option_mode', 'digits', 'point', 'trade_contract_size', 'volume_min', 'volume_step']
+
+# Nomes usados por sync.processar_simbolos -> nomes dos atributos do MT5.
+PROCESSAR_SIMBOLOS_FIELDS = {
+    'nome': 'name', 'descricao': 'description', 'isin': 'isin', 'caminho': 'path',
+    'strike_opcao': 'option_strike', 'tempo_expiracao': 'expiration_time', 'direito_opcao': 'option_right',
+    'modo_opcao': 'option_mode', 'digitos': 'digits', 'ponto': 'point',
+}
+
+Tick = namedtuple('Tick', ['time', 'bid', 'ask', 'last', 'volume', 'time_msc', 'flags', 'volume_real'])
+TerminalInfo = namedtuple('TerminalInfo', ['connected', 'name', 'path'])
+AccountInfo = namedtuple('AccountInfo', ['login', 'server', 'currency', 'balance'])
+
+
+class SymbolInfo:
+    """Registro de símbolo com a forma do SymbolInfo do MT5; atributos não gravados valem 0."""
+    def __init__(self, fields):
+        self.__dict__.update(fields)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return 0
+
+    def _asdict(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return f"SymbolInfo(name={self.__dict__.get('name')!r})"
+
+
+class _ReplayState:
+    def __init__(self):
+        self.initialized = False
+        self.last_error = (1, 'Success')
+        self.symbols = {}
+        self.selected = set()
+        self.quotes = {}  # symbol -> (time_msc, bid, ask, last)
+        self.speed = 1.0
+        self.replay_start_msc = 0
+        self.replay_end_msc = 0
+        self.wall_start = 0.0
+
+_state = _ReplayState()
+
+
+def _read_settings():
+    try:
+        with open(SETTINGS_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def load_backend():
+    """Retorna o módulo MT5 a usar: este substituto offline ou o MetaTrader5 real."""
+    settings = _read_settings()
+    backend = os.environ.get('VECTOR_MT5') or settings.get('mt5_backend', 'live')
+    if backend == 'offline':
+        print("Usando o substituto offline do MetaTrader 5.")
+        return sys.modules[__name__]
+    import MetaTrader5
+    return MetaTrader5
+
+
+def _normalize_symbol_record(record):
+    fields = {PROCESSAR_SIMBOLOS_FIELDS.get(key, key): value for key, value in record.items()}
+    expiration = fields.get('expiration_time')
+    if isinstance(expiration, str):
+        fields['expiration_time'] = int(datetime.fromisoformat(expiration).timestamp()) if expiration else 0
+    elif expiration is None:
+        fields['expiration_time'] = 0
+    return fields
+
+
+def load_symbols(path=OFFLINE_SYMBOLS_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    symbols = {}
+    for record in records:
+        fields = _normalize_symbol_record(record)
+        if fields.get('name'):
+            symbols[fields['name']] = fields
+    return symbols
+
+
+def _latest_day():
+    days = ticks.list_days()
+    return days[-1] if days else None
+
+
+def _load_quotes(day):
+    quotes = {}
+    for symbol, data in ticks.load_day(day).items():
+        quotes[symbol] = (data['time'].astype('int64'), data['bid'], data['ask'], data['last'])
+    return quotes
+
+
+# --- API compatível com MetaTrader5 ---
+
+def initialize(*args, **kwargs):
+    settings = _read_settings()
+    _state.symbols = load_symbols()
+    day = os.environ.get('VECTOR_MT5_REPLAY_DAY') or settings.get('mt5_replay_day') or _latest_day()
+    _state.quotes = _load_quotes(day) if day else {}
+    for symbol in _state.quotes:
+        _state.symbols.setdefault(symbol, {'name': symbol})
+    _state.speed = float(os.environ.get('VECTOR_MT5_REPLAY_SPEED', settings.get('mt5_replay_speed', 1.0)))
+    starts = [q[0][0] for q in _state.quotes.values() if len(q[0])]
+    ends = [q[0][-1] for q in _state.quotes.values() if len(q[0])]
+    _state.replay_start_msc = int(min(starts)) if starts else 0
+    _state.replay_end_msc = int(max(ends)) if ends else 0
+    _state.wall_start = time.monotonic()
+    _state.initialized = True
+    _state.last_error = (1, 'Success')
+    print(f"MT5 offline: {len(_state.symbols)} símbolos, {len(_state.quotes)} com cotações (dia {day or 'N/D'}, velocidade {_state.speed}x).")
+    return True
+
+
+def shutdown():
+    _state.initialized = False
+    return True
+
+
+def last_error():
+    return _state.last_error
+
+
+def version():
+    return (500, 0, 'offline')
+
+
+def terminal_info():
+    if not _state.initialized:
+        return None
+    return TerminalInfo(connected=True, name='MT5 offline', path=os.getcwd())
+
+
+def account_info():
+    if not _state.initialized:
+        return None
+    return AccountInfo(login=0, server='offline', currency='BRL', balance=0.0)
+
+
+def _matches_group(name, group):
+    patterns = [p.strip() for p in group.split(',') if p.strip()]
+    matched = False
+    for pattern in patterns:
+        if pattern.startswith('!'):
+            if fnmatch.fnmatchcase(name, pattern[1:]):
+                return False
+        elif fnmatch.fnmatchcase(name, pattern):
+            matched = True
+    return matched
+
+
+def symbols_get(group=None):
+    if not _state.initialized:
+        return None
+    names = _state.symbols if group is None else [n for n in _state.symbols if _matches_group(n, group)]
+    return tuple(symbol_info(name) for name in names)
+
+
+def symbol_info(symbol):
+    fields = _state.symbols.get(symbol) if _state.initialized else None
+    if fields is None:
+        return None
+    info = dict(fields)
+    info['select'] = info['visible'] = symbol in _state.selected
+    tick = symbol_info_tick(symbol)
+    if tick is not None:
+        info.update(bid=tick.bid, ask=tick.ask, last=tick.last, time=tick.time)
+    return SymbolInfo(info)
+
+
+def symbol_select(symbol, enable=True):
+    if not _state.initialized or symbol not in _state.symbols:
+        return False
+    if enable:
+        _state.selected.add(symbol)
+    else:
+        _state.selected.discard(symbol)
+    return True
+
+
+def replay_time_msc():
+    """Instante atual do replay (epoch em ms)."""
+    if _state.speed <= 0:
+        return _state.replay_end_msc
+    elapsed_ms = (time.monotonic() - _state.wall_start) * 1000 * _state.speed
+    return int(_state.replay_start_msc + elapsed_ms)
+
+
+def set_replay_speed(speed):
+    """Muda a velocidade do replay sem saltar no tempo (0 congela no último tick do dia)."""
+    now_msc = replay_time_msc()
+    _state.speed = float(speed)
+    if _state.speed > 0:
+        _state.replay_start_msc = now_msc
+        _state.wall_start = time.monotonic()
+
+
+def symbol_info_tick(symbol):
+    quote = _state.quotes.get(symbol) if _state.initialized else None
+    if quote is None:
+        return None
+    times, bids, asks, lasts = quote
+    idx = int(np.searchsorted(times, replay_time_msc(), side='right')) - 1
+    if idx < 0:
+        return None
+    time_msc = int(times[idx])
+    return Tick(time=time_msc // 1000, bid=float(bids[idx]), ask=float(asks[idx]), last=float(lasts[idx]),
+                volume=0, time_msc=time_msc, flags=0, volume_real=0.0)
+
+
+# --- Captura numa sessão real ---
+
+def capture_symbols(live_mt5, path=OFFLINE_SYMBOLS_FILE):
+    """Grava o retrato de metadados de todos os símbolos do terminal real."""
+    records = [{field: getattr(s, field) for field in SNAPSHOT_FIELDS} for s in live_mt5.symbols_get()]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False)
+    print(f"Retrato de {len(records)} símbolos salvo em '{path}'.")
+
+
+def capture_quotes(live_mt5, symbols, seconds):
+    """Grava as cotações dos símbolos por `seconds` segundos nos arquivos diários de ticks."""
+    recorder = ticks.TickRecorder()
+    recorder.enabled = True
+    for symbol in symbols:
+        live_mt5.symbol_select(symbol, True)
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for symbol in symbols:
+            recorder.record(symbol, live_mt5.symbol_info_tick(symbol))
+        recorder.flush_if_due()
+        time.sleep(CAPTURE_POLL_S)
+    recorder.close()
+    print(f"Cotações de {len(symbols)} símbolos gravadas em '{recorder.directory}'.")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='mt5_offline.py', description="Captura símbolos e cotações de um terminal MT5 real para o modo offline.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    capture = commands.add_parser('capture', help=f"grava o retrato dos símbolos em {OFFLINE_SYMBOLS_FILE} e as cotações dos SÍMBOLOS")
+    capture.add_argument('segundos', type=float, help="duração da captura de cotações")
+    capture.add_argument('simbolos', nargs='*', metavar='SÍMBOLO', help="símbolos cujas cotações são gravadas")
+    args = parser.parse_args(argv)
+    import MetaTrader5 as live_mt5
+    if not live_mt5.initialize():
+        print(f"Erro ao inicializar MT5: {live_mt5.last_error()}")
+        return 1
+    try:
+        capture_symbols(live_mt5)
+        if args.simbolos:
+            capture_quotes(live_mt5, args.simbolos, args.segundos)
+    finally:
+        live_mt5.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,19 @@
 import os
+import hashlib
+import json
+import time
 import pdfplumber
 import re
 import logging
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+
+from atomic import atomic_write
 
 # --- CONFIGURAÇÕES ---
 # CAMINHO_DIRETORIO = "notas_de_corretagem" # Removed
@@ -13,6 +25,36 @@ CAMPOS_TAXAS = [
     "Total Bovespa / Soma",
     "Total corretagem / Despesas"
 ]
+# Colunas da tabela de taxas por nota (valores em centavos).
+COLUNAS_TAXAS = {
+    "Taxa de liquidação": 'taxa_liquidacao',
+    "Taxa de Registro": 'taxa_registro',
+    "Total Bovespa / Soma": 'total_bovespa',
+    "Total corretagem / Despesas": 'total_corretagem',
+}
+
+# Leitura dos PDFs em paralelo (pdfplumber é CPU-bound): um processo por arquivo, no máximo este número de processos.
+# VECTOR_NOTAS_WORKERS=1 força a leitura serial, no próprio processo.
+# Os processos são sempre criados por spawn (também fora do Windows): o notas roda dentro do app,
+# que tem threads (Tk, mercado, pipeline) e conexão MT5, e um fork herdaria esse estado pela metade.
+# O spawn reimporta o script principal como __mp_main__; o app.py só cria o estado dele em init_runtime().
+MAX_PROCESSOS_PDF = int(os.environ.get('VECTOR_NOTAS_WORKERS', 0)) or min(4, os.cpu_count() or 1)
+
+# Cache do texto extraído de cada PDF, indexado pelo SHA-256 do arquivo (notas emitidas não mudam).
+# Mudar a extração (ler_texto_pdf) exige incrementar VERSAO_EXTRACAO; o cache também é descartado
+# quando muda a versão do pdfplumber.
+CACHE_PDFS_FILE = 'notas_cache.json'
+VERSAO_EXTRACAO = 1
+# Formato do arquivo colunar (ARQUIVO_SAIDA_COLUNAR) lido pelo relat.py; incrementar ao mudar as colunas.
+# Desde a versão 2 ele guarda o SHA-256 do TXT gravado junto ('sha256_txt'): o relat só usa o
+# colunar enquanto o TXT for o mesmo (um TXT editado à mão ou regravado por outro caminho vence).
+VERSAO_COLUNAR = 2
+
+# Linhas do TXT + tabelas tipadas ({coluna: lista}) da mesma extração; as transações seguem a ordem do TXT.
+NotasExtraidas = namedtuple('NotasExtraidas', ['linhas', 'transacoes', 'taxas'])
+
+# Páginas que levam mais que isto (interpretação + montagem do texto) saem como aviso no log.
+PAGINA_LENTA_S = 2.0
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
@@ -20,12 +62,14 @@ CONFIGURATIONS = [
     {
         'person_type': 'M',
         'CAMINHO_DIRETORIO': os.path.join('notasm', 'notas_de_corretagem'),
-        'ARQUIVO_SAIDA_TXT': 'notas_extraidas_m.txt'
+        'ARQUIVO_SAIDA_TXT': 'notas_extraidas_m.txt',
+        'ARQUIVO_SAIDA_COLUNAR': 'notas_extraidas_m.npz'
     },
     {
         'person_type': 'R',
         'CAMINHO_DIRETORIO': os.path.join('notasr', 'notas_de_corretagem'),
-        'ARQUIVO_SAIDA_TXT': 'notas_extraidas_r.txt'
+        'ARQUIVO_SAIDA_TXT': 'notas_extraidas_r.txt',
+        'ARQUIVO_SAIDA_COLUNAR': 'notas_extraidas_r.npz'
     }
 ]
 
@@ -39,150 +83,481 @@ def limpar_numero(texto_numero):
     except (ValueError, AttributeError):
         return 0.0
 
+def centavos(texto_numero):
+    """'2.475,51' -> 247551 (int). Levanta ValueError se o texto não for um número no formato brasileiro."""
+    inteiro, _, decimais = texto_numero.partition(',')
+    try:
+        valor = Decimal(f"{inteiro.replace('.', '')}.{decimais or '0'}")
+    except ArithmeticError:
+        raise ValueError(f"valor inválido: '{texto_numero}'")
+    return int((valor * 100).to_integral_value())
+
+# Linhas de negócio: mercado à vista ("VISTA <ativo> ...") ou opções ("<prazo MM/AA> <ativo> ...").
+PADROES_NEGOCIO = [
+    re.compile(r"VISTA\s+(.+?)\s+([\d\.]+)\s+([\d,]+)\s+([\d\.,]+)\s+([CD])$"),
+    re.compile(r"\d{2}\/\d{2}\s+(\S+).+?([\d\.]+)\s+([\d,]+)\s+([\d\.,]+)\s+([CD])$")
+]
+PADRAO_PRAZO = re.compile(r"\d{2}\/\d{2}\s+(\S+)")
+PADROES_TAXAS = {campo: re.compile(re.escape(campo) + r'\s+(\S+)') for campo in CAMPOS_TAXAS}
+MARCA_INICIO_NEGOCIOS = "Negócios realizados"
+MARCA_FIM_NEGOCIOS = "Resumo dos Negócios"
+DIGITOS_QUANTIDADE, DIGITOS_PRECO, DIGITOS_VALOR = "0123456789.", "0123456789,", "0123456789.,"
+
 def parse_bloco_negocios(bloco_texto):
     """
     Analisa o bloco de texto de negociações e retorna uma lista de dicionários,
     com os dados de cada transação de forma estruturada para cálculos.
     """
+    return parse_linhas_negocios(bloco_texto.split('\n'))
+
+def _campos_negocio(linha_strip):
+    """
+    Grupos (ativo, quantidade, preço, valor, D/C) de uma linha de negócio, lendo os quatro últimos
+    campos da linha primeiro. Devolve None se a linha não é de negócio e ... (Ellipsis) quando só os
+    PADROES_NEGOCIO decidem (casos fora do formato usual, ex.: quantidade colada em outro texto).
+    """
+    campos = linha_strip.rsplit(None, 4)
+    if len(campos) < 5:
+        return None
+    inicio, quantidade, preco, valor, lado = campos
+    if lado not in ('C', 'D') or preco.strip(DIGITOS_PRECO) or valor.strip(DIGITOS_VALOR):
+        return None
+    if quantidade.strip(DIGITOS_QUANTIDADE):
+        return ...
+    posicao_vista = inicio.find("VISTA")
+    if posicao_vista >= 0:
+        ativo = inicio[posicao_vista + 5:]
+        if not ativo[:1].isspace() or not ativo.strip():
+            return ...
+        return ativo.lstrip(), quantidade, preco, valor, lado
+    prazo = PADRAO_PRAZO.search(linha_strip)
+    if prazo is None:
+        return None
+    if prazo.end() > len(inicio):
+        return ...
+    return prazo.group(1), quantidade, preco, valor, lado
+
+def parse_linhas_negocios(linhas):
+    """
+    parse_bloco_negocios sobre linhas já separadas. Cada linha é lida de trás para frente
+    (D/C, valor, preço, quantidade) e o ativo vem do trecho após "VISTA" ou do campo após o prazo;
+    o resultado é o mesmo dos PADROES_NEGOCIO, que só são usados nas linhas fora do formato usual.
+    """
     transacoes_encontradas = []
-    padroes = [
-        re.compile(r"VISTA\s+(.+?)\s+([\d\.]+)\s+([\d,]+)\s+([\d\.,]+)\s+([CD])$"),
-        re.compile(r"\d{2}\/\d{2}\s+(\S+).+?([\d\.]+)\s+([\d,]+)\s+([\d\.,]+)\s+([CD])$")
-    ]
-    for linha in bloco_texto.split('\n'):
+    for linha in linhas:
         linha_strip = linha.strip()
         if not linha_strip or linha_strip.startswith("Q Negociação"): continue
-        for padrao in padroes:
-            match = padrao.search(linha_strip)
-            if match:
-                try:
-                    transacao = {
-                        'tipo': match.group(5),
-                        'ativo': match.group(1).strip().replace("  ", " "),
-                        'quantidade_str': match.group(2),
-                        'preco_str': match.group(3),
-                        'valor_op_str': match.group(4),
-                        'valor_op_num': limpar_numero(match.group(4))
-                    }
-                    transacoes_encontradas.append(transacao)
+        grupos = _campos_negocio(linha_strip)
+        if grupos is ...:
+            grupos = None
+            for padrao in PADROES_NEGOCIO:
+                match = padrao.search(linha_strip)
+                if match:
+                    grupos = match.groups()
                     break
-                except IndexError:
-                    logging.warning(f"Regex encontrou uma linha, mas falhou ao extrair grupos: '{linha_strip}'")
+        if grupos is None:
+            continue
+        ativo, quantidade, preco, valor, lado = grupos
+        transacoes_encontradas.append({
+            'tipo': lado,
+            'ativo': ativo.strip().replace("  ", " "),
+            'quantidade_str': quantidade,
+            'preco_str': preco,
+            'valor_op_str': valor,
+            'valor_op_num': limpar_numero(valor)
+        })
     return transacoes_encontradas
 
 
-def processar_arquivos_pdf():
+def listar_pdfs(diretorio):
+    if not os.path.isdir(diretorio):
+        return []
+    return sorted([f for f in os.listdir(diretorio) if f.lower().endswith('.pdf')])
+
+
+def ler_texto_pdf(caminho_completo):
     """
-    Função principal que orquestra a leitura, processamento, cálculo e escrita.
-    Itera sobre as configurações definidas em CONFIGURATIONS.
+    Texto de todas as páginas de um PDF, montado uma única vez por página.
+    Roda nos processos de trabalho, por isso devolve (texto, None, tempos) ou
+    (None, mensagem de erro, tempos) em vez de levantar a exceção.
+    `tempos` tem (interpretação, montagem do texto) em segundos para cada página lida.
     """
-    for config in CONFIGURATIONS:
-        CAMINHO_DIRETORIO = config['CAMINHO_DIRETORIO']
-        ARQUIVO_SAIDA_TXT = config['ARQUIVO_SAIDA_TXT']
-        logging.info(f"--- Processando para {config['person_type']} ---")
-        if not os.path.isdir(CAMINHO_DIRETORIO):
-            logging.error(f"O diretório '{CAMINHO_DIRETORIO}' para {config['person_type']} não foi encontrado.")
-            continue # Pula para a próxima configuração
+    textos_paginas, tempos = [], []
+    try:
+        with pdfplumber.open(caminho_completo) as pdf:
+            for pagina in pdf.pages:
+                inicio = time.perf_counter()
+                pagina.chars  # interpreta o conteúdo da página (a maior parte do tempo)
+                interpretada = time.perf_counter()
+                texto = pagina.extract_text()
+                tempos.append((interpretada - inicio, time.perf_counter() - interpretada))
+                pagina.close()
+                if texto:
+                    textos_paginas.append(texto)
+        return "\n".join(textos_paginas), None, tempos
+    except Exception as e:
+        return None, str(e), tempos
 
-        notas_agrupadas = {}
-        arquivos_pdf = sorted([f for f in os.listdir(CAMINHO_DIRETORIO) if f.lower().endswith('.pdf')])
-        logging.info(f"Encontrados {len(arquivos_pdf)} arquivos PDF para processar em {CAMINHO_DIRETORIO}.")
 
-        for nome_arquivo in arquivos_pdf:
-            caminho_completo = os.path.join(CAMINHO_DIRETORIO, nome_arquivo)
-            try:
-                with pdfplumber.open(caminho_completo) as pdf:
-                    texto_completo = "\n".join([p.extract_text() for p in pdf.pages if p.extract_text()])
-                # Extrai o número da nota da primeira página para agrupar corretamente
-                primeira_linha_dados = texto_completo.split('\n')[2]
-                numero_nota = primeira_linha_dados.split()[0].strip()
-
-                if numero_nota not in notas_agrupadas:
-                    notas_agrupadas[numero_nota] = {'texto_completo': '', 'arquivos': []}
-
-                notas_agrupadas[numero_nota]['texto_completo'] += texto_completo + "\n"
-                notas_agrupadas[numero_nota]['arquivos'].append(nome_arquivo)
-            except Exception as e:
-                logging.error(f"Ocorreu um erro fatal ao ler '{nome_arquivo}': {e}")
-
-        resultados_finais_formatados = []
-        for numero_nota, dados_nota in notas_agrupadas.items():
-            logging.info(f"=== Processando e Calculando Nota: {numero_nota} para {config['person_type']} ===")
-            texto_consolidado = dados_nota['texto_completo']
-            nomes_arquivos = ", ".join(dados_nota['arquivos'])
-
-            # --- NOVA LÓGICA: EXTRAIR DATA DO PREGÃO ---
-            data_pregao = "N/D"
-            try:
-                # A linha 3 (índice 2) contém: Nr.Nota Folha Data
-                partes_linha_dados = texto_consolidado.split('\n')[2].split()
-                if len(partes_linha_dados) >= 3:
-                    data_pregao = partes_linha_dados[2]
-            except IndexError:
-                logging.warning(f"Não foi possível extrair a data do pregão para a nota {numero_nota}.")
-
-            # --- Cálculo das despesas (permanece igual) ---
-            total_despesas_nota = 0.0
-            taxas_para_exibir = {}
-            for campo in CAMPOS_TAXAS:
-                match = re.search(re.escape(campo) + r'\s+(\S+)', texto_consolidado)
-                valor_str = match.group(1) if match else "0,00"
-                taxas_para_exibir[campo] = valor_str
-                total_despesas_nota += limpar_numero(valor_str)
-            logging.info(f"Despesas totais da nota {numero_nota}: {total_despesas_nota:.2f}")
-
-            # --- Extração das transações (permanece igual) ---
-            todos_blocos_de_negocios = ""
-            partes = texto_consolidado.split("Negócios realizados")
-            for i, parte in enumerate(partes):
-                if i > 0 and "Resumo dos Negócios" in parte:
-                    todos_blocos_de_negocios += parte.split("Resumo dos Negócios")[0] + "\n"
-
-            transacoes = parse_bloco_negocios(todos_blocos_de_negocios)
-            logging.info(f"Encontradas {len(transacoes)} transações na nota {numero_nota}.")
-
-            # --- Cálculo do rateio (permanece igual) ---
-            if transacoes:
-                valor_total_operacoes_nota = sum(t['valor_op_num'] for t in transacoes)
-                for t in transacoes:
-                    despesa_proporcional = 0.0
-                    if valor_total_operacoes_nota > 0:
-                        proporcao = t['valor_op_num'] / valor_total_operacoes_nota
-                        despesa_proporcional = total_despesas_nota * proporcao
-
-                    if t['tipo'] == 'D':
-                        valor_final_num = t['valor_op_num'] + despesa_proporcional
-                    else:
-                        valor_final_num = t['valor_op_num'] - despesa_proporcional
-
-                    t['valor_final_calculado'] = valor_final_num
-
-            # --- MONTAGEM DA SAÍDA FINAL (COM A NOVA COLUNA DE DATA) ---
-            resultados_finais_formatados.append(f"--- Nota: {numero_nota} (Arquivos: {nomes_arquivos}) ---")
-            for campo, valor in taxas_para_exibir.items():
-                resultados_finais_formatados.append(f"{campo}: {valor}")
+def registrar_tempos(nome_arquivo, tempos):
+    """Loga o tempo de leitura de cada página de um PDF, com aviso para as lentas."""
+    total = sum(interpretacao + montagem for interpretacao, montagem in tempos)
+    por_pagina = ", ".join(f"{interpretacao + montagem:.2f}" for interpretacao, montagem in tempos)
+    logging.info(f"'{nome_arquivo}': {len(tempos)} página(s) em {total:.2f}s (por página: {por_pagina})")
+    for numero, (interpretacao, montagem) in enumerate(tempos, 1):
+        if interpretacao + montagem > PAGINA_LENTA_S:
+            logging.warning(f"Página {numero} de '{nome_arquivo}' lenta: {interpretacao:.2f}s interpretando, {montagem:.2f}s montando o texto.")
+
+
+def sha256_arquivo(caminho):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def versao_parser():
+    return f"{VERSAO_EXTRACAO}/pdfplumber-{pdfplumber.__version__}"
+
+
+def ler_cache_pdfs(caminho_cache=CACHE_PDFS_FILE):
+    """{sha256: texto} do cache, vazio se ausente, corrompido ou de outra versão do parser."""
+    try:
+        with open(caminho_cache, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if cache.get('versao_parser') != versao_parser():
+        logging.info(f"Cache de PDFs '{caminho_cache}' é de outra versão do parser; os PDFs serão lidos de novo.")
+        return {}
+    return cache.get('textos', {})
+
+
+def gravar_cache_pdfs(textos_por_hash, caminho_cache=CACHE_PDFS_FILE):
+    with atomic_write(caminho_cache, 'w', encoding='utf-8') as f:
+        json.dump({'versao_parser': versao_parser(), 'textos': textos_por_hash}, f, ensure_ascii=False)
+
+
+def ler_textos_pdfs(caminhos, ao_ler_arquivo=None, max_processos=MAX_PROCESSOS_PDF, caminho_cache=CACHE_PDFS_FILE):
+    """
+    Texto de cada PDF de `caminhos`, como {caminho: (texto, erro)}.
+
+    PDFs já vistos (mesmo SHA-256) vêm do cache em `caminho_cache` (None desliga o cache); os
+    novos são lidos com uma tarefa por arquivo, até `max_processos` processos, e entram no cache
+    se a leitura deu certo. Quem consome percorre na ordem de `caminhos`, então o resultado
+    não depende da ordem em que os processos terminam.
+    `ao_ler_arquivo(nome_arquivo)` é chamado a cada PDF obtido, na ordem de término.
+    """
+    cache = ler_cache_pdfs(caminho_cache) if caminho_cache else {}
+    hashes = {caminho: sha256_arquivo(caminho) for caminho in caminhos} if caminho_cache else {}
+    textos = {}
+    for caminho, hash_arquivo in hashes.items():
+        if hash_arquivo in cache:
+            textos[caminho] = (cache[hash_arquivo], None)
+            if ao_ler_arquivo:
+                ao_ler_arquivo(os.path.basename(caminho))
+    novos = [caminho for caminho in caminhos if caminho not in textos]
+    textos.update(_extrair_textos(novos, ao_ler_arquivo, max_processos))
+    logging.info(f"PDFs: {len(caminhos) - len(novos)} do cache, {len(novos)} lidos agora.")
+
+    if caminho_cache:
+        lidos = {hashes[caminho]: textos[caminho][0] for caminho in novos if textos[caminho][1] is None}
+        if lidos:
+            cache.update(lidos)
+            gravar_cache_pdfs(cache, caminho_cache)
+    return textos
+
+
+def _extrair_textos(caminhos, ao_ler_arquivo, max_processos):
+    """Lê os PDFs de `caminhos` (uma tarefa por arquivo, até `max_processos` processos) -> {caminho: (texto, erro)}."""
+    textos = {}
+    if not caminhos:
+        return textos
+    if max_processos <= 1 or len(caminhos) <= 1:
+        for caminho in caminhos:
+            texto, erro, tempos = ler_texto_pdf(caminho)
+            textos[caminho] = (texto, erro)
+            registrar_tempos(os.path.basename(caminho), tempos)
+            if ao_ler_arquivo:
+                ao_ler_arquivo(os.path.basename(caminho))
+        return textos
+
+    executor = ProcessPoolExecutor(max_workers=min(max_processos, len(caminhos)), mp_context=multiprocessing.get_context('spawn'))
+    try:
+        futuros = {executor.submit(ler_texto_pdf, caminho): caminho for caminho in caminhos}
+        for futuro in as_completed(futuros):
+            caminho = futuros[futuro]
+            texto, erro, tempos = futuro.result()
+            textos[caminho] = (texto, erro)
+            registrar_tempos(os.path.basename(caminho), tempos)
+            if ao_ler_arquivo:
+                ao_ler_arquivo(os.path.basename(caminho))
+    except BaseException:
+        # Cancelamento (ou falha do pool): não espera os PDFs que ainda estão na fila.
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return textos
+
+
+def analisar_nota(texto_consolidado):
+    """
+    Lê de uma vez o cabeçalho, as taxas e o bloco de negócios do texto de uma nota e devolve
+    (partes da linha de cabeçalho ou None, {campo de CAMPOS_TAXAS: valor em texto}, linhas de negócios).
+
+      - cabeçalho: terceira linha do texto (Nr.Nota Folha Data);
+      - taxas: primeira ocorrência de `campo` seguida de espaço e de um valor (PADROES_TAXAS), "0,00" se não houver;
+      - negócios: o trecho entre cada "Negócios realizados" e o primeiro "Resumo dos Negócios"
+        antes do próximo "Negócios realizados"; blocos sem "Resumo dos Negócios" são descartados.
+        Um cursor percorre o texto de marcador em marcador, sem montar cópias do texto.
+    """
+    texto = texto_consolidado
+    cabecalho = None
+    fim_linha_1 = texto.find('\n')
+    fim_linha_2 = texto.find('\n', fim_linha_1 + 1) if fim_linha_1 >= 0 else -1
+    if fim_linha_2 >= 0:
+        fim_linha_3 = texto.find('\n', fim_linha_2 + 1)
+        cabecalho = texto[fim_linha_2 + 1:fim_linha_3 if fim_linha_3 >= 0 else len(texto)].split()
 
+    taxas = {}
+    for campo, padrao in PADROES_TAXAS.items():
+        match = padrao.search(texto)
+        taxas[campo] = match.group(1) if match else "0,00"
+
+    linhas_negocios = []
+    marca = texto.find(MARCA_INICIO_NEGOCIOS)
+    while marca >= 0:
+        inicio = marca + len(MARCA_INICIO_NEGOCIOS)
+        marca = texto.find(MARCA_INICIO_NEGOCIOS, inicio)
+        fim = texto.find(MARCA_FIM_NEGOCIOS, inicio, marca if marca >= 0 else len(texto))
+        if fim >= 0:
+            linhas_negocios.extend(texto[inicio:fim].split('\n'))
+    return cabecalho, taxas, linhas_negocios
+
+
+def nova_tabela_transacoes():
+    return {'nota': [], 'data': [], 'lado': [], 'ticker': [], 'quantidade': [], 'preco': [],
+            'bruto_centavos': [], 'liquido_centavos': []}
+
+
+def nova_tabela_taxas():
+    tabela = {'nota': [], 'data': [], 'arquivos': []}
+    tabela.update({coluna: [] for coluna in COLUNAS_TAXAS.values()})
+    tabela['total_despesas'] = []
+    return tabela
+
+
+def extrair_notas(config, ao_ler_arquivo=None, textos=None):
+    """
+    Lê os PDFs do diretório de uma configuração e devolve NotasExtraidas: as linhas do arquivo de
+    saída (mesmo conteúdo gravado em ARQUIVO_SAIDA_TXT) e as tabelas de transações e de taxas por
+    nota, já convertidas; ou None se o diretório não existir.
+    `ao_ler_arquivo(nome_arquivo)` é chamado depois de cada PDF lido.
+    `textos` ({caminho: (texto, erro)} de ler_textos_pdfs) evita ler de novo PDFs já lidos.
+    """
+    CAMINHO_DIRETORIO = config['CAMINHO_DIRETORIO']
+    logging.info(f"--- Processando para {config['person_type']} ---")
+    if not os.path.isdir(CAMINHO_DIRETORIO):
+        logging.error(f"O diretório '{CAMINHO_DIRETORIO}' para {config['person_type']} não foi encontrado.")
+        return None
+
+    notas_agrupadas = {}
+    arquivos_pdf = listar_pdfs(CAMINHO_DIRETORIO)
+    logging.info(f"Encontrados {len(arquivos_pdf)} arquivos PDF para processar em {CAMINHO_DIRETORIO}.")
+    caminhos = [os.path.join(CAMINHO_DIRETORIO, nome_arquivo) for nome_arquivo in arquivos_pdf]
+    if textos is None:
+        textos = ler_textos_pdfs(caminhos, ao_ler_arquivo)
+
+    for nome_arquivo, caminho_completo in zip(arquivos_pdf, caminhos):
+        try:
+            texto_completo, erro = textos[caminho_completo]
+            if erro is not None:
+                raise Exception(erro)
+            # Extrai o número da nota da primeira página para agrupar corretamente
+            primeira_linha_dados = texto_completo.split('\n')[2]
+            numero_nota = primeira_linha_dados.split()[0].strip()
+
+            if numero_nota not in notas_agrupadas:
+                notas_agrupadas[numero_nota] = {'texto_completo': '', 'arquivos': []}
+
+            notas_agrupadas[numero_nota]['texto_completo'] += texto_completo + "\n"
+            notas_agrupadas[numero_nota]['arquivos'].append(nome_arquivo)
+        except Exception as e:
+            logging.error(f"Ocorreu um erro fatal ao ler '{nome_arquivo}': {e}")
+
+    resultados_finais_formatados = []
+    tabela_transacoes, tabela_taxas = nova_tabela_transacoes(), nova_tabela_taxas()
+    for numero_nota, dados_nota in notas_agrupadas.items():
+        logging.info(f"=== Processando e Calculando Nota: {numero_nota} para {config['person_type']} ===")
+        texto_consolidado = dados_nota['texto_completo']
+        nomes_arquivos = ", ".join(dados_nota['arquivos'])
+
+        # Cabeçalho, taxas e bloco de negócios numa única passada pelo texto.
+        partes_linha_dados, taxas_para_exibir, linhas_negocios = analisar_nota(texto_consolidado)
+
+        # --- NOVA LÓGICA: EXTRAIR DATA DO PREGÃO ---
+        data_pregao = "N/D"
+        # A linha 3 (índice 2) contém: Nr.Nota Folha Data
+        if partes_linha_dados is None:
+            logging.warning(f"Não foi possível extrair a data do pregão para a nota {numero_nota}.")
+        elif len(partes_linha_dados) >= 3:
+            data_pregao = partes_linha_dados[2]
+
+        # --- Cálculo das despesas (permanece igual) ---
+        total_despesas_nota = 0.0
+        for valor_str in taxas_para_exibir.values():
+            total_despesas_nota += limpar_numero(valor_str)
+        logging.info(f"Despesas totais da nota {numero_nota}: {total_despesas_nota:.2f}")
+
+        # --- Extração das transações (permanece igual) ---
+        transacoes = parse_linhas_negocios(linhas_negocios)
+        logging.info(f"Encontradas {len(transacoes)} transações na nota {numero_nota}.")
+
+        # --- Cálculo do rateio (permanece igual) ---
+        if transacoes:
+            valor_total_operacoes_nota = sum(t['valor_op_num'] for t in transacoes)
             for t in transacoes:
-                # *** ALTERAÇÃO SOLICITADA: Ignorar ativos que começam com "FI" na geração do arquivo final ***
-                if t['ativo'].strip().startswith("FI"):
-                    continue # Pula para a próxima transação, ignorando esta
+                despesa_proporcional = 0.0
+                if valor_total_operacoes_nota > 0:
+                    proporcao = t['valor_op_num'] / valor_total_operacoes_nota
+                    despesa_proporcional = total_despesas_nota * proporcao
+
+                if t['tipo'] == 'D':
+                    valor_final_num = t['valor_op_num'] + despesa_proporcional
+                else:
+                    valor_final_num = t['valor_op_num'] - despesa_proporcional
+
+                t['valor_final_calculado'] = valor_final_num
+
+        try:
+            data_nota = np.datetime64(datetime.strptime(data_pregao, '%d/%m/%Y').date(), 'D')
+        except ValueError:
+            data_nota = None
+            logging.warning(f"Data do pregão '{data_pregao}' inválida na nota {numero_nota}; a nota fica fora do arquivo colunar.")
+        if data_nota is not None:
+            try:
+                valores_taxas = [centavos(taxas_para_exibir[campo]) for campo in COLUNAS_TAXAS]
+            except ValueError as e:
+                logging.warning(f"Taxa inválida na nota {numero_nota} ({e}); gravada como zero no arquivo colunar.")
+                valores_taxas = [0] * len(COLUNAS_TAXAS)
+            tabela_taxas['nota'].append(numero_nota)
+            tabela_taxas['data'].append(data_nota)
+            tabela_taxas['arquivos'].append(nomes_arquivos)
+            for coluna, valor in zip(COLUNAS_TAXAS.values(), valores_taxas):
+                tabela_taxas[coluna].append(valor)
+            tabela_taxas['total_despesas'].append(sum(valores_taxas))
+
+        # --- MONTAGEM DA SAÍDA FINAL (COM A NOVA COLUNA DE DATA) ---
+        resultados_finais_formatados.append(f"--- Nota: {numero_nota} (Arquivos: {nomes_arquivos}) ---")
+        for campo, valor in taxas_para_exibir.items():
+            resultados_finais_formatados.append(f"{campo}: {valor}")
 
-                valor_final_calculado = t.get('valor_final_calculado', t['valor_op_num'])
-                valor_final_str = f"{valor_final_calculado:_.2f}".replace('.',',').replace('_','.')
+        for t in transacoes:
+            # *** ALTERAÇÃO SOLICITADA: Ignorar ativos que começam com "FI" na geração do arquivo final ***
+            if t['ativo'].strip().startswith("FI"):
+                continue # Pula para a próxima transação, ignorando esta
 
-                # Formato da linha atualizado para incluir a data do pregão
-                linha_formatada = (f"{t['tipo']}|{t['ativo']}|{data_pregao}|{t['quantidade_str']}|"
-                                   f"{t['preco_str']}|{t['valor_op_str']}|{valor_final_str}")
-                resultados_finais_formatados.append(linha_formatada)
+            valor_final_calculado = t.get('valor_final_calculado', t['valor_op_num'])
+            valor_final_str = f"{valor_final_calculado:_.2f}".replace('.',',').replace('_','.')
 
-            resultados_finais_formatados.append("")
+            # Formato da linha atualizado para incluir a data do pregão
+            linha_formatada = (f"{t['tipo']}|{t['ativo']}|{data_pregao}|{t['quantidade_str']}|"
+                               f"{t['preco_str']}|{t['valor_op_str']}|{valor_final_str}")
+            resultados_finais_formatados.append(linha_formatada)
 
-        if resultados_finais_formatados: # Certifique-se de que esta verificação está dentro do loop de config
+            if data_nota is not None:
+                try:
+                    linha_tipada = (int(t['quantidade_str'].replace('.', '')),
+                                    float(t['preco_str'].replace('.', '').replace(',', '.')),
+                                    centavos(t['valor_op_str']), centavos(valor_final_str))
+                except ValueError as e:
+                    logging.warning(f"Transação ignorada no arquivo colunar ({e}): '{linha_formatada}'")
+                    continue
+                tabela_transacoes['nota'].append(numero_nota)
+                tabela_transacoes['data'].append(data_nota)
+                tabela_transacoes['lado'].append(t['tipo'])
+                tabela_transacoes['ticker'].append(t['ativo'])
+                for coluna, valor in zip(('quantidade', 'preco', 'bruto_centavos', 'liquido_centavos'), linha_tipada):
+                    tabela_transacoes[coluna].append(valor)
+
+        resultados_finais_formatados.append("")
+
+    return NotasExtraidas(resultados_finais_formatados, tabela_transacoes, tabela_taxas)
+
+
+def _colunas(tabela, tipos):
+    return {coluna: np.array(valores, dtype=tipos.get(coluna, np.str_)) for coluna, valores in tabela.items()}
+
+
+def colunas_transacoes(tabela):
+    """Tabela de transações (listas) -> colunas NumPy tipadas."""
+    return _colunas(tabela, {'data': 'datetime64[D]', 'quantidade': np.int64, 'preco': np.float64,
+                             'bruto_centavos': np.int64, 'liquido_centavos': np.int64})
+
+
+def colunas_taxas(tabela):
+    """Tabela de taxas por nota (listas) -> colunas NumPy tipadas."""
+    tipos = {coluna: np.int64 for coluna in COLUNAS_TAXAS.values()}
+    tipos.update({'data': 'datetime64[D]', 'total_despesas': np.int64})
+    return _colunas(tabela, tipos)
+
+
+def gravar_colunar(caminho, transacoes, taxas, sha256_txt):
+    """
+    Grava as colunas de transações e de taxas (prefixos 'transacoes/' e 'taxas/') num .npz,
+    com troca atômica, junto com o SHA-256 do TXT da mesma extração. Lido por relat.load_columnar_trades.
+    """
+    with atomic_write(caminho) as f:
+        np.savez(f, versao=np.int64(VERSAO_COLUNAR), sha256_txt=np.str_(sha256_txt),
+                 **{f"transacoes/{coluna}": valores for coluna, valores in transacoes.items()},
+                 **{f"taxas/{coluna}": valores for coluna, valores in taxas.items()})
+
+
+def processar_arquivos_pdf(configs=CONFIGURATIONS, progresso=None):
+    """
+    Função principal que orquestra a leitura, processamento, cálculo e escrita.
+    Os PDFs de todas as configurações são lidos juntos, em paralelo (ler_textos_pdfs); o
+    agrupamento por nota e o rateio das despesas vêm depois, por configuração, na ordem dos arquivos.
+
+    Cada configuração gera o TXT legível (ARQUIVO_SAIDA_TXT) e o arquivo colunar tipado
+    (ARQUIVO_SAIDA_COLUNAR) com as transações e as taxas por nota.
+
+    `progresso(percentual, mensagem)` recebe o andamento (PDFs lidos sobre o total).
+    Retorna {person_type: colunas de transações} para quem chama em processo (ex.: o relat.py).
+    """
+    caminhos = [os.path.join(config['CAMINHO_DIRETORIO'], nome_arquivo)
+                for config in configs for nome_arquivo in listar_pdfs(config['CAMINHO_DIRETORIO'])]
+    total_pdfs = len(caminhos)
+    lidos = 0
+
+    def ao_ler_arquivo(nome_arquivo):
+        nonlocal lidos
+        lidos += 1
+        if progresso:
+            progresso(100.0 * lidos / total_pdfs, f"{lidos}/{total_pdfs} PDFs lidos")
+
+    textos = ler_textos_pdfs(caminhos, ao_ler_arquivo)
+    conteudos = {}
+    for config in configs:
+        ARQUIVO_SAIDA_TXT = config['ARQUIVO_SAIDA_TXT']
+        notas = extrair_notas(config, textos=textos)
+        if notas is None:
+            continue # Pula para a próxima configuração
+        resultados_finais_formatados = notas.linhas
+        if resultados_finais_formatados:
+            conteudo = '\n'.join(resultados_finais_formatados)
             with open(ARQUIVO_SAIDA_TXT, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(resultados_finais_formatados))
-            logging.info(f"\nProcessamento para {config['person_type']} concluído! Resultados salvos em '{ARQUIVO_SAIDA_TXT}'")
+                f.write(conteudo)
+            transacoes = colunas_transacoes(notas.transacoes)
+            gravar_colunar(config['ARQUIVO_SAIDA_COLUNAR'], transacoes, colunas_taxas(notas.taxas), sha256_arquivo(ARQUIVO_SAIDA_TXT))
+            conteudos[config['person_type']] = transacoes
+            logging.info(f"\nProcessamento para {config['person_type']} concluído! Resultados salvos em '{ARQUIVO_SAIDA_TXT}' e '{config['ARQUIVO_SAIDA_COLUNAR']}'")
         else: # Adicionado para clareza do log
-            logging.info(f"Nenhum resultado final formatado para {config['person_type']} em {CAMINHO_DIRETORIO}.")
+            logging.info(f"Nenhum resultado final formatado para {config['person_type']} em {config['CAMINHO_DIRETORIO']}.")
+    return conteudos
 
 if __name__ == "__main__":
-    processar_arquivos_pdf()
\ No newline at end of file
+    import sys
+    from pipeline import json_progress
+    processar_arquivos_pdf(progresso=json_progress('notas') if '--progress-json' in sys.argv[1:] else None)
@@ -0,0 +1,368 @@
+# pipeline.py
+"""
+Execução em processo das rotinas diárias, numa thread de trabalho:
+  SI:  download (down.py) -> validação do ZIP -> sync (sync.py, gera o base.csv)
+  Sy:  notas (notas.py, lê os PDFs) -> relat (relat.py, FIFO e fiscal)
+
+Os módulos são importados uma única vez no processo do app (pandas, pdfplumber e o MT5 já
+carregados são reaproveitados) e o sync usa a conexão MT5 que o app já mantém, com as chamadas
+serializadas por mt5_offline.MT5_LOCK (a thread de mercado usa a mesma API ao mesmo tempo).
+Os dados passam entre as etapas em memória (`context`): o relat recebe as colunas de transações
+do notas sem reler arquivo nenhum.
+
+Cada etapa informa o andamento por eventos estruturados (PipelineEvent) entregues ao callback
+`on_event`, chamado na thread de trabalho. As rotinas recebem um `progresso(percentual, mensagem)`
+(PDFs lidos, MB do SI lidos, bytes baixados...); `PipelineRunner.cancel()` interrompe a etapa em
+andamento na próxima chamada dele, sem derrubar o app. Rodando os scripts isolados com
+`--progress-json`, os mesmos eventos saem no stdout como linhas `@@progress {json}` (json_progress).
+
+Cache no estilo make: etapas que declaram entradas (arquivos + valores de configuração) e saídas
+têm as impressões digitais registradas em MANIFEST_FILE. Se as entradas não mudaram e as saídas
+continuam as mesmas da última execução, a etapa é pulada ('skipped'); `force=True` ignora o cache.
+"""
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import namedtuple
+from datetime import date
+
+from atomic import atomic_write
+
+MANIFEST_FILE = 'pipeline_manifest.json'
+PROGRESS_INTERVAL_S = 0.1
+PROGRESS_LINE_PREFIX = '@@progress '
+
+# status: 'running', 'progress', 'done', 'skipped', 'error', 'cancelled', 'not_run'
+PipelineEvent = namedtuple('PipelineEvent', ['stage', 'status', 'progress', 'message'])
+# inputs(context) -> {'files': [caminhos], 'values': {...}}; outputs() -> [caminhos]. Sem inputs a etapa sempre roda.
+Stage = namedtuple('Stage', ['name', 'func', 'inputs', 'outputs'], defaults=(None, None))
+
+
+class StageError(Exception):
+    """Falha esperada de uma etapa; a mensagem é mostrada ao usuário."""
+
+
+class PipelineCancelled(BaseException):
+    """
+    Levantada pelo `report` de uma etapa depois de PipelineRunner.cancel().
+    Deriva de BaseException para atravessar os `except Exception` das rotinas (que tratariam o
+    cancelamento como falha de leitura e seguiriam por outro caminho).
+    """
+
+
+class _Throttle:
+    """Deixa passar no máximo um aviso de progresso a cada `interval` segundos (sempre o de 100%)."""
+    def __init__(self, interval=PROGRESS_INTERVAL_S):
+        self.interval = interval
+        self.last = 0.0
+
+    def ready(self, progress):
+        now = time.monotonic()
+        if progress is not None and progress >= 100 or now - self.last >= self.interval:
+            self.last = now
+            return True
+        return False
+
+
+def json_progress(stage, stream=None):
+    """
+    Callback `progresso(percentual, mensagem)` que escreve cada aviso como uma linha
+    `@@progress {"stage", "status", "progress", "message"}` no stdout, para quem lê a saída do script.
+    """
+    throttle = _Throttle()
+
+    def progresso(percentual=None, mensagem=''):
+        if throttle.ready(percentual):
+            event = PipelineEvent(stage, 'progress', percentual, mensagem)
+            print(PROGRESS_LINE_PREFIX + json.dumps(event._asdict(), ensure_ascii=False), file=stream or sys.stdout, flush=True)
+    return progresso
+
+
+def parse_progress_line(line):
+    """PipelineEvent de uma linha escrita por json_progress, ou None se for saída comum."""
+    if not line.startswith(PROGRESS_LINE_PREFIX):
+        return None
+    try:
+        return PipelineEvent(**json.loads(line[len(PROGRESS_LINE_PREFIX):]))
+    except (ValueError, TypeError):
+        return None
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_fingerprint(path, previous=None):
+    """{'size', 'mtime_ns', 'sha256'} do arquivo (None se não existir); reaproveita o hash anterior se tamanho e mtime não mudaram."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if previous and previous.get('size') == st.st_size and previous.get('mtime_ns') == st.st_mtime_ns:
+        return previous
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': _sha256(path)}
+
+
+def _fingerprints(paths, previous):
+    previous = previous or {}
+    return {path: file_fingerprint(path, previous.get(path)) for path in sorted(set(paths))}
+
+
+def _same_contents(current, recorded):
+    if recorded is None or set(current) != set(recorded):
+        return False
+    return all((current[p] or {}).get('sha256') == (recorded[p] or {}).get('sha256') for p in current)
+
+
+class Manifest:
+    """Impressões digitais de entradas e saídas por etapa, persistidas em JSON."""
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def fingerprint_inputs(self, stage, inputs):
+        recorded = self.entries.get(stage, {})
+        return {'files': _fingerprints(inputs.get('files', []), recorded.get('files')), 'values': inputs.get('values', {})}
+
+    def is_up_to_date(self, stage, fingerprinted_inputs, outputs):
+        recorded = self.entries.get(stage)
+        if not recorded or recorded.get('values') != json.loads(json.dumps(fingerprinted_inputs['values'])):
+            return False
+        if not _same_contents(fingerprinted_inputs['files'], recorded.get('files')):
+            return False
+        current_outputs = _fingerprints(outputs, recorded.get('outputs'))
+        return all(current_outputs.values()) and _same_contents(current_outputs, recorded.get('outputs'))
+
+    def record(self, stage, fingerprinted_inputs, outputs):
+        self.entries[stage] = {
+            'files': fingerprinted_inputs['files'],
+            'values': fingerprinted_inputs['values'],
+            'outputs': _fingerprints(outputs, None),
+        }
+        self.save()
+
+    def save(self):
+        with atomic_write(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1)
+
+
+class PipelineRunner(threading.Thread):
+    """
+    Executa as etapas em sequência. Cada `Stage.func(context, report)` recebe o dicionário com os
+    resultados das etapas anteriores (chave = nome da etapa; None se a etapa foi pulada) e
+    `report(progress=None, message='')`. Na primeira falha as etapas restantes são marcadas como 'not_run'.
+    `on_finish(ok, context)` é chamado ao final, também na thread de trabalho.
+
+    `cancel()` pode ser chamado de qualquer thread: a etapa atual termina como 'cancelled' na
+    próxima chamada de `report` e não é registrada no manifesto.
+    """
+    def __init__(self, stages, on_event, on_finish=None, force=False, manifest_path=MANIFEST_FILE):
+        super().__init__(name='PipelineRunner', daemon=True)
+        self.stages = list(stages)
+        self.on_event = on_event
+        self.on_finish = on_finish
+        self.force = force
+        self.manifest_path = manifest_path
+        self._cancel_requested = threading.Event()
+
+    def cancel(self):
+        self._cancel_requested.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_requested.is_set()
+
+    def _reporter(self, stage_name):
+        throttle = _Throttle()
+
+        def report(progress=None, message=''):
+            if self._cancel_requested.is_set():
+                raise PipelineCancelled()
+            if throttle.ready(progress):
+                self._emit(stage_name, 'progress', progress, message)
+        return report
+
+    def _emit(self, stage, status, progress=None, message=''):
+        self.on_event(PipelineEvent(stage, status, progress, message))
+
+    def run(self):
+        context = {}
+        ok = True
+        manifest = Manifest(self.manifest_path)
+        for index, stage in enumerate(self.stages):
+            report = self._reporter(stage.name)
+            try:
+                if self.cancelled:
+                    raise PipelineCancelled()
+                inputs = manifest.fingerprint_inputs(stage.name, stage.inputs(context)) if stage.inputs else None
+                outputs = stage.outputs() if stage.outputs else []
+                if inputs is not None and not self.force and manifest.is_up_to_date(stage.name, inputs, outputs):
+                    context[stage.name] = None
+                    self._emit(stage.name, 'skipped', 100, "Sem alterações")
+                    continue
+                self._emit(stage.name, 'running', None, "Executando...")
+                context[stage.name] = stage.func(context, report)
+                if inputs is not None:
+                    manifest.record(stage.name, inputs, outputs)
+            except PipelineCancelled:
+                ok = False
+                self._emit(stage.name, 'cancelled', 0, "Cancelado")
+            except StageError as e:
+                ok = False
+                self._emit(stage.name, 'error', 0, str(e))
+            except Exception as e:
+                ok = False
+                traceback.print_exc()
+                self._emit(stage.name, 'error', 0, f"Erro inesperado: {e}")
+            if not ok:
+                for remaining in self.stages[index + 1:]:
+                    self._emit(remaining.name, 'not_run', 0, "Não executado")
+                break
+            self._emit(stage.name, 'done', 100, "Concluído!")
+        if self.on_finish:
+            self.on_finish(ok, context)
+
+
+def _module_file(module):
+    return os.path.abspath(module.__file__)
+
+
+# --- Etapas do botão SI ---
+
+def _stage_download(context, report):
+    import down
+    if not down.download_series_autorizadas(progress=report):
+        raise StageError(f"Não foi possível baixar o {down.FILENAME}. Veja o console para detalhes.")
+    return down.FILENAME
+
+
+def _stage_validate_zip(context, report):
+    import down
+    zip_path = context['download']
+    report(None, f"Verificando {down.SI_MEMBER}...")
+    ok, reason = down.validate_series_zip(zip_path)
+    if not ok:
+        raise StageError(f"Arquivo '{zip_path}' inválido: {reason}.")
+    return zip_path
+
+
+def _stage_sync(context, report):
+    import sync
+    if not sync.gerar_base(context['si'], progresso=report):
+        raise StageError("Nenhum par call/put foi gerado. Veja o console para detalhes.")
+    return True
+
+
+def _sync_inputs(context):
+    import sync
+    return {
+        'files': [context['si'], _module_file(sync)],
+        # O filtro de vencimento depende do dia.
+        'values': {'hoje': date.today().isoformat()},
+    }
+
+
+def _sync_outputs():
+    return ['base.csv']
+
+
+def si_stages():
+    return [Stage('download', _stage_download), Stage('si', _stage_validate_zip),
+            Stage('sync', _stage_sync, _sync_inputs, _sync_outputs)]
+
+
+# --- Etapas do botão Sy ---
+
+def _stage_notas(context, report):
+    import notas
+    return notas.processar_arquivos_pdf(progresso=report)
+
+
+def _stage_relat(context, report):
+    import relat
+    if not relat.main(context['notas'], progresso=report):
+        raise StageError("O relatório terminou com erros. Veja o console para detalhes.")
+    return True
+
+
+def _notas_inputs(context):
+    import notas
+    files = [_module_file(notas)]
+    for config in notas.CONFIGURATIONS:
+        files.extend(glob.glob(os.path.join(config['CAMINHO_DIRETORIO'], '*.[pP][dD][fF]')))
+    return {'files': files, 'values': {'configuracoes': notas.CONFIGURATIONS}}
+
+
+def _notas_outputs():
+    import notas
+    return [path for config in notas.CONFIGURATIONS for path in (config['ARQUIVO_SAIDA_TXT'], config['ARQUIVO_SAIDA_COLUNAR'])]
+
+
+def _relat_inputs(context):
+    import relat
+    files = [_module_file(relat)]
+    for config in relat.CONFIGURATIONS:
+        files += [config['input_txt_file'], config['input_npz_file']]
+    return {'files': files, 'values': {'configuracoes': relat.CONFIGURATIONS}}
+
+
+def _relat_outputs():
+    import relat
+    outputs = []
+    for config in relat.CONFIGURATIONS:
+        outputs += [config['output_json_file'], config['output_csv_file']]
+    return outputs
+
+
+def notas_stages():
+    return [Stage('notas', _stage_notas, _notas_inputs, _notas_outputs),
+            Stage('relat', _stage_relat, _relat_inputs, _relat_outputs)]
+
+
+# --- Atualização pelo vigia de notas (watcher.py) ---
+
+def notes_directories():
+    import notas
+    return [config['CAMINHO_DIRETORIO'] for config in notas.CONFIGURATIONS]
+
+
+def configs_for_directories(directories):
+    """Configurações do notas.py cujas pastas de PDFs estão em `directories`."""
+    import notas
+    wanted = {os.path.normcase(os.path.abspath(d)) for d in directories}
+    return [config for config in notas.CONFIGURATIONS
+            if os.path.normcase(os.path.abspath(config['CAMINHO_DIRETORIO'])) in wanted]
+
+
+def notes_update_stages(configs):
+    """
+    notas -> relat só para `configs`, sem manifesto: o vigia já sabe o que mudou. Só os PDFs novos
+    são abertos (os demais vêm do cache de textos do notas.py), e o relat refaz apenas as pessoas afetadas.
+    O manifesto do Sy fica desatualizado e o próximo clique refaz as duas etapas, também a partir do cache.
+    """
+    person_types = [config['person_type'] for config in configs]
+
+    def stage_notas(context, report):
+        import notas
+        return notas.processar_arquivos_pdf(configs, progresso=report)
+
+    def stage_relat(context, report):
+        import relat
+        if not relat.main(context['notas'], progresso=report, person_types=person_types):
+            raise StageError("O relatório terminou com erros. Veja o console para detalhes.")
+        return True
+
+    return [Stage('notas', stage_notas), Stage('relat', stage_relat)]
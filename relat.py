@@ -1,10 +1,12 @@
 import pandas as pd
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque, namedtuple
 import re
 import csv
 import json  # Adicionado para salvar o resultado em JSON
 import os # Added for os.path.exists
+import hashlib
+import numpy as np
 
 # ======================================
 # CONFIGURAÇÃO FISCAL
@@ -18,6 +20,7 @@ CONFIGURATIONS = [
     {
         'person_type': 'M',
         'input_txt_file': 'notas_extraidas_m.txt',
+        'input_npz_file': 'notas_extraidas_m.npz',
         'output_json_file': 'fiscal_m.json',
         'output_csv_file': 'extrato_fifo_detalhado_m.csv',
         'prejuizo_anterior': -86004.54
@@ -25,12 +28,16 @@ CONFIGURATIONS = [
     {
         'person_type': 'R',
         'input_txt_file': 'notas_extraidas_r.txt',
+        'input_npz_file': 'notas_extraidas_r.npz',
         'output_json_file': 'fiscal_r.json',
         'output_csv_file': 'extrato_fifo_detalhado_r.csv',
         'prejuizo_anterior': -55799.99
     }
 ]
 
+# Formato do arquivo colunar gravado pelo notas.py (notas.VERSAO_COLUNAR).
+COLUMNAR_VERSION = 2
+
 try:
     from tabulate import tabulate
     TABULATE_AVAILABLE = True
@@ -103,160 +110,214 @@ def parse_trading_data(file_content):
     
     return operations
 
-def generate_fifo_extract(operations):
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def load_columnar_trades(path, txt_path=None):
     """
-    Generate detailed FIFO extract showing all position openings and closures
+    Load the typed transaction columns written by notas.gravar_colunar.
+    Returns (columns, reason). columns is None if the file is missing, unreadable, from another
+    format version, or if `txt_path` no longer has the content it was written with (a TXT
+    edited by hand or rewritten by another path wins). reason says why the file was used or skipped.
+    """
+    if not os.path.exists(path):
+        return None, f"arquivo colunar '{path}' não encontrado"
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['versao']) != COLUMNAR_VERSION:
+                return None, f"arquivo colunar '{path}' é de outra versão"
+            if txt_path is not None and os.path.exists(txt_path):
+                if str(data['sha256_txt']) != file_sha256(txt_path):
+                    return None, f"'{txt_path}' mudou depois que '{path}' foi gravado"
+                reason = f"mesmo conteúdo de '{txt_path}'"
+            else:
+                reason = f"'{txt_path}' não encontrado" if txt_path is not None else "sem TXT para comparar"
+            prefix = 'transacoes/'
+            return {name[len(prefix):]: data[name] for name in data.files if name.startswith(prefix)}, reason
+    except (OSError, KeyError, ValueError) as e:
+        return None, f"arquivo colunar '{path}' ilegível ({e})"
+
+def operations_from_columns(columns):
+    """
+    Build the operation dicts used by the reports straight from the typed columns
+    (same values parse_trading_data gets from the text file, without parsing strings).
+    """
+    dates = columns['data'].astype('datetime64[s]').astype(object).tolist()
+    gross_values = (columns['bruto_centavos'] / 100).tolist()
+    net_values = (columns['liquido_centavos'] / 100).tolist()
+    return [
+        {
+            'type': side,
+            'ticker': ticker,
+            'date': date,
+            'quantity': quantity,
+            'price': price,
+            'gross_value': gross_value,
+            'net_value': net_value,
+            'month': f"{date.month:02d}/{date.year}",
+        }
+        for side, ticker, date, quantity, price, gross_value, net_value in zip(
+            columns['lado'].tolist(), columns['ticker'].tolist(), dates, columns['quantidade'].tolist(),
+            columns['preco'].tolist(), gross_values, net_values)
+    ]
+
+FifoResult = namedtuple('FifoResult', ['extract', 'portfolio', 'monthly_pnl'])
+
+def _brl(value):
+    return f"{value:.2f}".replace('.', ',')
+
+def _new_month():
+    return {'realized_pnl': 0, 'total_bought': 0, 'total_sold': 0, 'operations': [], 'closed_positions': 0}
+
+def run_fifo(operations):
+    """
+    Single FIFO pass over each asset's operations, producing at once the detailed extract rows,
+    the per-asset portfolio position and the monthly realized P&L.
+
+    Open lots of an asset are always on one side: an operation first closes lots of the opposite
+    side from the front of the queue and the remaining quantity opens a new lot at the back.
+    Assets are processed in the order group_by_asset returns them and each asset's operations in
+    date order, so the P&L sums accumulate in the same order as before.
     """
-    grouped_ops = group_by_asset(operations)
     fifo_extract = []
-    
+    portfolio = {}
+    monthly_pnl = defaultdict(_new_month)
+
     print("Info: Processando ativos para extrato FIFO...")
-    
-    for asset, ops in grouped_ops.items():
+
+    for asset, ops in group_by_asset(operations).items():
         print(f"   Processando {asset}: {len(ops)} operações")
-        
-        # Sort operations by date for FIFO calculation
         ops.sort(key=lambda x: x['date'])
-        
-        # Simple FIFO tracking
-        open_positions = []  # [{'qty': int, 'price': float, 'date': str, 'is_long': bool}, ...]
-        
+
+        open_lots = deque()  # [qty, price, 'dd/mm/yyyy', date, is_long]
+        current_position = 0
+        total_realized_pnl = 0
+        total_bought_qty = 0
+        total_bought_value = 0
+        total_sold_qty = 0
+        total_sold_value = 0
+
         for op in ops:
+            month = monthly_pnl[op['month']]
+            is_buy = op['type'] == 'D'  # Compra (Débito); senão Venda (Crédito)
             op_date = op['date'].strftime('%d/%m/%Y')
             price_per_share = op['net_value'] / op['quantity']
-            
-            if op['type'] == 'D':  # Compra
-                # First close any short positions
-                remaining_qty = op['quantity']
-                
-                while remaining_qty > 0 and open_positions and not open_positions[0]['is_long']:
-                    pos = open_positions[0]
-                    close_qty = min(remaining_qty, pos['qty'])
-                    
-                    # Calculate P&L for short closure
-                    pnl = close_qty * (pos['price'] - price_per_share)
-                    days_held = (op['date'] - datetime.strptime(pos['date'], '%d/%m/%Y')).days
-                    
-                    fifo_extract.append({
-                        'Asset': asset,
-                        'Ticker': op['ticker'],
-                        'Tipo_Operacao': 'FECHAMENTO_SHORT',
-                        'Data_Abertura': pos['date'],
-                        'Data_Fechamento': op_date,
-                        'Quantidade_Abertura': pos['qty'],
-                        'Preco_Abertura': f"{pos['price']:.2f}".replace('.', ','),
-                        'Quantidade_Fechamento': close_qty,
-                        'Preco_Fechamento': f"{price_per_share:.2f}".replace('.', ','),
-                        'Tipo_Fechamento': 'TOTAL' if close_qty == pos['qty'] else 'PARCIAL',
-                        'PL_Realizado': f"{pnl:.2f}".replace('.', ','),
-                        'Valor_Abertura': f"{pos['qty'] * pos['price']:.2f}".replace('.', ','),
-                        'Valor_Fechamento': f"{close_qty * price_per_share:.2f}".replace('.', ','),
-                        'Dias_Posicao': str(days_held),
-                        'Retorno_Percent': f"{(pnl / (close_qty * pos['price'])) * 100:.2f}".replace('.', ',') + '%' if pos['price'] > 0 else '0,00%'
-                    })
-                    
-                    # Update position
-                    if close_qty == pos['qty']:
-                        open_positions.pop(0)
-                    else:
-                        open_positions[0]['qty'] -= close_qty
-                    
-                    remaining_qty -= close_qty
-                
-                # Add remaining as long position
-                if remaining_qty > 0:
-                    open_positions.append({
-                        'qty': remaining_qty,
-                        'price': price_per_share,
-                        'date': op_date,
-                        'is_long': True
-                    })
-                    
-                    fifo_extract.append({
-                        'Asset': asset,
-                        'Ticker': op['ticker'],
-                        'Tipo_Operacao': 'ABERTURA_LONG',
-                        'Data_Abertura': op_date,
-                        'Data_Fechamento': '',
-                        'Quantidade_Abertura': remaining_qty,
-                        'Preco_Abertura': f"{price_per_share:.2f}".replace('.', ','),
-                        'Quantidade_Fechamento': 0,
-                        'Preco_Fechamento': '',
-                        'Tipo_Fechamento': '',
-                        'PL_Realizado': '0,00',
-                        'Valor_Abertura': f"{remaining_qty * price_per_share:.2f}".replace('.', ','),
-                        'Valor_Fechamento': '',
-                        'Dias_Posicao': '',
-                        'Retorno_Percent': ''
-                    })
-                    
-            else:  # Venda
-                # First close any long positions
-                remaining_qty = op['quantity']
-                
-                while remaining_qty > 0 and open_positions and open_positions[0]['is_long']:
-                    pos = open_positions[0]
-                    close_qty = min(remaining_qty, pos['qty'])
-                    
-                    # Calculate P&L for long closure
-                    pnl = close_qty * (price_per_share - pos['price'])
-                    days_held = (op['date'] - datetime.strptime(pos['date'], '%d/%m/%Y')).days
-                    
-                    fifo_extract.append({
-                        'Asset': asset,
-                        'Ticker': op['ticker'],
-                        'Tipo_Operacao': 'FECHAMENTO_LONG',
-                        'Data_Abertura': pos['date'],
-                        'Data_Fechamento': op_date,
-                        'Quantidade_Abertura': pos['qty'],
-                        'Preco_Abertura': f"{pos['price']:.2f}".replace('.', ','),
-                        'Quantidade_Fechamento': close_qty,
-                        'Preco_Fechamento': f"{price_per_share:.2f}".replace('.', ','),
-                        'Tipo_Fechamento': 'TOTAL' if close_qty == pos['qty'] else 'PARCIAL',
-                        'PL_Realizado': f"{pnl:.2f}".replace('.', ','),
-                        'Valor_Abertura': f"{pos['qty'] * pos['price']:.2f}".replace('.', ','),
-                        'Valor_Fechamento': f"{close_qty * price_per_share:.2f}".replace('.', ','),
-                        'Dias_Posicao': str(days_held),
-                        'Retorno_Percent': f"{(pnl / (close_qty * pos['price'])) * 100:.2f}".replace('.', ',') + '%' if pos['price'] > 0 else '0,00%'
-                    })
-                    
-                    # Update position
-                    if close_qty == pos['qty']:
-                        open_positions.pop(0)
-                    else:
-                        open_positions[0]['qty'] -= close_qty
-                    
-                    remaining_qty -= close_qty
-                
-                # Add remaining as short position
-                if remaining_qty > 0:
-                    open_positions.append({
-                        'qty': remaining_qty,
-                        'price': price_per_share,
-                        'date': op_date,
-                        'is_long': False
-                    })
-                    
-                    fifo_extract.append({
-                        'Asset': asset,
-                        'Ticker': op['ticker'],
-                        'Tipo_Operacao': 'ABERTURA_SHORT',
-                        'Data_Abertura': op_date,
-                        'Data_Fechamento': '',
-                        'Quantidade_Abertura': remaining_qty,
-                        'Preco_Abertura': f"{price_per_share:.2f}".replace('.', ','),
-                        'Quantidade_Fechamento': 0,
-                        'Preco_Fechamento': '',
-                        'Tipo_Fechamento': '',
-                        'PL_Realizado': '0,00',
-                        'Valor_Abertura': f"{remaining_qty * price_per_share:.2f}".replace('.', ','),
-                        'Valor_Fechamento': '',
-                        'Dias_Posicao': '',
-                        'Retorno_Percent': ''
-                    })
-    
+
+            if is_buy:
+                total_bought_qty += op['quantity']
+                total_bought_value += op['net_value']
+                month['total_bought'] += op['net_value']
+            else:
+                total_sold_qty += op['quantity']
+                total_sold_value += op['net_value']
+                month['total_sold'] += op['net_value']
+
+            # First close lots of the opposite side (shorts on a buy, longs on a sale)
+            remaining_qty = op['quantity']
+            while remaining_qty > 0 and open_lots and open_lots[0][4] != is_buy:
+                lot = open_lots[0]
+                lot_qty, lot_price, lot_date_str, lot_date, lot_is_long = lot
+                close_qty = min(remaining_qty, lot_qty)
+
+                if lot_is_long:
+                    pnl = close_qty * (price_per_share - lot_price)
+                else:
+                    pnl = close_qty * (lot_price - price_per_share)
+                total_realized_pnl += pnl
+                month['realized_pnl'] += pnl
+                month['closed_positions'] += 1
+
+                fifo_extract.append({
+                    'Asset': asset,
+                    'Ticker': op['ticker'],
+                    'Tipo_Operacao': 'FECHAMENTO_LONG' if lot_is_long else 'FECHAMENTO_SHORT',
+                    'Data_Abertura': lot_date_str,
+                    'Data_Fechamento': op_date,
+                    'Quantidade_Abertura': lot_qty,
+                    'Preco_Abertura': _brl(lot_price),
+                    'Quantidade_Fechamento': close_qty,
+                    'Preco_Fechamento': _brl(price_per_share),
+                    'Tipo_Fechamento': 'TOTAL' if close_qty == lot_qty else 'PARCIAL',
+                    'PL_Realizado': _brl(pnl),
+                    'Valor_Abertura': _brl(lot_qty * lot_price),
+                    'Valor_Fechamento': _brl(close_qty * price_per_share),
+                    'Dias_Posicao': str((op['date'] - lot_date).days),
+                    'Retorno_Percent': _brl((pnl / (close_qty * lot_price)) * 100) + '%' if lot_price > 0 else '0,00%'
+                })
+
+                if close_qty == lot_qty:
+                    open_lots.popleft()
+                else:
+                    lot[0] -= close_qty
+                remaining_qty -= close_qty
+                current_position += close_qty if is_buy else -close_qty
+
+            # Add remaining quantity as a new lot on the operation's side
+            if remaining_qty > 0:
+                open_lots.append([remaining_qty, price_per_share, op_date, op['date'], is_buy])
+                current_position += remaining_qty if is_buy else -remaining_qty
+
+                fifo_extract.append({
+                    'Asset': asset,
+                    'Ticker': op['ticker'],
+                    'Tipo_Operacao': 'ABERTURA_LONG' if is_buy else 'ABERTURA_SHORT',
+                    'Data_Abertura': op_date,
+                    'Data_Fechamento': '',
+                    'Quantidade_Abertura': remaining_qty,
+                    'Preco_Abertura': _brl(price_per_share),
+                    'Quantidade_Fechamento': 0,
+                    'Preco_Fechamento': '',
+                    'Tipo_Fechamento': '',
+                    'PL_Realizado': '0,00',
+                    'Valor_Abertura': _brl(remaining_qty * price_per_share),
+                    'Valor_Fechamento': '',
+                    'Dias_Posicao': '',
+                    'Retorno_Percent': ''
+                })
+
+            month['operations'].append({
+                'asset': asset,
+                'type': op['type'],
+                'quantity': op['quantity'],
+                'price': op['price'],
+                'value': op['net_value']
+            })
+
+        # Current position cost basis (short lots represent liabilities and don't add to it)
+        cost_basis = 0
+        for qty, cost_per_share, _, _, is_long in open_lots:
+            if is_long:
+                cost_basis += qty * cost_per_share
+
+        # Average prices (only for display purposes)
+        avg_buy_price = total_bought_value / total_bought_qty if total_bought_qty > 0 else 0
+        avg_sell_price = total_sold_value / total_sold_qty if total_sold_qty > 0 else 0
+
+        portfolio[asset] = {
+            'current_quantity': current_position,
+            'total_bought_qty': total_bought_qty,
+            'total_sold_qty': total_sold_qty,
+            'avg_buy_price': avg_buy_price,
+            'avg_sell_price': avg_sell_price,
+            'total_invested': total_bought_value,
+            'total_received': total_sold_value,
+            'realized_pnl': total_realized_pnl,
+            'cost_basis': cost_basis,
+            'open_positions': len(open_lots)
+        }
+
     print(f"OK: Extrato FIFO gerado com {len(fifo_extract)} registros")
-    return fifo_extract
+    return FifoResult(fifo_extract, portfolio, monthly_pnl)
+
+def generate_fifo_extract(operations):
+    """
+    Generate detailed FIFO extract showing all position openings and closures
+    """
+    return run_fifo(operations).extract
 
 def save_fifo_extract_to_csv(fifo_extract, filename='extrato_fifo_detalhado.csv'):
     """
@@ -342,125 +403,7 @@ def calculate_portfolio_position(operations):
     Calculate current portfolio position with average prices and realized P&L
     Only considers closed positions for P&L calculation
     """
-    portfolio = {}
-    
-    grouped_ops = group_by_asset(operations)
-    
-    for asset, ops in grouped_ops.items():
-        # Sort operations by date for FIFO calculation
-        ops.sort(key=lambda x: x['date'])
-        
-        # Track position using FIFO method
-        position_queue = []  # [(quantity, cost_per_share, is_long), ...]
-        current_position = 0
-        total_realized_pnl = 0
-        total_bought_qty = 0
-        total_bought_value = 0
-        total_sold_qty = 0
-        total_sold_value = 0
-        
-        for op in ops:
-            if op['type'] == 'D':  # Compra (Débito)
-                total_bought_qty += op['quantity']
-                total_bought_value += op['net_value']
-                
-                if current_position < 0:  # Closing short position
-                    # Close short positions first
-                    remaining_to_close = min(op['quantity'], abs(current_position))
-                    qty_left = op['quantity']
-                    
-                    while remaining_to_close > 0 and position_queue:
-                        queue_qty, queue_cost, is_long = position_queue[0]
-                        if not is_long:  # Short position
-                            close_qty = min(remaining_to_close, queue_qty)
-                            
-                            # Calculate P&L: profit when buy price < sell price for closing short
-                            pnl = close_qty * (queue_cost - op['net_value'] / op['quantity'])
-                            total_realized_pnl += pnl
-                            
-                            # Update queue
-                            if close_qty == queue_qty:
-                                position_queue.pop(0)
-                            else:
-                                position_queue[0] = (queue_qty - close_qty, queue_cost, is_long)
-                            
-                            remaining_to_close -= close_qty
-                            qty_left -= close_qty
-                            current_position += close_qty
-                    
-                    # Add remaining quantity as long position
-                    if qty_left > 0:
-                        cost_per_share = op['net_value'] / op['quantity']
-                        position_queue.append((qty_left, cost_per_share, True))
-                        current_position += qty_left
-                else:  # Adding to long position or starting long
-                    cost_per_share = op['net_value'] / op['quantity']
-                    position_queue.append((op['quantity'], cost_per_share, True))
-                    current_position += op['quantity']
-                    
-            else:  # Venda (Crédito)
-                total_sold_qty += op['quantity']
-                total_sold_value += op['net_value']
-                
-                if current_position > 0:  # Closing long position
-                    # Close long positions first
-                    remaining_to_close = min(op['quantity'], current_position)
-                    qty_left = op['quantity']
-                    
-                    while remaining_to_close > 0 and position_queue:
-                        queue_qty, queue_cost, is_long = position_queue[0]
-                        if is_long:  # Long position
-                            close_qty = min(remaining_to_close, queue_qty)
-                            
-                            # Calculate P&L: profit when sell price > buy price for closing long
-                            pnl = close_qty * (op['net_value'] / op['quantity'] - queue_cost)
-                            total_realized_pnl += pnl
-                            
-                            # Update queue
-                            if close_qty == queue_qty:
-                                position_queue.pop(0)
-                            else:
-                                position_queue[0] = (queue_qty - close_qty, queue_cost, is_long)
-                            
-                            remaining_to_close -= close_qty
-                            qty_left -= close_qty
-                            current_position -= close_qty
-                    
-                    # Add remaining quantity as short position
-                    if qty_left > 0:
-                        cost_per_share = op['net_value'] / op['quantity']
-                        position_queue.append((qty_left, cost_per_share, False))
-                        current_position -= qty_left
-                else:  # Adding to short position or starting short
-                    cost_per_share = op['net_value'] / op['quantity']
-                    position_queue.append((op['quantity'], cost_per_share, False))
-                    current_position -= op['quantity']
-        
-        # Calculate current position cost basis
-        cost_basis = 0
-        for qty, cost_per_share, is_long in position_queue:
-            if is_long:
-                cost_basis += qty * cost_per_share
-            # For short positions, we don't add to cost basis as they represent liabilities
-        
-        # Average prices (only for display purposes)
-        avg_buy_price = total_bought_value / total_bought_qty if total_bought_qty > 0 else 0
-        avg_sell_price = total_sold_value / total_sold_qty if total_sold_qty > 0 else 0
-        
-        portfolio[asset] = {
-            'current_quantity': current_position,
-            'total_bought_qty': total_bought_qty,
-            'total_sold_qty': total_sold_qty,
-            'avg_buy_price': avg_buy_price,
-            'avg_sell_price': avg_sell_price,
-            'total_invested': total_bought_value,
-            'total_received': total_sold_value,
-            'realized_pnl': total_realized_pnl,
-            'cost_basis': cost_basis,
-            'open_positions': len(position_queue)
-        }
-    
-    return portfolio
+    return run_fifo(operations).portfolio
 
 def calculate_tax_compensation(monthly_pnl, prejuizo_acumulado_anterior_param):
     """
@@ -562,138 +505,59 @@ def calculate_monthly_pnl(operations):
     """
     Calculate monthly profit/loss considering only closed positions
     """
-    monthly_pnl = defaultdict(lambda: {
-        'realized_pnl': 0,
-        'total_bought': 0,
-        'total_sold': 0,
-        'operations': [],
-        'closed_positions': 0
-    })
-    
-    grouped_ops = group_by_asset(operations)
-    
-    for asset, ops in grouped_ops.items():
-        # Sort operations by date for FIFO calculation
-        ops.sort(key=lambda x: x['date'])
-        
-        # Track position using FIFO method per month
-        position_queue = []  # [(quantity, cost_per_share, is_long), ...]
-        current_position = 0
-        
-        for op in ops:
-            month = op['month']
-            
-            if op['type'] == 'D':  # Compra
-                monthly_pnl[month]['total_bought'] += op['net_value']
-                
-                if current_position < 0:  # Closing short position
-                    remaining_to_close = min(op['quantity'], abs(current_position))
-                    qty_left = op['quantity']
-                    
-                    while remaining_to_close > 0 and position_queue:
-                        queue_qty, queue_cost, is_long = position_queue[0]
-                        if not is_long:  # Short position
-                            close_qty = min(remaining_to_close, queue_qty)
-                            
-                            # Calculate P&L for closed position
-                            pnl = close_qty * (queue_cost - op['net_value'] / op['quantity'])
-                            monthly_pnl[month]['realized_pnl'] += pnl
-                            monthly_pnl[month]['closed_positions'] += 1
-                            
-                            # Update queue
-                            if close_qty == queue_qty:
-                                position_queue.pop(0)
-                            else:
-                                position_queue[0] = (queue_qty - close_qty, queue_cost, is_long)
-                            
-                            remaining_to_close -= close_qty
-                            qty_left -= close_qty
-                            current_position += close_qty
-                    
-                    # Add remaining as long position
-                    if qty_left > 0:
-                        cost_per_share = op['net_value'] / op['quantity']
-                        position_queue.append((qty_left, cost_per_share, True))
-                        current_position += qty_left
-                else:  # Adding to long position
-                    cost_per_share = op['net_value'] / op['quantity']
-                    position_queue.append((op['quantity'], cost_per_share, True))
-                    current_position += op['quantity']
-                    
-            else:  # Venda
-                monthly_pnl[month]['total_sold'] += op['net_value']
-                
-                if current_position > 0:  # Closing long position
-                    remaining_to_close = min(op['quantity'], current_position)
-                    qty_left = op['quantity']
-                    
-                    while remaining_to_close > 0 and position_queue:
-                        queue_qty, queue_cost, is_long = position_queue[0]
-                        if is_long:  # Long position
-                            close_qty = min(remaining_to_close, queue_qty)
-                            
-                            # Calculate P&L for closed position
-                            pnl = close_qty * (op['net_value'] / op['quantity'] - queue_cost)
-                            monthly_pnl[month]['realized_pnl'] += pnl
-                            monthly_pnl[month]['closed_positions'] += 1
-                            
-                            # Update queue
-                            if close_qty == queue_qty:
-                                position_queue.pop(0)
-                            else:
-                                position_queue[0] = (queue_qty - close_qty, queue_cost, is_long)
-                            
-                            remaining_to_close -= close_qty
-                            qty_left -= close_qty
-                            current_position -= close_qty
-                    
-                    # Add remaining as short position
-                    if qty_left > 0:
-                        cost_per_share = op['net_value'] / op['quantity']
-                        position_queue.append((qty_left, cost_per_share, False))
-                        current_position -= qty_left
-                else:  # Adding to short position
-                    cost_per_share = op['net_value'] / op['quantity']
-                    position_queue.append((op['quantity'], cost_per_share, False))
-                    current_position -= op['quantity']
-            
-            monthly_pnl[month]['operations'].append({
-                'asset': asset,
-                'type': op['type'],
-                'quantity': op['quantity'],
-                'price': op['price'],
-                'value': op['net_value']
-            })
-    
-    return monthly_pnl
+    return run_fifo(operations).monthly_pnl
 
-def main():
+def main(conteudos=None, progresso=None, person_types=None):
+    """
+    Gera extrato FIFO, posição e resultado fiscal de cada configuração (ou só das de `person_types`).
+
+    `conteudos` ({person_type: colunas de transações do notas.py}) permite receber a saída do
+    notas.py em memória; quem não estiver no dicionário é lido do arquivo colunar (input_npz_file)
+    enquanto ele corresponder ao TXT (input_txt_file), senão do próprio TXT.
+    `progresso(percentual, mensagem)` recebe o andamento por configuração.
+    Retorna True se todas as configurações foram processadas sem erro.
+    """
     overall_success = True
-    for config in CONFIGURATIONS:
+    configs = [config for config in CONFIGURATIONS if person_types is None or config['person_type'] in person_types]
+    for config_index, config in enumerate(configs):
         person_type = config['person_type']
+        if progresso:
+            progresso(100.0 * config_index / len(configs), f"Processando {person_type}...")
         input_txt_file = config['input_txt_file']
+        input_npz_file = config['input_npz_file']
         output_json_file = config['output_json_file']
         output_csv_file = config['output_csv_file'] # New CSV output file per person
         prejuizo_anterior_config = config['prejuizo_anterior']
         
         print(f"\n{'='*30} Iniciando processamento para: {person_type} {'='*30}")
         
-        if not os.path.exists(input_txt_file): # Check if input file exists
+        columns = None
+        file_content = None
+        if conteudos is not None and person_type in conteudos:
+            columns = conteudos[person_type]
+            print(f"OK: Notas de {person_type} recebidas em memória.")
+        else:
+            columns, reason = load_columnar_trades(input_npz_file, input_txt_file)
+            if columns is not None:
+                print(f"OK: Arquivo colunar '{input_npz_file}' lido com sucesso ({reason}).")
+            else:
+                print(f"Info: Usando o TXT '{input_txt_file}': {reason}.")
+        if columns is None and not os.path.exists(input_txt_file): # Check if input file exists
             print(f"Error: Erro: Arquivo de entrada '{input_txt_file}' não encontrado!")
             print("   Por favor, crie o arquivo ou certifique-se de que 'notas.py' foi executado.")
             overall_success = False
             continue # Skip to next configuration
+        elif columns is None:
+            try:
+                with open(input_txt_file, 'r', encoding='utf-8') as file:
+                    file_content = file.read()
+                print(f"OK: Arquivo de entrada '{input_txt_file}' lido com sucesso.")
+            except Exception as e:
+                print(f"Error: Erro ao ler o arquivo '{input_txt_file}': {e}")
+                overall_success = False
+                continue
 
-        try:
-            with open(input_txt_file, 'r', encoding='utf-8') as file:
-                file_content = file.read()
-            print(f"OK: Arquivo de entrada '{input_txt_file}' lido com sucesso.")
-        except Exception as e:
-            print(f"Error: Erro ao ler o arquivo '{input_txt_file}': {e}")
-            overall_success = False
-            continue
-
-        operations = parse_trading_data(file_content)
+        operations = operations_from_columns(columns) if columns is not None else parse_trading_data(file_content)
         if not operations:
             print(f"Warning: Nenhuma operação encontrada no arquivo '{input_txt_file}'. Pulando para a próxima configuração se houver.")
             # Not necessarily a failure for overall_success if file is just empty.
@@ -701,8 +565,11 @@ def main():
             continue
         print(f"OK: {len(operations)} operações carregadas do arquivo '{input_txt_file}'.")
 
-        portfolio = calculate_portfolio_position(operations)
-        monthly_pnl = calculate_monthly_pnl(operations)
+        # Extract, portfolio and monthly P&L come from one FIFO pass (run_fifo).
+        print(f"Generating: Gerando extrato FIFO detalhado para {person_type}...")
+        fifo = run_fifo(operations)
+        portfolio = fifo.portfolio
+        monthly_pnl = fifo.monthly_pnl
         
         print(f"Calculating: Calculando compensação fiscal para {person_type} com prejuízo anterior de {prejuizo_anterior_config:.2f}...")
         tax_compensation = calculate_tax_compensation(monthly_pnl, prejuizo_anterior_config)
@@ -712,11 +579,8 @@ def main():
         # for month, data in tax_compensation.items():
         #     print(f"   {month}: P&L={data['monthly_result']:.2f}, Saldo={data['new_balance']:.2f}, Status={data['status']}")
 
-        print(f"Generating: Gerando extrato FIFO detalhado para {person_type}...")
         try:
-            fifo_extract = generate_fifo_extract(operations)
-            # print(f"Info: Extrato FIFO gerado com {len(fifo_extract)} registros para {person_type}") # Verbose
-            save_fifo_extract_to_csv(fifo_extract, filename=output_csv_file) # Pass the specific filename
+            save_fifo_extract_to_csv(fifo.extract, filename=output_csv_file) # Pass the specific filename
         except Exception as e:
             print(f"Error: Erro ao gerar ou salvar extrato FIFO para {person_type}: {e}")
             import traceback
@@ -796,6 +660,9 @@ def main():
         print("\n\nSuccess: Processamento de todos os relatórios concluído com sucesso! Success:")
     else:
         print("\n\nWarning: Processamento concluído com um ou mais erros. Verifique os logs. Warning:")
+    return overall_success
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import sys
+    from pipeline import json_progress
+    main(progresso=json_progress('relat') if '--progress-json' in sys.argv[1:] else None)
\ No newline at end of file
@@ -0,0 +1,148 @@
+# rollover.py
+"""
+Cálculo do fluxo D+2 de uma rolagem e solver exato das quantidades de montagem.
+
+Módulo sem dependência de Tk ou MetaTrader5: pode ser usado pelo app ou em lote.
+
+O fluxo D+2 é linear por partes no fator de escala das quantidades de montagem: o único
+"joelho" está onde a variação líquida de ações troca de sinal (compra no ASK / venda no BID).
+O solver resolve cada segmento linear em forma fechada e depois procura, na grade de lotes
+de 100, as quantidades arredondadas que mais se aproximam da meta.
+"""
+import json
+import math
+import sys
+from collections import namedtuple
+from itertools import product
+
+LOT_SIZE = 100
+
+LegPrices = namedtuple('LegPrices', ['pos_call_ask', 'new_call_bid', 'pos_put_bid', 'new_put_ask', 'asset_ask', 'asset_bid'])
+D2Solution = namedtuple('D2Solution', ['asset_q', 'call_q', 'put_q', 'd2', 'residual', 'scale'])
+
+
+def rollover_leg_prices(prices, pos_tickers, new_call, new_put):
+    """Monta os preços das pernas a partir de um dicionário {symbol_ask, symbol_bid}; None se faltar algum."""
+    legs = LegPrices(
+        pos_call_ask=prices.get(f"{pos_tickers['call']}_ask"),
+        new_call_bid=prices.get(f"{new_call}_bid"),
+        pos_put_bid=prices.get(f"{pos_tickers['put']}_bid"),
+        new_put_ask=prices.get(f"{new_put}_ask"),
+        asset_ask=prices.get(f"{pos_tickers['asset']}_ask"),
+        asset_bid=prices.get(f"{pos_tickers['asset']}_bid"),
+    )
+    if any(p is None for p in legs):
+        return None
+    return legs
+
+
+def d2_flow(assembly_q, unwind_q, legs):
+    """Fluxo financeiro D+2 da rolagem (opções em D+1 somadas à perna de ações em D+2)."""
+    fin_recompra_call = -(unwind_q['call_q'] * legs.pos_call_ask)
+    fin_venda_call = assembly_q['call_q'] * legs.new_call_bid
+    fin_venda_put = unwind_q['put_q'] * legs.pos_put_bid
+    fin_compra_put = -(assembly_q['put_q'] * legs.new_put_ask)
+    liquido_opcoes = fin_recompra_call + fin_venda_call + fin_venda_put + fin_compra_put
+
+    net_asset_q_change = assembly_q['asset_q'] - unwind_q['asset_q']
+    fin_asset = 0
+    if net_asset_q_change > 0:
+        fin_asset = -net_asset_q_change * legs.asset_ask
+    elif net_asset_q_change < 0:
+        fin_asset = abs(net_asset_q_change) * legs.asset_bid
+
+    return liquido_opcoes + fin_asset
+
+
+def _linear_segments(base_q, unwind_q, legs):
+    """Retorna [(k_min, k_max, intercepto, inclinação)] do fluxo D+2 em função da escala k >= 0."""
+    constant = -(unwind_q['call_q'] * legs.pos_call_ask) + unwind_q['put_q'] * legs.pos_put_bid
+    options_slope = base_q['call_q'] * legs.new_call_bid - base_q['put_q'] * legs.new_put_ask
+    base_asset, unwind_asset = base_q['asset_q'], unwind_q['asset_q']
+
+    # Vendendo ações (variação líquida <= 0): a perna de ações usa o BID.
+    sell_segment = (constant + unwind_asset * legs.asset_bid, options_slope - base_asset * legs.asset_bid)
+    # Comprando ações (variação líquida > 0): a perna de ações usa o ASK.
+    buy_segment = (constant + unwind_asset * legs.asset_ask, options_slope - base_asset * legs.asset_ask)
+
+    if base_asset <= 0:
+        return [(0.0, math.inf) + (sell_segment if unwind_asset >= 0 else buy_segment)]
+    kink = max(0.0, unwind_asset / base_asset)
+    segments = [(kink, math.inf) + buy_segment]
+    if kink > 0:
+        segments.insert(0, (0.0, kink) + sell_segment)
+    return segments
+
+
+def _continuous_scales(target_d2, segments):
+    """Escalas contínuas candidatas: a raiz exata de cada segmento ou, sem raiz, a borda mais próxima."""
+    scales = []
+    for k_min, k_max, intercept, slope in segments:
+        if abs(slope) > 1e-12:
+            k = (target_d2 - intercept) / slope
+            if k_min <= k <= k_max:
+                scales.append(k)
+                continue
+        edges = [k_min] + ([k_max] if math.isfinite(k_max) else [])
+        scales.append(min(edges, key=lambda e: abs(intercept + slope * e - target_d2)))
+    return scales
+
+
+def _lot_candidates(scale, base_q, lot_size):
+    options = []
+    for leg in ('asset_q', 'call_q', 'put_q'):
+        exact = scale * base_q[leg] / lot_size
+        options.append(sorted({math.floor(exact) * lot_size, math.ceil(exact) * lot_size}))
+    for asset_q, call_q, put_q in product(*options):
+        yield {'asset_q': int(asset_q), 'call_q': int(call_q), 'put_q': int(put_q)}
+
+
+def solve_d2_lots(target_d2, base_q, unwind_q, legs, lot_size=LOT_SIZE):
+    """
+    Resolve as quantidades de montagem (múltiplas de `lot_size`, na proporção de `base_q`) cujo
+    fluxo D+2 mais se aproxima de `target_d2`.
+
+    Retorna uma lista de D2Solution (uma por segmento linear), ordenada pelo |resíduo|;
+    o primeiro elemento é a melhor solução. Lista vazia se `base_q` for todo zero.
+    """
+    if not any(base_q[leg] for leg in ('asset_q', 'call_q', 'put_q')):
+        return []
+
+    solutions = {}
+    total_base = sum(base_q.values())
+    for scale in _continuous_scales(target_d2, _linear_segments(base_q, unwind_q, legs)):
+        best = None
+        for quantities in _lot_candidates(scale, base_q, lot_size):
+            d2 = d2_flow(quantities, unwind_q, legs)
+            # Desempate: menor desvio em relação à proporção da montagem base.
+            total_q = sum(quantities.values())
+            ratio_error = sum(abs(quantities[leg] / total_q - base_q[leg] / total_base) for leg in quantities) if total_q else 0.0
+            key = (abs(d2 - target_d2), ratio_error)
+            if best is None or key < best[0]:
+                best = (key, D2Solution(quantities['asset_q'], quantities['call_q'], quantities['put_q'], d2, d2 - target_d2, scale))
+        solutions[best[1][:3]] = best[1]
+    return sorted(solutions.values(), key=lambda s: abs(s.residual))
+
+
+def main(scenarios_path):
+    """
+    Execução em lote: lê um JSON com uma lista de cenários
+    {"target_d2", "base_q", "unwind_q", "legs": {pos_call_ask, new_call_bid, ...}}
+    e imprime a melhor solução de cada um.
+    """
+    with open(scenarios_path, 'r', encoding='utf-8') as f:
+        scenarios = json.load(f)
+    for i, scenario in enumerate(scenarios):
+        solutions = solve_d2_lots(scenario['target_d2'], scenario['base_q'], scenario['unwind_q'], LegPrices(**scenario['legs']))
+        if not solutions:
+            print(f"Cenário {i}: sem solução (quantidades base zeradas).")
+            continue
+        best = solutions[0]
+        print(f"Cenário {i}: Ações {best.asset_q} | Calls {best.call_q} | Puts {best.put_q} | D+2 {best.d2:,.2f} | Resíduo {best.residual:,.2f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python rollover.py cenarios.json")
+        sys.exit(1)
+    main(sys.argv[1])
@@ -1,9 +1,37 @@
 #--- START OF FILE sync.py ---
 
-import MetaTrader5 as mt5
+from mt5_offline import MT5_LOCK, load_backend as load_mt5_backend
+import base_changes
+from atomic import atomic_write
 import pandas as pd
 from datetime import datetime, timedelta # Adicionado timedelta
 import os # Para construir caminhos de arquivo de forma segura
+import io
+import hashlib
+import re
+import zipfile
+import numpy as np
+
+mt5 = load_mt5_backend()
+
+SI_ARQUIVO_NO_ZIP = "SI_D_SEDE.txt"
+OPCAO_NOME_RE = re.compile(r'^[A-Z0-9]{4}[A-X][0-9]')
+LETRAS_CALL = list('ABCDEFGHIJKL')
+LETRAS_PUT = list('MNOPQRSTUVWX')
+STRIKE_TICK = 0.01
+SI_PREFIXOS_SERIES = (b"02|", b"03|")
+# Posição das colunas nos registros '02' (opções de ações) e '03' (opções de índice).
+SI_LAYOUT_ACOES = {'tipo': 2, 'raiz': 6, 'especificacao': 7, 'ticker': 13, 'estilo': 15, 'strike': 16, 'expiracao': 17}
+SI_LAYOUT_INDICES = {'tipo': 1, 'ticker': 11, 'estilo': 13, 'strike': 14, 'expiracao': 16}
+SI_TIPOS = {'70': 'CALL', '80': 'PUT'}
+# Especificação do ativo-objeto -> sufixo do código de negociação (BDRs: DRN 34, DR1 31, DR2 32, DR3 33).
+# Séries de uma classe fora da tabela ficam fora do base.csv e são contadas por classe no log.
+SUFIXO_POR_ESPECIFICACAO = {'ON': '3', 'PN': '4', 'PNA': '5', 'PNB': '6', 'UNT': '11', 'CI': '11',
+                            'DRN': '34', 'DR1': '31', 'DR2': '32', 'DR3': '33'}
+SI_TAMANHO_BLOCO = 1 << 20
+SI_CACHE_SUFIXO = ".index.npz"
+SI_CACHE_VERSAO = 3
+SI_LINHAS_POR_PROGRESSO = 20000
 
 def conectar_mt5():
     """Conecta ao MetaTrader 5"""
@@ -28,7 +56,11 @@ def obter_todos_simbolos():
     return simbolos
 
 def processar_simbolos(simbolos):
-    """Processa os símbolos e converte para lista de dicionários"""
+    """
+    Processa os símbolos e converte para lista de dicionários com todos os campos do symbol_info.
+
+    Útil para inspeção/exportação completa; o pareamento usa extrair_opcoes_mt5.
+    """
     dados_simbolos = []
     
     for simbolo in simbolos:
@@ -138,182 +170,321 @@ def processar_simbolos(simbolos):
         dados_simbolos.append(dados)
     return dados_simbolos
 
-def extrair_ativo_do_isin(isin):
-    if not isin or len(isin) < 7:
-        return None
-    return isin[2:7]
-
-def identificar_tipo_opcao(ticker):
-    if not ticker or len(ticker) < 5:
-        return None
-    quinta_letra = ticker[4].upper()
-    if quinta_letra in 'ABCDEFGHIJKL':
-        return 'CALL'
-    elif quinta_letra in 'MNOPQRSTUVWX':
-        return 'PUT'
-    else:
-        return None
+def extrair_opcoes_mt5(simbolos):
+    """
+    Extração enxuta para o pareamento: filtra os símbolos de opção pelo padrão do nome
+    (4 caracteres de raiz + letra de série A-X + número) e lê só os campos usados
+    direto dos registros do symbols_get, sem nova chamada ao symbol_info.
 
-def extrair_dados_opcao(ticker, isin, strike_mt5, tempo_expiracao_dt):
-    """Extrai dados da opção: ativo, strike (do MT5 inicialmente), expiração, tipo"""
-    ativo = extrair_ativo_do_isin(isin)
-    tipo = identificar_tipo_opcao(ticker)
-    
-    if not ativo or not tipo:
-        return None
-    
-    expiracao_formatada = None
-    if isinstance(tempo_expiracao_dt, datetime):
-        expiracao_formatada = tempo_expiracao_dt.strftime('%d/%m/%Y')
-    
+    Retorna colunas: nome, isin, strike_opcao, tempo_expiracao (datetime64[s], NaT se ausente).
+    """
+    opcoes = [s for s in simbolos if OPCAO_NOME_RE.match(s.name)]
+    print(f"Símbolos de opção pelo padrão do nome: {len(opcoes)} de {len(simbolos)}")
     return {
-        'ativo': ativo,
-        'tipo': tipo,
-        'strike': strike_mt5, # Este é o strike do MT5, usado para o merge inicial
-        'expiracao': expiracao_formatada,
-        'ticker': ticker
+        'nome': np.array([s.name for s in opcoes], dtype=np.str_),
+        'isin': np.array([s.isin or '' for s in opcoes], dtype=np.str_),
+        'strike_opcao': np.array([s.option_strike for s in opcoes], dtype=np.float64),
+        'tempo_expiracao': np.array([datetime.fromtimestamp(s.expiration_time) if s.expiration_time > 0 else None
+                                     for s in opcoes], dtype='datetime64[s]'),
     }
 
-def agrupar_opcoes_call_put(dados):
-    """Agrupa opções call/put e filtra por data de expiração."""
-    opcoes = []
-    for item in dados:
-        if item.get('isin') and item.get('nome'):
-            dados_opcao = extrair_dados_opcao(
-                item['nome'], 
-                item['isin'], 
-                item.get('strike_opcao', 0), # Strike do MT5
-                item.get('tempo_expiracao')
-            )
-            if dados_opcao:
-                opcoes.append(dados_opcao)
-    
-    df_opcoes = pd.DataFrame(opcoes)
-    if df_opcoes.empty:
-        print("Nenhuma opção encontrada para processamento em DataFrame")
-        return pd.DataFrame()
-    
-    calls = df_opcoes[df_opcoes['tipo'] == 'CALL'].copy()
-    puts = df_opcoes[df_opcoes['tipo'] == 'PUT'].copy()
+def parear_call_put(ativo, eh_call, strike, expiracao):
+    """
+    Motor de pareamento call/put por chaves inteiras (ativo, strike em ticks, dia da expiração)
+    com junção por ordenação. Strikes iguais a menos de ruído de ponto flutuante caem no mesmo tick.
 
-    if calls.empty or puts.empty:
-        print("Não foram encontradas calls ou puts suficientes para formar pares.")
-        if calls.empty: print(f"Total de calls processadas: 0")
-        else: print(f"Total de calls processadas: {len(calls)}")
-        if puts.empty: print(f"Total de puts processadas: 0")
-        else: print(f"Total de puts processadas: {len(puts)}")
+    Recebe colunas alinhadas (sem NaN/NaT) e retorna (índices das calls, índices das puts) de todos
+    os pares, como numa junção interna.
+    """
+    if len(ativo) == 0:
+        vazio = np.empty(0, dtype=np.intp)
+        return vazio, vazio
+    _, codigo_ativo = np.unique(ativo, return_inverse=True)
+    _, codigo_strike = np.unique(np.rint(strike / STRIKE_TICK).astype(np.int64), return_inverse=True)
+    _, codigo_dia = np.unique(expiracao.astype('datetime64[D]'), return_inverse=True)
+    chave = (codigo_ativo.astype(np.int64) * (codigo_strike.max() + 1) + codigo_strike) * (codigo_dia.max() + 1) + codigo_dia
+
+    idx_calls = np.flatnonzero(eh_call)
+    idx_puts = np.flatnonzero(~eh_call)
+    idx_calls = idx_calls[np.argsort(chave[idx_calls], kind='stable')]
+    idx_puts = idx_puts[np.argsort(chave[idx_puts], kind='stable')]
+    chaves_calls, chaves_puts = chave[idx_calls], chave[idx_puts]
+    inicio = np.searchsorted(chaves_puts, chaves_calls, side='left')
+    quantidade = np.searchsorted(chaves_puts, chaves_calls, side='right') - inicio
+    # Várias puts com a mesma chave de uma call geram um par para cada uma.
+    deslocamento = np.arange(quantidade.sum()) - np.repeat(np.cumsum(quantidade) - quantidade, quantidade)
+    return np.repeat(idx_calls, quantidade), idx_puts[np.repeat(inicio, quantidade) + deslocamento]
+
+def formatar_datas(datas):
+    """datetime64 -> 'dd/mm/AAAA', formatando cada data distinta uma única vez."""
+    unicas, inverso = np.unique(datas.astype('datetime64[D]'), return_inverse=True)
+    textos = np.array([d.strftime('%d/%m/%Y') for d in unicas.astype(object)], dtype=np.str_)
+    return textos[inverso]
+
+def filtro_data_expiracao(expiracao):
+    """Máscara das séries que vencem a pelo menos 10 dias de hoje (NaT fica de fora)."""
+    data_limite = datetime.now().date() + timedelta(days=10)
+    print(f"Filtrando opções com expiração anterior a {data_limite.strftime('%d/%m/%Y')}")
+    return expiracao.astype('datetime64[D]') >= np.datetime64(data_limite, 'D')
+
+def agrupar_opcoes_call_put(colunas):
+    """Agrupa opções call/put (colunas de extrair_opcoes_mt5) e filtra por data de expiração."""
+    nomes = pd.Series(colunas['nome'])
+    isins = pd.Series(colunas['isin'])
+    strikes = colunas['strike_opcao']
+    expiracoes = colunas['tempo_expiracao']
+
+    # Ativo-objeto pelo ISIN (posições 2 a 6) e tipo pela quinta letra do ticker.
+    quinta_letra = nomes.str[4].str.upper()
+    eh_call = quinta_letra.isin(LETRAS_CALL).to_numpy()
+    eh_put = quinta_letra.isin(LETRAS_PUT).to_numpy()
+    validas = (isins.str.len() >= 7).to_numpy() & (eh_call | eh_put) & np.isfinite(strikes)
+    if not validas.any():
+        print("Nenhuma opção encontrada para processamento")
         return pd.DataFrame()
-            
-    pares_opcoes = calls.merge(
-        puts, 
-        on=['ativo', 'strike', 'expiracao'], # Merge usa o strike do MT5
-        how='inner',
-        suffixes=('_call', '_put')
-    )
-    
-    if pares_opcoes.empty:
-        print("Nenhum par call/put encontrado após o merge inicial.")
+    if not (eh_call & validas).any() or not (eh_put & validas).any():
+        print("Não foram encontradas calls ou puts suficientes para formar pares.")
+        print(f"Total de calls processadas: {(eh_call & validas).sum()}")
+        print(f"Total de puts processadas: {(eh_put & validas).sum()}")
         return pd.DataFrame()
 
-    # --- INÍCIO DA LÓGICA DE FILTRO DE DATA ---
-    hoje = datetime.now()
-    data_limite = hoje + timedelta(days=10) 
-    print(f"Filtrando opções com expiração anterior a {data_limite.strftime('%d/%m/%Y')}")
-    pares_opcoes['expiracao_dt'] = pd.to_datetime(pares_opcoes['expiracao'], format='%d/%m/%Y', errors='coerce')
-    pares_opcoes_filtrado = pares_opcoes.dropna(subset=['expiracao_dt'])
-    pares_opcoes_filtrado = pares_opcoes_filtrado[pares_opcoes_filtrado['expiracao_dt'].dt.date >= data_limite.date()]
-    
-    print(f"Pares antes do filtro de data: {len(pares_opcoes)}. Pares após filtro de data: {len(pares_opcoes_filtrado)}")
-    
-    if pares_opcoes_filtrado.empty:
-        print(f"Nenhum par call/put encontrado após o filtro de data (expiração >= {data_limite.strftime('%d/%m/%Y')}).")
+    no_prazo = validas & filtro_data_expiracao(expiracoes)
+    print(f"Opções antes do filtro de data: {validas.sum()}. Opções após filtro de data: {no_prazo.sum()}")
+    posicoes = np.flatnonzero(no_prazo)
+    ativos = isins.str[2:7].to_numpy()
+    i_call, i_put = parear_call_put(ativos[posicoes], eh_call[posicoes], strikes[posicoes], expiracoes[posicoes])
+    i_call, i_put = posicoes[i_call], posicoes[i_put]
+    if len(i_call) == 0:
+        print("Nenhum par call/put encontrado após o pareamento e o filtro de data.")
         return pd.DataFrame()
-    # --- FIM DA LÓGICA DE FILTRO DE DATA ---
 
-    resultado = pares_opcoes_filtrado[['ativo', 'ticker_call', 'ticker_put', 'strike', 'expiracao']].copy()
-    resultado.columns = ['ativo_principal', 'ticker_call', 'ticker_put', 'strike_mt5', 'expiracao'] 
-    resultado = resultado.sort_values(['ativo_principal', 'expiracao', 'strike_mt5'])
-    
-    return resultado
+    return pd.DataFrame({
+        'ativo_principal': ativos[i_call],
+        'ticker_call': colunas['nome'][i_call],
+        'ticker_put': colunas['nome'][i_put],
+        'strike_mt5': strikes[i_call],
+        'expiracao': formatar_datas(expiracoes[i_call]),
+    })
+
+def iterar_linhas_series(caminho_arquivo_series, prefixos=SI_PREFIXOS_SERIES, ao_avancar=None):
+    """
+    Itera as linhas de séries (registros '02|' de ações e '03|' de índices) como bytes, em blocos.
+
+    Lê direto do SI_D_SEDE.zip (sem extrair para o disco) ou de um SI_D_SEDE.txt já extraído.
+    A decodificação fica a cargo de quem consome, só nas colunas que interessam.
+    `ao_avancar(bytes_lidos, bytes_total)` é chamado a cada SI_LINHAS_POR_PROGRESSO linhas lidas.
+    """
+    if zipfile.is_zipfile(caminho_arquivo_series):
+        with zipfile.ZipFile(caminho_arquivo_series) as zf:
+            total = zf.getinfo(SI_ARQUIVO_NO_ZIP).file_size
+            with zf.open(SI_ARQUIVO_NO_ZIP) as bruto:
+                yield from _filtrar_linhas(io.BufferedReader(bruto, buffer_size=SI_TAMANHO_BLOCO), prefixos, total, ao_avancar)
+    else:
+        total = os.path.getsize(caminho_arquivo_series)
+        with open(caminho_arquivo_series, 'rb', buffering=SI_TAMANHO_BLOCO) as f:
+            yield from _filtrar_linhas(f, prefixos, total, ao_avancar)
+
+def _filtrar_linhas(linhas, prefixos, total, ao_avancar):
+    if ao_avancar is None:
+        for linha in linhas:
+            if linha.startswith(prefixos):
+                yield linha
+        return
+    lidos = 0
+    for numero, linha in enumerate(linhas, 1):
+        lidos += len(linha)
+        if numero % SI_LINHAS_POR_PROGRESSO == 0:
+            ao_avancar(lidos, total)
+        if linha.startswith(prefixos):
+            yield linha
+    ao_avancar(total, total)
+
+def ativo_objeto_serie(raiz, especificacao):
+    """Código de negociação do ativo-objeto a partir da raiz ('PETR', 'TOTS    /EJ') e da especificação ('PN      N2')."""
+    classe = classe_especificacao(especificacao)
+    sufixo = SUFIXO_POR_ESPECIFICACAO.get(classe)
+    if sufixo is None:
+        return None
+    return raiz[:4] + sufixo
+
+def hash_arquivo(caminho):
+    """SHA-256 do conteúdo do arquivo, lido em blocos."""
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(SI_TAMANHO_BLOCO), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def caminho_cache_series(caminho_arquivo_series):
+    return os.path.splitext(caminho_arquivo_series)[0] + SI_CACHE_SUFIXO
+
+def ler_cache_series(caminho_cache, hash_origem):
+    """Retorna as colunas do índice em cache (dict de arrays) ou None se ausente, antigo ou de outro arquivo."""
+    try:
+        with np.load(caminho_cache, allow_pickle=False) as dados:
+            if int(dados['versao']) != SI_CACHE_VERSAO or str(dados['sha256']) != hash_origem:
+                return None
+            return {nome: dados[nome] for nome in dados.files if nome not in ('versao', 'sha256')}
+    except (OSError, KeyError, ValueError):
+        return None
+
+def gravar_cache_series(caminho_cache, hash_origem, colunas):
+    """Grava o índice em um temporário no mesmo diretório e troca de forma atômica (seguro com execuções concorrentes)."""
+    try:
+        with atomic_write(caminho_cache) as f:
+            np.savez(f, versao=np.int64(SI_CACHE_VERSAO), sha256=np.str_(hash_origem), **colunas)
+    except OSError as e:
+        print(f"⚠️ Não foi possível gravar o cache do índice de séries em {caminho_cache}: {e}")
+
+def classe_especificacao(especificacao):
+    return especificacao.split()[0] if especificacao.strip() else ''
+
+def registrar_classes_ignoradas(indice):
+    """Avisa quantas séries ficaram de fora por classe de especificação sem sufixo conhecido."""
+    classes = indice.get('classes_ignoradas')
+    if classes is None or not len(classes):
+        return
+    detalhes = ', '.join(f"{classe or '(vazia)'}: {quantidade}"
+                         for classe, quantidade in zip(classes.tolist(), indice['series_ignoradas_por_classe'].tolist()))
+    print(f"⚠️ Séries ignoradas por especificação do ativo-objeto sem sufixo conhecido (SUFIXO_POR_ESPECIFICACAO): {detalhes}")
+
+def carregar_indice_series(caminho_arquivo_series, progresso=None):
+    """
+    Índice das séries autorizadas como colunas NumPy (ver interpretar_series).
+
+    O resultado fica em cache binário ao lado do arquivo de origem, indexado pelo SHA-256 do
+    conteúdo: o arquivo só é interpretado de novo quando o download realmente mudou.
+    Retorna None se o arquivo não existir ou não puder ser lido.
+    """
+    try:
+        hash_origem = hash_arquivo(caminho_arquivo_series)
+    except FileNotFoundError:
+        print(f"❌ ERRO: Arquivo de séries não encontrado em {caminho_arquivo_series}")
+        return None
+    caminho_cache = caminho_cache_series(caminho_arquivo_series)
+    indice = ler_cache_series(caminho_cache, hash_origem)
+    if indice is not None:
+        print(f"✅ Índice de séries carregado do cache ({caminho_cache}): {len(indice['ticker'])} séries.")
+        registrar_classes_ignoradas(indice)
+        return indice
+
+    indice = interpretar_series(caminho_arquivo_series, progresso)
+    if indice is not None and len(indice['ticker']):
+        gravar_cache_series(caminho_cache, hash_origem, indice)
+    return indice
 
 def carregar_strikes_externos(caminho_arquivo_strikes):
-    strikes_map = {}
-    linhas_relevantes = []
+    """Mapa ticker -> strike das séries autorizadas."""
+    indice = carregar_indice_series(caminho_arquivo_strikes)
+    if indice is None:
+        return {}
+    return dict(zip(indice['ticker'].tolist(), indice['strike'].tolist()))
+
+def interpretar_series(caminho_arquivo_series, progresso=None):
+    """
+    Interpreta os registros de séries do SI_D_SEDE e devolve as colunas:
+    ticker, ativo (código do ativo-objeto), tipo ('CALL'/'PUT'), strike, expiracao (datetime64[D]),
+    estilo ('A' americano / 'E' europeu). Séries cujo ativo-objeto não é reconhecido ficam de fora;
+    as de classe de especificação desconhecida são contadas por classe (classes_ignoradas,
+    series_ignoradas_por_classe) e aparecem no log.
+    `progresso(percentual, mensagem)` recebe o andamento da leitura (bytes descompactados).
+    """
+    tickers, ativos, tipos, strikes, expiracoes, estilos = [], [], [], [], [], []
+    classes_ignoradas = {}
     try:
-        print(f"Iniciando leitura do arquivo de strikes: {caminho_arquivo_strikes}")
-        encodings_to_try = ['latin1', 'utf-8']
-        file_content_read = False
-        for encoding in encodings_to_try:
+        print(f"Iniciando leitura do arquivo de séries: {caminho_arquivo_series}")
+        total_linhas = 0
+        linhas_ignoradas = 0
+        ao_avancar = None
+        if progresso:
+            ao_avancar = lambda lidos, total: progresso(100.0 * lidos / total if total else 100.0,
+                                                        f"{lidos / 1e6:.1f}/{total / 1e6:.1f} MB lidos")
+        for linha in iterar_linhas_series(caminho_arquivo_series, ao_avancar=ao_avancar):
+            total_linhas += 1
+            campos = linha.decode('latin1').rstrip('\r\n').split('|')
+            layout = SI_LAYOUT_ACOES if campos[0] == '02' else SI_LAYOUT_INDICES
+            if len(campos) <= layout['expiracao']:
+                linhas_ignoradas += 1
+                continue
+            ticker = campos[layout['ticker']].strip()
+            tipo = SI_TIPOS.get(campos[layout['tipo']].strip())
+            if campos[0] == '02':
+                ativo = ativo_objeto_serie(campos[layout['raiz']], campos[layout['especificacao']])
+                if ativo is None:
+                    classe = classe_especificacao(campos[layout['especificacao']])
+                    classes_ignoradas[classe] = classes_ignoradas.get(classe, 0) + 1
+            else:
+                ativo = ticker[:4]
             try:
-                with open(caminho_arquivo_strikes, 'r', encoding=encoding) as f:
-                    for linha_num, linha_raw in enumerate(f):
-                        if linha_raw.startswith("02|"):
-                            campos = linha_raw.strip().split('|')
-                            linhas_relevantes.append(campos)
-                file_content_read = True
-                print(f"Arquivo lido com encoding: {encoding}. Total de linhas começando com '02': {len(linhas_relevantes)}")
-                break 
-            except UnicodeDecodeError:
-                print(f"Falha ao ler com encoding {encoding}, tentando próximo...")
-                linhas_relevantes = [] 
-            except FileNotFoundError:
-                print(f"❌ ERRO: Arquivo de strikes não encontrado em {caminho_arquivo_strikes}")
-                return strikes_map
-            except Exception as e_open:
-                print(f"❌ ERRO ao abrir ou ler arquivo com {encoding}: {e_open}")
-                linhas_relevantes = [] 
-        if not file_content_read:
-            print("❌ ERRO: Não foi possível ler o arquivo de strikes com os encodings testados.")
-            return strikes_map
-        if not linhas_relevantes:
-            print("⚠️ Nenhuma linha começando com '02' encontrada no arquivo de strikes.")
-            return strikes_map
-        df_full = pd.DataFrame(linhas_relevantes)
-        if df_full.empty:
-            print("⚠️ DataFrame vazio após filtrar linhas '02'.")
-            return strikes_map
-        idx_ticker = 13
-        idx_strike = 16
-        if max(idx_ticker, idx_strike) >= len(df_full.columns):
-            print(f"❌ ERRO: As linhas '02' não possuem colunas suficientes. "
-                  f"Necessário até índice {max(idx_ticker, idx_strike)}, mas as linhas '02' têm {len(df_full.columns)} colunas (índices 0 a {len(df_full.columns)-1}).")
-            print(f"Número de colunas detectado para linhas '02': {len(df_full.columns)}")
-            if not df_full.empty: print(f"Primeiras 5 linhas '02' processadas (para depuração):\n{df_full.head().to_string()}")
-            if idx_ticker >= len(df_full.columns): print(f"Coluna Ticker (índice {idx_ticker}) estaria fora dos limites.")
-            if idx_strike >= len(df_full.columns): print(f"Coluna Strike (índice {idx_strike}) estaria fora dos limites.")
-            return strikes_map
-        df_strikes = pd.DataFrame({
-            'ticker': df_full.iloc[:, idx_ticker].astype(str),
-            'strike_externo_str': df_full.iloc[:, idx_strike].astype(str)
-        })
-        df_strikes['ticker'] = df_strikes['ticker'].str.strip()
-        df_strikes['strike_externo_float'] = pd.to_numeric(
-            df_strikes['strike_externo_str'].str.replace(',', '.', regex=False),
-            errors='coerce'
-        )
-        df_strikes.dropna(subset=['ticker', 'strike_externo_float'], inplace=True)
-        df_strikes = df_strikes[df_strikes['ticker'].str.strip() != '']
-        if df_strikes.empty:
-            print("⚠️ Nenhum strike válido encontrado nas linhas '02' após processamento e filtragem.")
-            if not df_full.empty and idx_ticker < len(df_full.columns) and idx_strike < len(df_full.columns):
-                temp_debug_df = pd.DataFrame({
-                    f'ticker_bruto_col{idx_ticker}': df_full.iloc[:10, idx_ticker], 
-                    f'strike_bruto_col{idx_strike}': df_full.iloc[:10, idx_strike]
-                })
-                print("Dados brutos (primeiras 10 linhas '02') das colunas de ticker e strike:")
-                print(temp_debug_df.to_string())
-            return strikes_map
-        strikes_map = df_strikes.set_index('ticker')['strike_externo_float'].to_dict()
-        print(f"✅ Strikes externos carregados: {len(strikes_map)} tickers mapeados a partir das linhas '02'.")
-        if len(strikes_map) > 0:
-            first_key = next(iter(strikes_map), None)
-            if first_key:
-                print(f"Exemplo de strike carregado: ('{first_key}', {strikes_map[first_key]})")
+                strike = float(campos[layout['strike']].replace(',', '.'))
+                expiracao = datetime.strptime(campos[layout['expiracao']].strip(), '%Y%m%d')
+            except ValueError:
+                linhas_ignoradas += 1
+                continue
+            if not ticker or not ativo or not tipo:
+                linhas_ignoradas += 1
+                continue
+            tickers.append(ticker)
+            ativos.append(ativo)
+            tipos.append(tipo)
+            strikes.append(strike)
+            expiracoes.append(expiracao)
+            estilos.append(campos[layout['estilo']].strip()[:1].upper())
+        print(f"Arquivo lido. Registros de séries: {total_linhas}; ignorados: {linhas_ignoradas}.")
+    except FileNotFoundError:
+        print(f"❌ ERRO: Arquivo de séries não encontrado em {caminho_arquivo_series}")
+        return None
+    except (zipfile.BadZipFile, KeyError) as e:
+        print(f"❌ ERRO: Arquivo de séries inválido ({caminho_arquivo_series}): {e}")
+        return None
     except Exception as e:
-        print(f"❌ ERRO inesperado ao carregar ou processar o arquivo de strikes: {e}")
+        print(f"❌ ERRO inesperado ao carregar ou processar o arquivo de séries: {e}")
         import traceback
         traceback.print_exc()
-    return strikes_map
+        return None
+
+    indice = {
+        'ticker': np.array(tickers, dtype=np.str_),
+        'ativo': np.array(ativos, dtype=np.str_),
+        'tipo': np.array(tipos, dtype=np.str_),
+        'strike': np.array(strikes, dtype=np.float64),
+        'expiracao': np.array(expiracoes, dtype='datetime64[D]'),
+        'estilo': np.array(estilos, dtype=np.str_),
+        'classes_ignoradas': np.array(sorted(classes_ignoradas), dtype=np.str_),
+        'series_ignoradas_por_classe': np.array([classes_ignoradas[c] for c in sorted(classes_ignoradas)], dtype=np.int64),
+    }
+    registrar_classes_ignoradas(indice)
+    if len(tickers):
+        print(f"✅ Índice de séries montado: {len(tickers)} séries de {len(set(ativos))} ativos-objeto.")
+    else:
+        print("⚠️ Nenhuma série válida encontrada no arquivo.")
+    return indice
+
+def montar_pares_series(indice):
+    """
+    Pareia calls e puts do índice de séries (mesmo ativo, strike e expiração) com parear_call_put
+    e aplica o filtro de data. Retorna o DataFrame no formato do base.csv (strike numérico).
+    """
+    eh_call = indice['tipo'] == 'CALL'
+    if eh_call.all() or not eh_call.any():
+        print(f"Não foram encontradas calls ou puts suficientes para formar pares (calls: {eh_call.sum()}, puts: {(~eh_call).sum()}).")
+        return pd.DataFrame()
+
+    no_prazo = filtro_data_expiracao(indice['expiracao'])
+    print(f"Séries antes do filtro de data: {len(no_prazo)}. Séries após filtro de data: {no_prazo.sum()}")
+    posicoes = np.flatnonzero(no_prazo)
+    i_call, i_put = parear_call_put(indice['ativo'][posicoes], eh_call[posicoes],
+                                    indice['strike'][posicoes], indice['expiracao'][posicoes])
+    i_call, i_put = posicoes[i_call], posicoes[i_put]
+    print(f"Pares call/put formados: {len(i_call)}")
+
+    return pd.DataFrame({
+        'ativo_principal': indice['ativo'][i_call],
+        'ticker_call': indice['ticker'][i_call],
+        'ticker_put': indice['ticker'][i_put],
+        'strike': indice['strike'][i_call],
+        'expiracao': formatar_datas(indice['expiracao'][i_call]),
+    })
 
 def salvar_csv_opcoes(dados_mt5, nome_arquivo_saida, strikes_externos_map):
     try:
@@ -345,6 +516,16 @@ def salvar_csv_opcoes(dados_mt5, nome_arquivo_saida, strikes_externos_map):
             print("❌ Nenhum par call/put com strike válido após processamento (ou mapa de strikes vazio e strike_mt5 ausente).")
             return False
 
+        return gravar_base_csv(df_opcoes_final, nome_arquivo_saida)
+    except Exception as e:
+        print(f"Erro ao processar e salvar opções: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+def gravar_base_csv(df_opcoes_final, nome_arquivo_saida):
+    """Aplica o filtro de tickers terminados em 'E', formata o strike e grava o base.csv."""
+    try:
         # --- INÍCIO DA NOVA REGRA DE FILTRO ---
         print(f"Pares antes do filtro de tickers terminados em 'E': {len(df_opcoes_final)}")
         if 'ticker_call' in df_opcoes_final.columns and 'ticker_put' in df_opcoes_final.columns:
@@ -373,14 +554,15 @@ def salvar_csv_opcoes(dados_mt5, nome_arquivo_saida, strikes_externos_map):
         df_opcoes_final['strike'] = df_opcoes_final['strike'].apply(
             lambda x: f"{x:.2f}".replace('.', ',') if pd.notnull(x) and isinstance(x, (int, float)) else x
         )
-        df_opcoes_final.to_csv(
-            nome_arquivo_saida,
-            sep=';',
-            decimal=',',
-            index=False,
-            encoding='utf-8-sig'
-        )
-        print(f"✅ Arquivo de opções salvo em: {nome_arquivo_saida}")
+        alteracoes = base_changes.write_base_if_changed(df_opcoes_final, nome_arquivo_saida)
+        if alteracoes is None:
+            print(f"✅ {nome_arquivo_saida} já está atualizado; nenhuma alteração gravada.")
+        elif alteracoes['versao_anterior'] is None:
+            print(f"✅ Arquivo de opções salvo em: {nome_arquivo_saida} (sem versão anterior para comparar)")
+        else:
+            print(f"✅ Arquivo de opções salvo em: {nome_arquivo_saida}")
+            print(f"📝 Alterações: {len(alteracoes['adicionados'])} adicionados, {len(alteracoes['removidos'])} removidos, "
+                  f"{len(alteracoes['strikes_ajustados'])} strikes ajustados (changelog em {base_changes.changes_path_for(nome_arquivo_saida)}).")
         print(f"📊 Total de pares call/put salvos: {len(df_opcoes_final)}")
         if not df_opcoes_final.empty:
             print(f"\n📈 Estatísticas das Opções Salvas:")
@@ -399,27 +581,67 @@ def salvar_csv_opcoes(dados_mt5, nome_arquivo_saida, strikes_externos_map):
         traceback.print_exc()
         return False
 
-def main():
-    print("=== Exportador de Símbolos MetaTrader 5 ===")
+def sincronizar_via_mt5(nome_arquivo_saida, strikes_externos):
+    """
+    Caminho antigo: pareia pelos metadados do MT5 e ajusta os strikes com o SI.
+    Se o MT5 já estiver conectado neste processo (ex.: sync chamado de dentro do app), a conexão é reaproveitada e mantida.
+    As chamadas ao MT5 (inclusive conectar e desligar) ficam sob MT5_LOCK, para não cruzar com a
+    thread de mercado do app; o pareamento e a gravação rodam depois, já sem o lock.
+    """
+    with MT5_LOCK:
+        conexao_propria = mt5.terminal_info() is None
+        if conexao_propria:
+            print("\nConectando ao MetaTrader 5...")
+            if not conectar_mt5():
+                return False
+        try:
+            print("\nObtendo lista de símbolos do MT5...")
+            simbolos_mt5 = obter_todos_simbolos()
+            if simbolos_mt5 is None:
+                return False
+            print("Extraindo as opções da lista de símbolos do MT5...")
+            dados_processados_mt5 = extrair_opcoes_mt5(simbolos_mt5)
+        finally:
+            if conexao_propria:
+                print("Desligando MT5 (se inicializado)...")
+                mt5.shutdown()
+                print("Conexão com MT5 encerrada.")
+    print("\nProcessando e salvando opções call/put com strikes ajustados e filtro de data...")
+    return salvar_csv_opcoes(dados_processados_mt5, nome_arquivo_saida, strikes_externos)
+
+def caminho_series_padrao():
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    caminho_arquivo_strikes = os.path.join(script_dir, "SI_D_SEDE", "SI_D_SEDE.txt")
-    print(f"Tentando carregar strikes do arquivo: {caminho_arquivo_strikes}")
-    strikes_externos = carregar_strikes_externos(caminho_arquivo_strikes)
-    if not strikes_externos:
-        print("⚠️  Não foi possível carregar os strikes externos. O script prosseguirá usando os strikes do MT5 se disponíveis, mas o ajuste com dados externos não ocorrerá.")
-    print("\nConectando ao MetaTrader 5...")
-    if not conectar_mt5():
-        return
+    caminho_arquivo_series = os.path.join(script_dir, "SI_D_SEDE.zip")
+    if not os.path.exists(caminho_arquivo_series):
+        caminho_arquivo_series = os.path.join(script_dir, "SI_D_SEDE", SI_ARQUIVO_NO_ZIP)
+    return caminho_arquivo_series
+
+def gerar_base(caminho_arquivo_series=None, nome_arquivo_saida_opcoes="base.csv", progresso=None):
+    """
+    Gera o base.csv a partir das séries da B3 (ou do MT5, se o índice não estiver disponível). Retorna True em caso de sucesso.
+    `progresso(percentual, mensagem)` recebe o andamento: leitura do índice até 70%, pareamento até 80%, gravação até 95%.
+    """
+    progresso = progresso or (lambda percentual, mensagem: None)
+    caminho_arquivo_series = caminho_arquivo_series or caminho_series_padrao()
+    print(f"Carregando séries autorizadas de: {caminho_arquivo_series}")
+    indice = carregar_indice_series(caminho_arquivo_series,
+                                    lambda percentual, mensagem: progresso(0.7 * percentual, f"Lendo séries: {mensagem}"))
+    if indice is not None and len(indice['ticker']):
+        print("\nPareando calls e puts a partir das séries da B3...")
+        progresso(70, f"Pareando {len(indice['ticker'])} séries...")
+        pares = montar_pares_series(indice)
+        progresso(80, f"Gravando {len(pares)} pares...")
+        sucesso = not pares.empty and gravar_base_csv(pares, nome_arquivo_saida_opcoes)
+        progresso(95, "base.csv gravado" if sucesso else "Nenhum par gravado")
+        return sucesso
+    print("⚠️  Índice de séries indisponível. Usando os metadados do MT5 para montar os pares.")
+    progresso(70, "Consultando os símbolos do MT5...")
+    return sincronizar_via_mt5(nome_arquivo_saida_opcoes, {})
+
+def main(progresso=None):
+    print("=== Gerador do base.csv (séries autorizadas B3) ===")
     try:
-        print("\nObtendo lista de símbolos do MT5...")
-        simbolos_mt5 = obter_todos_simbolos()
-        if simbolos_mt5 is None:
-            return
-        print("Processando informações dos símbolos do MT5...")
-        dados_processados_mt5 = processar_simbolos(simbolos_mt5)
-        nome_arquivo_saida_opcoes = "base.csv"
-        print("\nProcessando e salvando opções call/put com strikes ajustados e filtro de data...")
-        sucesso = salvar_csv_opcoes(dados_processados_mt5, nome_arquivo_saida_opcoes, strikes_externos)
+        sucesso = gerar_base(progresso=progresso)
         if sucesso:
             print("\n✅ Processo concluído com sucesso!")
         else:
@@ -428,12 +650,10 @@ def main():
         print(f"Erro durante a execução principal: {e}")
         import traceback
         traceback.print_exc()
-    finally:
-        print("Desligando MT5 (se inicializado)...")
-        mt5.shutdown()
-        print("Conexão com MT5 encerrada.")
 
 if __name__ == "__main__":
-    main()
+    import sys
+    from pipeline import json_progress
+    main(json_progress('sync') if '--progress-json' in sys.argv[1:] else None)
 
 #--- END OF FILE sync.py ---
\ No newline at end of file
@@ -0,0 +1,148 @@
+# ticks.py
+"""
+Gravação e leitura do histórico de ticks (timestamp, símbolo, bid, ask, last).
+
+Cada dia vira um par de arquivos em TICKS_DIR:
+  AAAA-MM-DD.ticks    registros binários de tamanho fixo (TICK_DTYPE), só com append
+  AAAA-MM-DD.symbols  tabela de símbolos, um por linha (o id do símbolo é o número da linha)
+
+O gravador mantém um buffer limitado em memória e faz flush por tamanho, por tempo
+e na virada do dia. O flush por tempo não depende de chegar tick novo: quem grava chama
+`flush_if_due()` no próprio laço (a thread de mercado do app faz isso a cada leitura).
+O leitor mapeia o arquivo do dia em memória (np.memmap) e devolve arrays NumPy por símbolo.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+TICKS_DIR = 'ticks'
+TICK_DTYPE = np.dtype([('time_msc', '<i8'), ('symbol_id', '<u2'), ('bid', '<f8'), ('ask', '<f8'), ('last', '<f8')])
+MAX_BUFFERED_TICKS = 5000
+FLUSH_INTERVAL_S = 5.0
+
+
+def _day_paths(directory, day):
+    base = os.path.join(directory, day)
+    return base + '.ticks', base + '.symbols'
+
+
+def _read_symbols(symbols_path):
+    if not os.path.exists(symbols_path):
+        return []
+    with open(symbols_path, 'r', encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f]
+
+
+class TickRecorder:
+    """Grava ticks em arquivos diários compactos, com buffer limitado e deduplicação por time_msc."""
+    def __init__(self, directory=TICKS_DIR, max_buffered=MAX_BUFFERED_TICKS, flush_interval_s=FLUSH_INTERVAL_S):
+        self.directory = directory
+        self.max_buffered = max_buffered
+        self.flush_interval_s = flush_interval_s
+        self.enabled = False
+        self._buffer = []
+        self._day = None
+        self._symbol_ids = {}
+        self._new_symbols = []
+        self._last_time_msc = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, symbol, tick):
+        """Registra um tick do MT5 (objeto com time_msc, bid, ask, last). Ticks repetidos são ignorados."""
+        if not self.enabled or not tick:
+            return
+        with self._lock:
+            if self._last_time_msc.get(symbol) == tick.time_msc:
+                return
+            self._last_time_msc[symbol] = tick.time_msc
+            day = datetime.fromtimestamp(tick.time_msc / 1000).strftime('%Y-%m-%d')
+            if day != self._day:
+                self._flush_locked()
+                self._open_day(day)
+            symbol_id = self._symbol_ids.get(symbol)
+            if symbol_id is None:
+                symbol_id = len(self._symbol_ids)
+                self._symbol_ids[symbol] = symbol_id
+                self._new_symbols.append(symbol)
+            self._buffer.append((tick.time_msc, symbol_id, tick.bid, tick.ask, tick.last))
+            if len(self._buffer) >= self.max_buffered or time.monotonic() - self._last_flush >= self.flush_interval_s:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def flush_if_due(self):
+        """
+        Grava o buffer se `flush_interval_s` já passou desde o último flush, mesmo sem
+        ticks novos (é chamado no laço de quem grava).
+        """
+        with self._lock:
+            if time.monotonic() - self._last_flush >= self.flush_interval_s:
+                self._flush_locked()
+
+    def close(self):
+        self.flush()
+
+    def _open_day(self, day):
+        self._day = day
+        _, symbols_path = _day_paths(self.directory, day)
+        self._symbol_ids = {symbol: i for i, symbol in enumerate(_read_symbols(symbols_path))}
+        self._new_symbols = []
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if self._day is None or (not self._buffer and not self._new_symbols):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        ticks_path, symbols_path = _day_paths(self.directory, self._day)
+        # A tabela de símbolos é gravada antes dos registros que a referenciam.
+        if self._new_symbols:
+            with open(symbols_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(f"{symbol}\n" for symbol in self._new_symbols))
+            self._new_symbols = []
+        if self._buffer:
+            with open(ticks_path, 'ab') as f:
+                f.write(np.array(self._buffer, dtype=TICK_DTYPE).tobytes())
+            self._buffer = []
+
+
+def load_day(day, directory=TICKS_DIR):
+    """
+    Lê os ticks de um dia ('AAAA-MM-DD' ou date/datetime).
+
+    Retorna {símbolo: {'time': datetime64[ms], 'bid', 'ask', 'last'}}, com os arrays em ordem de gravação.
+    """
+    if not isinstance(day, str):
+        day = day.strftime('%Y-%m-%d')
+    ticks_path, symbols_path = _day_paths(directory, day)
+    if not os.path.exists(ticks_path):
+        return {}
+    # Um registro incompleto no fim (gravação interrompida) é ignorado.
+    n_records = os.path.getsize(ticks_path) // TICK_DTYPE.itemsize
+    if n_records == 0:
+        return {}
+    records = np.memmap(ticks_path, dtype=TICK_DTYPE, mode='r', shape=(n_records,))
+    symbols = _read_symbols(symbols_path)
+    result = {}
+    for symbol_id in np.unique(records['symbol_id']):
+        if symbol_id >= len(symbols):
+            continue
+        rows = records[records['symbol_id'] == symbol_id]
+        result[symbols[symbol_id]] = {
+            'time': rows['time_msc'].astype('datetime64[ms]'),
+            'bid': np.array(rows['bid']),
+            'ask': np.array(rows['ask']),
+            'last': np.array(rows['last']),
+        }
+    return result
+
+
+def list_days(directory=TICKS_DIR):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len('.ticks')] for name in os.listdir(directory) if name.endswith('.ticks'))
@@ -0,0 +1,102 @@
+# watcher.py
+"""
+Vigia das pastas de notas de corretagem (notasm/notasr): detecta PDFs novos, alterados ou
+removidos por varredura periódica (os.scandir), sem APIs de notificação do sistema operacional.
+
+Um PDF só é entregue depois de ficar estável, com o mesmo tamanho e mtime em STABLE_POLLS
+varreduras seguidas, para não pegar um arquivo que ainda está sendo copiado ou baixado. Os PDFs
+que já existem quando o vigia começa são tomados como conhecidos; a carga inicial é do botão Sy.
+
+`on_change({pasta: [caminhos alterados]})` é chamado na thread do vigia; quem consome decide
+o que reprocessar (o app roda pipeline.notes_update_stages só para as configurações afetadas).
+"""
+import os
+import threading
+
+WATCH_POLL_S = 1.0
+STABLE_POLLS = 2
+
+
+def scan(directories):
+    """{caminho: (tamanho, mtime_ns)} dos PDFs em `directories` (pastas inexistentes são ignoradas)."""
+    found = {}
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if not entry.name.lower().endswith('.pdf'):
+                continue
+            try:
+                if entry.is_file():
+                    st = entry.stat()
+                    found[entry.path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+    return found
+
+
+def _readable(path):
+    """O arquivo pode ser aberto para leitura (no Windows, um arquivo ainda sendo copiado fica travado)."""
+    try:
+        with open(path, 'rb'):
+            return True
+    except OSError:
+        return False
+
+
+class PdfFolderWatcher(threading.Thread):
+    """
+    Thread que varre `directories` a cada `poll_interval_s` e agrupa as mudanças estáveis numa
+    única chamada de `on_change` por varredura. `stop()` encerra na próxima espera.
+    """
+    def __init__(self, directories, on_change, poll_interval_s=WATCH_POLL_S, stable_polls=STABLE_POLLS):
+        super().__init__(name='PdfFolderWatcher', daemon=True)
+        self.directories = list(directories)
+        self.on_change = on_change
+        self.poll_interval_s = poll_interval_s
+        self.stable_polls = stable_polls
+        self._stop_requested = threading.Event()
+        self._known = {}
+        self._pending = {}  # caminho -> (assinatura, varreduras seguidas com ela)
+
+    def stop(self):
+        self._stop_requested.set()
+
+    def poll(self):
+        """Uma varredura: devolve {pasta: [caminhos]} com o que mudou e já está estável."""
+        current = scan(self.directories)
+        changed = [path for path in self._known if path not in current]
+        for path in changed:
+            del self._known[path]
+        for path in [p for p in self._pending if p not in current]:
+            del self._pending[path]
+
+        for path, signature in current.items():
+            if self._known.get(path) == signature:
+                self._pending.pop(path, None)
+                continue
+            previous, count = self._pending.get(path, (None, 0))
+            count = count + 1 if previous == signature else 1
+            if count >= self.stable_polls and signature[0] > 0 and _readable(path):
+                self._known[path] = signature
+                self._pending.pop(path, None)
+                changed.append(path)
+            else:
+                self._pending[path] = (signature, count)
+
+        by_directory = {}
+        for path in sorted(changed):
+            by_directory.setdefault(os.path.dirname(path), []).append(path)
+        return by_directory
+
+    def run(self):
+        self._known = scan(self.directories)
+        while not self._stop_requested.wait(self.poll_interval_s):
+            try:
+                changes = self.poll()
+                if changes:
+                    self.on_change(changes)
+            except Exception as e:
+                print(f"Vigia de notas: erro na varredura ({e}).")